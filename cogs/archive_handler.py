@@ -3,8 +3,8 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-# -----------------------STATIC VARS----------------------
-ARCHIVE_ROLE = "Archive"
+import db_handler as db
+from role_cache import roles
 
 # --------------------PERSISTENT VIEWS--------------------
 
@@ -22,7 +22,9 @@ class PersistentArchiveRoleView(discord.ui.View):
                        custom_id='archive_access_button')
     async def archive(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
         # Get the Archive role from the Server.
-        role = discord.utils.get(interaction.guild.roles, name=ARCHIVE_ROLE)
+        role = roles.get(
+            interaction.guild, db.guild_config.get(interaction.guild.id, "archive_role")
+        )
         if role in interaction.user.roles:
             # If the user has the role, remove it and send a confirm message.
             await interaction.user.remove_roles(role)
@@ -47,10 +49,9 @@ class ArchiveHandler(commands.Cog):
     @app_commands.command(description="Sends the Archive joining message")
     async def join_archive(self, interaction: discord.Interaction) -> None:
         # If we don't have an archive role in this server already, create one.
-        if discord.utils.get(
-                interaction.guild.roles,
-                name=ARCHIVE_ROLE) is None:
-            await interaction.guild.create_role(reason="Creating role for the archives", name="Archive")
+        archive_role = db.guild_config.get(interaction.guild.id, "archive_role")
+        if roles.get(interaction.guild, archive_role) is None:
+            await interaction.guild.create_role(reason="Creating role for the archives", name=archive_role)
 
         # Create and send the Embed.
         embed = discord.Embed(
@@ -0,0 +1,136 @@
+# -*- coding: UTF-8 -*-
+import re
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+import db_handler as db
+from embed_builder import DESCRIPTION_LIMIT, EmbedBuilder, send_embeds
+from helpers import GUILD_CONFIG_DEFAULTS
+
+# -----------------------STATIC VARS----------------------
+# Discord doesn't allow longer role names.
+ROLE_NAME_LIMIT = 100
+
+CONFIG_KEYS = [app_commands.Choice(name=key, value=key) for key in GUILD_CONFIG_DEFAULTS]
+
+
+# -----------------------MAIN CLASS-----------------------
+class ConfigHandler(commands.Cog):
+    # Lets every guild change its own settings. They're saved to the db and
+    # to db.guild_config at the same time, which is where the other cogs
+    # read them from, so changes apply straight away.
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.command(description="Changes a setting of the bot for this server")
+    @app_commands.describe(key="The setting to change", value="The new value of the setting")
+    @app_commands.choices(key=CONFIG_KEYS)
+    async def config_set(self, interaction: discord.Interaction, key: str, value: str) -> None:
+        """Discord command (/config_set) that changes a setting of the guild.
+
+        Args:
+            interaction (discord.Interaction): Object with info about the command interaction.
+            key (str): The setting to change.
+            value (str): The new value, checked and cleaned up by _parse_value.
+        """
+        try:
+            parsed = _parse_value(interaction.guild, key, value)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+
+        if not await db.set_guild_config(interaction.guild_id, key, parsed):
+            await interaction.response.send_message(
+                "Something went wrong saving the setting", ephemeral=True
+            )
+            return
+        await interaction.response.send_message(
+            f"Changed {key}" if parsed is not None else f"Reset {key} to the default",
+            ephemeral=True,
+        )
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.command(description="Resets a setting of the bot for this server")
+    @app_commands.describe(key="The setting to reset")
+    @app_commands.choices(key=CONFIG_KEYS)
+    async def config_reset(self, interaction: discord.Interaction, key: str) -> None:
+        """Discord command (/config_reset) that resets a setting of the guild to the default.
+
+        Args:
+            interaction (discord.Interaction): Object with info about the command interaction.
+            key (str): The setting to reset.
+        """
+        if not await db.set_guild_config(interaction.guild_id, key, None):
+            await interaction.response.send_message(
+                "Something went wrong saving the setting", ephemeral=True
+            )
+            return
+        await interaction.response.send_message(f"Reset {key} to the default", ephemeral=True)
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.command(description="Shows the settings of the bot for this server")
+    async def config_show(self, interaction: discord.Interaction) -> None:
+        """Discord command (/config_show) that lists every setting of the guild.
+
+        Args:
+            interaction (discord.Interaction): Object with info about the command interaction.
+        """
+        embed = EmbedBuilder(title="Settings", color=0x00FF00)
+        for key, default in GUILD_CONFIG_DEFAULTS.items():
+            value = db.guild_config.get(interaction.guild_id, key)
+            if value is None:
+                shown = "not set"
+            elif key == "receipts_channel":
+                shown = f"<#{value}>"
+            else:
+                shown = f"`{value}`"
+            embed.add_line(f"**{key}**: {shown}" + (" (default)" if value == default else ""))
+        await send_embeds(interaction, embed, ephemeral=True)
+
+
+# ---------------------OTHER FUNCTIONS--------------------
+def _parse_value(guild: discord.Guild, key: str, value: str) -> str | None:
+    """Checks and cleans up a new value for a setting.
+
+    Args:
+        guild (discord.Guild): The guild the setting is for.
+        key (str): The setting.
+        value (str): The value as it was typed.
+
+    Raises:
+        ValueError: If the value doesn't work for the setting, with a message for the user.
+
+    Returns:
+        str | None: The value to save, None to reset the setting.
+    """
+    value = value.strip()
+    if key.endswith("_role"):
+        if not value or len(value) > ROLE_NAME_LIMIT:
+            raise ValueError(f"Role names need to be 1 to {ROLE_NAME_LIMIT} characters long")
+        return value
+    if key == "receipts_channel":
+        # Takes both a #channel mention and a plain channel id.
+        match = re.fullmatch(r"<#(\d+)>|(\d+)", value)
+        if match is None or guild.get_channel_or_thread(int(match[1] or match[2])) is None:
+            raise ValueError("That's not a channel in this server")
+        return match[1] or match[2]
+    if key == "sticky_template":
+        value = value.replace("\\n", "\n")
+        if not value or len(value) > DESCRIPTION_LIMIT:
+            raise ValueError(f"Templates need to be 1 to {DESCRIPTION_LIMIT} characters long")
+        return value
+    raise ValueError(f"Unknown setting {key}")
+
+
+# ----------------------MAIN PROGRAM----------------------
+# This setup is required for the cog to setup and run,
+# and is run when the cog is loaded with bot.load_extensions().
+async def setup(bot: commands.Bot) -> None:
+    print("\tcogs.config_handler begin loading")
+    await bot.add_cog(ConfigHandler(bot))
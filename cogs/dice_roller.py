@@ -1,143 +1,401 @@
 # -*- coding: UTF-8 -*-
-import re
-from random import randint
+import asyncio
+import time
+
+# traceback is for error logging
+import traceback
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-# ---------------------HOLDER CLASSES---------------------
+import db_handler as db
+import dice
+from embed_builder import EmbedBuilder, send_embeds
+
+# -----------------------STATIC VARS----------------------
+# The luck of every logged roll is worked out in the background, so unusual
+# expressions get a much smaller odds budget than /odds and just go without.
+LUCK_ODDS_WORK = dice.MAX_ODDS_WORK // 20
+
+
+# ---------------------HELPER CLASSES---------------------
+class RollLogger:
+    # Collects rolls in memory and appends them to the roll log in batches
+    # from a background task, so rolling never waits on the database.
+    # Batches are written every interval seconds, or as soon as batch_size
+    # rolls are waiting.
+    def __init__(self, interval: float = 5.0, batch_size: int = 500) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending: list[tuple] = []
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    def log(
+        self,
+        guild_id: int | None,
+        user_id: int,
+        expression: str,
+        advantage: str | None,
+        result: dice.RollResult,
+    ) -> None:
+        """Queues a roll to be written to the log.
+
+        Args:
+            guild_id (int | None): The guild it was rolled in, None in DMs.
+            user_id (int): The user who rolled.
+            expression (str): The expression that was rolled.
+            advantage (str | None): "adv", "dis" or None.
+            result (dice.RollResult): The result of the roll.
+        """
+        self._pending.append(
+            (guild_id or 0, user_id, int(time.time()), expression, advantage, result)
+        )
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
 
+    async def stop(self) -> None:
+        """Stops the background task and writes anything still waiting."""
+        if self._task is not None:
+            # Let the task finish its current batch rather than cancelling
+            # it halfway through a write.
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
 
-class DieResults:
-    def __init__(self, sides: int, amount: int, result: list[int] = [0]) -> None:
-        self.sides = sides
-        self.amount = amount
-        self.result = result
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Writes every waiting roll to the log."""
+        self._full.clear()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            # Working out the luck of a roll can take a moment for unusual
+            # expressions, so do it off the event loop.
+            rows = await asyncio.to_thread(_roll_log_rows, pending)
+            if not await db.add_rolls(rows):
+                print(f"[ERROR] Lost {len(rows)} rolls that couldn't be logged")
+        except Exception as error:
+            print("-" * 80)
+            print(f"[ERROR] Couldn't log {len(pending)} rolls:")
+            traceback.print_exception(error)
+            print("-" * 80)
 
 
 # -----------------------MAIN CLASS-----------------------
 class DiceRoller(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
+        self.roll_log = RollLogger()
+
+    async def cog_load(self) -> None:
+        self.roll_log.start()
+
+    async def cog_unload(self) -> None:
+        # Cogs are unloaded when the bot closes, so this also saves any
+        # waiting rolls on shutdown.
+        await self.roll_log.stop()
 
     @app_commands.command(description="Roll a die")
-    @app_commands.describe(input="use the ndn+mod (1d20+1) format")
+    @app_commands.describe(
+        input="use the ndn+mod (1d20+1) format, also supports 4d6kh3, 2d20kl1, 1d6!, 2d6r1, * and ()"
+    )
     async def roll(self, interaction: discord.Interaction, input: str) -> None:
         """Rolls an amount of dice with modifier"""
+        try:
+            # Big rolls take a moment, so they're rolled off the event loop.
+            result = await asyncio.to_thread(dice.roll, input)
+        except dice.DiceError as e:
+            await interaction.response.send_message(content=str(e), ephemeral=True)
+            return
+
+        self.roll_log.log(interaction.guild_id, interaction.user.id, input, None, result)
+        await send_embeds(interaction, _build_roll_embed(interaction.user, input, result))
+
+    @app_commands.command(description="Roll several things at once")
+    @app_commands.describe(
+        input="rolls separated by commas, like: 6x 1d20+5 adv, 2x 2d6+3, 1d20 dis"
+    )
+    async def roll_batch(self, interaction: discord.Interaction, input: str) -> None:
+        """Rolls a whole batch of expressions and shows them in a single embed"""
+        try:
+            entries = dice.parse_batch(input)
+            results = await asyncio.to_thread(_roll_batch, entries)
+        except dice.DiceError as e:
+            await interaction.response.send_message(content=str(e), ephemeral=True)
+            return
 
-        re_input = re.findall(
-            "([+\\-])?\\s*(?:([^+\\-\\s]*)\\s*d\\s*([^+\\-\\s]*)(?=\\s*[+\\-]|\\s*$))|([+\\-])?\\s*(\\d+)",
-            input,
+        for expression, advantage, result in results:
+            self.roll_log.log(
+                interaction.guild_id, interaction.user.id, expression, advantage, result
+            )
+        await send_embeds(interaction, _build_batch_embed(interaction.user, input, results))
+
+    @app_commands.command(description="Work out the odds of a roll")
+    @app_commands.describe(
+        input="the roll to check, in the same format as /roll",
+        target="optionally, the number you want to hit or beat",
+    )
+    async def odds(
+        self, interaction: discord.Interaction, input: str, target: int | None = None
+    ) -> None:
+        """Shows the exact odds of a roll, and optionally the chance to hit a target"""
+        try:
+            distribution = await asyncio.to_thread(dice.odds, input)
+        except dice.DiceError as e:
+            await interaction.response.send_message(content=str(e), ephemeral=True)
+            return
+
+        embed = EmbedBuilder(title=f"Odds for {input}", color=0xFFD700)
+        embed.add_field(name="Average", value=f"{distribution.mean:.2f}", inline=True)
+        embed.add_field(
+            name="Range", value=f"{distribution.low} to {distribution.high}", inline=True
         )
-        rolls = []
+        percentiles = ", ".join(
+            f"{int(fraction * 100)}%: {distribution.percentile(fraction)}"
+            for fraction in (0.1, 0.25, 0.5, 0.75, 0.9)
+        )
+        embed.add_field(name="Percentiles", value=percentiles, inline=False)
+        if target is not None:
+            embed.add_field(
+                name=f"Chance of {target} or more",
+                value=f"{distribution.at_least(target):.2%}",
+                inline=False,
+            )
+        await send_embeds(interaction, embed)
 
-        if len(input) > 256:
-            await interaction.response.send_message(
-                content="Input can only be up to 256 characters", ephemeral=True
+    @app_commands.command(description="Show someone's roll statistics")
+    @app_commands.describe(user="whose statistics to show, defaults to you")
+    async def roll_stats(
+        self, interaction: discord.Interaction, user: discord.Member | None = None
+    ) -> None:
+        """Shows how much and how well someone has rolled in this server"""
+        user = user or interaction.user
+        # Counting the latest rolls can take a moment, and we only have 3
+        # seconds to respond.
+        await interaction.response.defer()
+        await self.roll_log.flush()
+        stats = await db.get_roll_stats(interaction.guild_id or 0, user.id)
+        if stats is None:
+            await interaction.followup.send(content="Something went wrong, please try again.")
+            return
+        totals, expressions, luck_rank = stats
+        rolls, luck, d20s, nat20s, nat1s = totals
+        if not rolls:
+            await interaction.followup.send(
+                content=f"{user.display_name} hasn't rolled anything yet"
             )
+            return
 
-        for result in re_input:
-            if result[3] == "" and result[4] == "":
-                # Dice roll:
-                try:
-                    amount = int(result[1])
-                    sides = int(result[2])
-
-                    if sides == 0:
-                        await interaction.response.send_message(
-                            content="I can't roll a die with zero sides...", ephemeral=True
-                        )
-                        return
-
-                    if amount == 0:
-                        await interaction.response.send_message(
-                            content="I can't roll zero dice", ephemeral=True
-                        )
-                        return
-
-                    if amount > 100:
-                        await interaction.response.send_message(
-                            content="You can only roll up to 100 die of each type", ephemeral=True
-                        )
-                        return
-
-                    elif sides > 1000000:
-                        await interaction.response.send_message(
-                            content="You can only roll dice with up to a million sides, you seriously don't need more than that",
-                            ephemeral=True,
-                        )
-                        return
-
-                except ValueError:
-                    await interaction.response.send_message(
-                        content="Sorry, I couldn't understand your roll, please try again",
-                        ephemeral=True,
-                    )
-                    return
-
-                if result[0] == "-":
-                    mod = -1
-                else:
-                    mod = 1
-
-                die_rolls = []
-                for i in range(0, amount):
-                    die_rolls.append(randint(1, sides) * mod)
-
-                rolls.append(DieResults(sides, amount, die_rolls))
-            else:
-                # Modifier:
-                try:
-                    val = int(result[3] + result[4])
-                except ValueError:
-                    await interaction.response.send_message(
-                        content="Sorry, I couldn't understand your roll, please try again",
-                        ephemeral=True,
-                    )
-
-                rolls.append(val)
-
-        embed_length = len(input) + len(interaction.user.display_name)
-        embed = discord.Embed(title=input, color=0xFFD700)
-        embed.set_author(
-            name=interaction.user.display_name, icon_url=interaction.user.display_avatar
+        embed = EmbedBuilder(title="Roll stats", color=0xFFD700, author=user)
+        embed.add_field(name="Rolls", value=f"{rolls:,}", inline=True)
+        if luck is not None:
+            # An average roll has a luck of 0.5, show it as a percentile.
+            embed.add_field(name="Average roll percentile", value=f"{luck:.0%}", inline=True)
+        if luck_rank is not None:
+            embed.add_field(
+                name="Luckier than", value=f"{luck_rank:.0%} of this server", inline=True
+            )
+        if d20s:
+            embed.add_field(
+                name="Natural 20s",
+                value=f"{nat20s:,} of {d20s:,} d20s ({nat20s / d20s:.1%})",
+                inline=True,
+            )
+            embed.add_field(
+                name="Natural 1s",
+                value=f"{nat1s:,} of {d20s:,} d20s ({nat1s / d20s:.1%})",
+                inline=True,
+            )
+        embed.add_field(
+            name="Most rolled",
+            value="\n".join(
+                f"`{expression}`: {count:,} rolls, average {average:.2f} ({low} to {high})"
+                for expression, count, average, low, high in expressions
+            ),
+            inline=False,
         )
-        total = 0
-        modifiers = ""
-        for obj in rolls:
-            if isinstance(obj, DieResults):
-                res = obj.result
-                val = ""
-                for num in res:
-                    total += num
-                    val += f"({num}), "
-                val = val[0:-2]
-                embed.add_field(name=f"{obj.amount}d{obj.sides}", value=val, inline=False)
-                embed_length = embed_length + len(f"{obj.amount}d{obj.sides}") + len(val)
+        await send_embeds(interaction, embed)
+
+
+# ---------------------OTHER FUNCTIONS--------------------
+def _roll_batch(entries: list[tuple[int, str, str | None]]) -> list[tuple]:
+    """Rolls every entry of a batch from dice.parse_batch.
+
+    Args:
+        entries (list[tuple[int, str, str | None]]): (times, expression, advantage) for every entry.
+
+    Returns:
+        list[tuple]: (expression, advantage, result) for every roll.
+    """
+    return [
+        (expression, advantage, dice.roll(expression, advantage=advantage))
+        for times, expression, advantage in entries
+        for _ in range(times)
+    ]
+
+
+def _roll_log_rows(pending: list[tuple]) -> list[tuple]:
+    """Turns queued rolls into rows for db.add_rolls, packing the dice and
+    working out the d20 counts and luck of every roll.
+
+    Args:
+        pending (list[tuple]): (guild_id, user_id, rolled_at, expression, advantage, result)
+            for every roll.
+
+    Returns:
+        list[tuple]: The rows to add.
+    """
+    rows = []
+    for guild_id, user_id, rolled_at, expression, advantage, result in pending:
+        # Log the parsed expression, so "1d20 + 2" and "1D20+2" count as the same roll.
+        expression = str(dice.parse(expression, advantage))
+        try:
+            luck = dice.odds(expression, LUCK_ODDS_WORK).rank(result.total)
+        except dice.DiceError:
+            luck = None
+
+        d20s = nat20s = nat1s = 0
+        for rolled in result.dice:
+            if rolled.sides != 20:
+                continue
+            if rolled.summarized:
+                d20s += rolled.count
+                nat20s += rolled.histogram.get(20, 0)
+                nat1s += rolled.histogram.get(1, 0)
             else:
-                total += obj
-                if obj < 0:
-                    modifiers += f"{obj}, "
-                    embed_length += len(f"{obj}, ")
-                else:
-                    modifiers += f"+{obj}, "
-                    embed_length += len(f"+{obj}, ")
-
-        if not modifiers == "":
-            modifiers = modifiers[0:-2]
-            embed.add_field(name="modifiers", value=modifiers, inline=False)
-        embed.add_field(name="Total", value=total, inline=False)
-        # Length of "total" is 5, and of "modifiers" is 9.
-        embed_length = embed_length + 5 + 9 + len(str(total)) + len(modifiers)
-
-        if embed_length > 6000:
-            await interaction.response.send_message(
-                content="Sorry, your roll is too large, please try again with a smaller one",
-                ephemeral=True,
+                kept = [value for value, keep in zip(rolled.result, rolled.kept) if keep]
+                d20s += len(kept)
+                nat20s += kept.count(20)
+                nat1s += kept.count(1)
+
+        rows.append(
+            (
+                guild_id,
+                user_id,
+                rolled_at,
+                expression,
+                result.total,
+                dice.pack_dice(result.dice),
+                d20s,
+                nat20s,
+                nat1s,
+                luck,
             )
-            return
-        await interaction.response.send_message(embed=embed)
+        )
+    return rows
+
+
+def _format_dice(rolled: dice.DieResults) -> str:
+    """Returns the individual dice of a term as text, with dropped dice struck out.
+
+    Args:
+        rolled (dice.DieResults): The dice term to format.
+
+    Returns:
+        str: The formatted dice, like "(6), (4), ~~(1)~~".
+    """
+    return ", ".join(
+        f"({value})" if kept else f"~~({value})~~"
+        for value, kept in zip(rolled.result, rolled.kept)
+    )
+
+
+def _format_summary(rolled: dice.DieResults) -> str:
+    """Returns a summary of a large dice term, as listing every die won't fit
+    in a message. Dice with few sides also get a count per face.
+
+    Args:
+        rolled (dice.DieResults): The summarized dice term to format.
+
+    Returns:
+        str: The formatted summary.
+    """
+    summary = (
+        f"{rolled.count:,} dice, sum {rolled.total:,}, "
+        + f"lowest {rolled.minimum}, highest {rolled.maximum}"
+    )
+    if rolled.sides <= 20:
+        summary += "\n" + ", ".join(
+            f"{face}: {rolled.histogram.get(face, 0):,}" for face in range(1, rolled.sides + 1)
+        )
+    return summary
+
+
+def _build_roll_embed(
+    user: discord.User | discord.Member, input: str, result: dice.RollResult
+) -> EmbedBuilder:
+    """Builds the embed showing a roll.
+
+    Args:
+        user (discord.User | discord.Member): The user who rolled.
+        input (str): The expression that was rolled.
+        result (dice.RollResult): The result of the roll.
+
+    Returns:
+        EmbedBuilder: The embed, split into pages if it's too large for one message.
+    """
+    embed = EmbedBuilder(title=input, color=0xFFD700, author=user)
+
+    for rolled in result.dice:
+        if rolled.summarized:
+            val = _format_summary(rolled)
+        else:
+            val = _format_dice(rolled)
+        embed.add_field(name=rolled.notation, value=val, inline=False)
+
+    modifiers = ", ".join(f"{value:+}" for value in result.modifiers)
+    if modifiers:
+        embed.add_field(name="modifiers", value=modifiers, inline=False)
+    embed.add_field(name="Total", value=result.total, inline=False)
+    return embed
+
+
+def _build_batch_embed(
+    user: discord.User | discord.Member,
+    input: str,
+    results: list[tuple[str, str | None, dice.RollResult]],
+) -> EmbedBuilder:
+    """Builds the embed showing a batch of rolls, one field per roll.
+
+    Args:
+        user (discord.User | discord.Member): The user who rolled.
+        input (str): The batch that was rolled.
+        results (list[tuple[str, str | None, dice.RollResult]]): (expression, advantage, result)
+            for every roll.
+
+    Returns:
+        EmbedBuilder: The embed, split into pages if it's too large for one message.
+    """
+    embed = EmbedBuilder(title=input, color=0xFFD700, author=user)
+
+    for expression, advantage, result in results:
+        name = f"{expression} ({advantage})" if advantage else expression
+        dice_text = "; ".join(
+            f"{rolled.notation}: "
+            + (_format_summary(rolled) if rolled.summarized else _format_dice(rolled))
+            for rolled in result.dice
+        )
+        val = f"**{result.total}**" + (f" - {dice_text}" if dice_text else "")
+        embed.add_field(name=name, value=val, inline=False)
+    return embed
 
 
 # ----------------------MAIN PROGRAM----------------------
@@ -0,0 +1,126 @@
+# -*- coding: UTF-8 -*-
+import asyncio
+
+# traceback is for error logging
+import traceback
+from collections.abc import Awaitable, Callable, Iterable
+
+import discord
+from discord.ext import commands
+
+from helpers import TriggerMatcher
+
+type MessageHandler = Callable[[discord.Message], Awaitable[None]]
+
+
+# ---------------------HOLDER CLASSES---------------------
+class ContentRoute:
+    # A handler, and the triggers that all have to be in a message for it to run.
+    __slots__ = ("triggers", "handler")
+
+    def __init__(self, triggers: frozenset[str], handler: MessageHandler) -> None:
+        self.triggers = triggers
+        self.handler = handler
+
+
+# -----------------------MAIN CLASS-----------------------
+class MessageRouter(commands.Cog):
+    # The only on_message listener, every other cog that reacts to messages
+    # registers a route here instead of listening itself. That way each
+    # message is checked once against cheap lookups (a dict of channels and
+    # a single combined search over all content triggers) and only the
+    # handlers that care about it run, instead of every cog getting called
+    # for every message the bot sees.
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+        self._channel_routes: dict[int, list[MessageHandler]] = {}
+        # Content routes by each of their triggers, so a message only has to
+        # look at the routes of the triggers it contains.
+        self._content_routes: dict[str, list[ContentRoute]] = {}
+        # Rebuilt on the next message whenever the set of triggers changes.
+        self._matcher: TriggerMatcher | None = TriggerMatcher(())
+
+    def add_channel_route(self, channel_id: int, handler: MessageHandler) -> None:
+        """Calls handler for every message in a channel.
+
+        Args:
+            channel_id (int): The id of the channel to route.
+            handler (MessageHandler): The coroutine function to call with the message.
+        """
+        self._channel_routes.setdefault(channel_id, []).append(handler)
+
+    def remove_channel_route(self, channel_id: int, handler: MessageHandler) -> None:
+        """Stops calling handler for messages in a channel."""
+        handlers = self._channel_routes.get(channel_id, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self._channel_routes.pop(channel_id, None)
+
+    def add_content_route(self, triggers: Iterable[str], handler: MessageHandler) -> ContentRoute:
+        """Calls handler for every message that contains all of the triggers.
+
+        Args:
+            triggers (Iterable[str]): The substrings (or emoji) that all have to be in the message.
+            handler (MessageHandler): The coroutine function to call with the message.
+
+        Returns:
+            ContentRoute: The route, pass it to remove_content_route to remove it again.
+        """
+        route = ContentRoute(frozenset(triggers), handler)
+        for trigger in route.triggers:
+            if trigger not in self._content_routes:
+                self._content_routes[trigger] = []
+                self._matcher = None
+            self._content_routes[trigger].append(route)
+        return route
+
+    def remove_content_route(self, route: ContentRoute) -> None:
+        """Removes a route added by add_content_route."""
+        for trigger in route.triggers:
+            routes = self._content_routes.get(trigger, [])
+            if route in routes:
+                routes.remove(route)
+            if not routes and trigger in self._content_routes:
+                del self._content_routes[trigger]
+                self._matcher = None
+
+    @commands.Cog.listener()
+    async def on_message(self, msg: discord.Message) -> None:
+        assert self.bot.user
+        # If the bot sent the message, ignore.
+        if msg.author.id == self.bot.user.id:
+            return
+
+        if self._matcher is None:
+            self._matcher = TriggerMatcher(self._content_routes)
+
+        handlers = self._channel_routes.get(msg.channel.id, [])
+        found = self._matcher.find(msg.content)
+        if found:
+            routes = dict.fromkeys(
+                route for trigger in found for route in self._content_routes[trigger]
+            )
+            handlers = handlers + [route.handler for route in routes if route.triggers <= found]
+        if not handlers:
+            return
+
+        # Run the handlers side by side, like separate listeners would, and
+        # make sure one failing doesn't stop the others.
+        results = await asyncio.gather(
+            *(handler(msg) for handler in handlers), return_exceptions=True
+        )
+        for handler, result in zip(handlers, results):
+            if isinstance(result, Exception):
+                print("-" * 80)
+                print(f"[ERROR] Message handler {getattr(handler, '__qualname__', handler)} failed:")
+                traceback.print_exception(result)
+                print("-" * 80)
+
+
+# ----------------------MAIN PROGRAM----------------------
+# This setup is required for the cog to setup and run,
+# and is run when the cog is loaded with bot.load_extensions().
+async def setup(bot: commands.Bot) -> None:
+    print("\tcogs.message_router begin loading")
+    await bot.add_cog(MessageRouter(bot))
@@ -1,9 +1,11 @@
 # -*- coding: UTF-8 -*-
+import asyncio
+
 # traceback is for error logging
 import traceback
+from collections.abc import Awaitable, Callable
 
 import discord
-import discord.utils
 
 # webcolors is needed to take colour names and make them into a hex value
 import webcolors
@@ -11,7 +13,9 @@ from discord import app_commands
 from discord.ext import commands
 
 import db_handler as db
+from embed_builder import EmbedBuilder
 from helpers import QuestInfo
+from role_cache import roles
 
 # ----------------------GLOBAL VARS-----------------------
 
@@ -32,6 +36,51 @@ def quest_info_error_message(quest_modal, raw_colour_value) -> str:
         """
 
 
+# ---------------------HELPER CLASSES---------------------
+
+
+class RosterEditCoalescer:
+    # Batches edits of the "Players:" message of quests. The first change to
+    # a quest starts a short timer, and any changes made before it runs out
+    # end up in the same single edit, which uses whatever the roster looks
+    # like at that point.
+    def __init__(self, delay: float = 2.0) -> None:
+        self.delay = delay
+        self._pending: dict[int, asyncio.Task] = {}
+        self._latest: dict[int, tuple[discord.abc.Messageable, QuestInfo]] = {}
+
+    def schedule(self, quest_id: int, channel: discord.abc.Messageable, info: QuestInfo) -> None:
+        """Makes sure the roster of a quest gets edited soon.
+
+        Args:
+            quest_id (int): The id of the quest whose roster changed.
+            channel (discord.abc.Messageable): The quest thread with the roster message.
+            info (QuestInfo): The quest, read when the edit actually happens.
+        """
+        self._latest[quest_id] = (channel, info)
+        if quest_id not in self._pending:
+            self._pending[quest_id] = asyncio.create_task(self._edit_later(quest_id))
+
+    async def _edit_later(self, quest_id: int) -> None:
+        await asyncio.sleep(self.delay)
+        # Clear the pending edit before we start, so changes that come in
+        # while we're editing get an edit of their own.
+        del self._pending[quest_id]
+        channel, info = self._latest.pop(quest_id)
+        try:
+            embed = await _build_roster_embed(channel.guild, info)
+            await channel.get_partial_message(info.pin_message_id).edit(embed=embed)
+        except Exception as error:
+            print("-" * 80)
+            print(f"[ERROR] Couldn't update the roster of quest {info.quest_title}:")
+            traceback.print_exception(error)
+            print("-" * 80)
+
+
+# One coalescer shared by every quest join view.
+_roster_edits = RosterEditCoalescer()
+
+
 # --------------------PERSISTENT VIEWS--------------------
 
 
@@ -58,50 +107,73 @@ class PersistentQuestJoinView(discord.ui.View):
     # Callback for the join button, is linked in init where the button is
     # defined.
     async def quest_join(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
-        dm_role = discord.utils.get(interaction.guild.roles, name="Dm")
+        # Acknowledge the click first, we only have 3 seconds to do so and the
+        # rest of this does several api calls.
+        await interaction.response.defer()
+
+        dm_role = roles.get(interaction.guild, db.guild_config.get(interaction.guild.id, "dm_role"))
+        user = interaction.user
 
         # Get thread and role of quest.
         role = interaction.guild.get_role(self.info.quest_role_id)
         thread = interaction.guild.get_thread(self.info.thread_id)
+        # Dms get the role and thread, but aren't on the player list.
+        is_player = dm_role not in user.roles
         # Check if user has the quest role.
-        if role in interaction.user.roles:
-            # If user has role, remove it and remove from quest.
-            await interaction.user.remove_roles(role)
-            await thread.remove_user(interaction.user)
-            await interaction.response.defer()
-
-            # If the user isn't a dm remove them from the player list.
-            if dm_role in interaction.user.roles:
+        if role in user.roles:
+            # If user has role, remove it and remove from quest (and put
+            # everything back if anything fails).
+            actions = [
+                (lambda: user.remove_roles(role), lambda: user.add_roles(role)),
+                (lambda: thread.remove_user(user), lambda: thread.add_user(user)),
+            ]
+            if is_player:
+                actions.append(
+                    (
+                        lambda: _db_write(db.remove_quest_player(self.quest_id, user.id)),
+                        lambda: _db_write(db.add_quest_player(self.quest_id, user.id)),
+                    )
+                )
+            if await _run_with_rollback(*actions):
+                await interaction.followup.send(
+                    "Something went wrong leaving the quest, please try again.", ephemeral=True
+                )
                 return
-            self.info.remove_player(interaction.user.id)
+
+            if not is_player:
+                return
+            # Only changed once the db has been. This is usually the quest in
+            # the registry, which the db functions already updated.
+            if user.id in self.info.player_ids:
+                self.info.remove_player(user.id)
         else:
-            # If user doesn't have role, add it and add user to the thread.
-            await interaction.user.add_roles(role)
-            await thread.add_user(interaction.user)
-            await interaction.response.defer()
+            # If user doesn't have role, add it and add user to the thread
+            # (and put everything back if anything fails).
+            actions = [
+                (lambda: user.add_roles(role), lambda: user.remove_roles(role)),
+                (lambda: thread.add_user(user), lambda: thread.remove_user(user)),
+            ]
+            if is_player:
+                actions.append(
+                    (
+                        lambda: _db_write(db.add_quest_player(self.quest_id, user.id)),
+                        lambda: _db_write(db.remove_quest_player(self.quest_id, user.id)),
+                    )
+                )
+            if await _run_with_rollback(*actions):
+                await interaction.followup.send(
+                    "Something went wrong joining the quest, please try again.", ephemeral=True
+                )
+                return
 
-            # If the user isn't a dm, add them to the player list.
-            if dm_role in interaction.user.roles:
+            if not is_player:
                 return
-            self.info.add_player(interaction.user.id)
-        namestring = ""
+            self.info.add_player(user.id)
 
         # Update the quest list message to reflect all players currently in the
-        # quest.
-        for player_id in self.info._players:
-            name = interaction.guild.get_member(player_id).display_name
-            quests_played = await db.get_player(interaction.guild_id, player_id)
-            namestring += f"`{name}`: {quests_played}\n"
-
-        # Send the quest list message and update database to reflect new data:
-        await interaction.channel.get_partial_message(self.info.pin_message_id).edit(
-            embed=discord.Embed(
-                title="Players:",
-                description=namestring,
-                color=discord.Color.from_str(self.info.embed_colour),
-            )
-        )
-        await db.update_quest(self.quest_id, self.info)
+        # quest. This is batched with any other joins and leaves that happen
+        # close together, so we don't hit the rate limit.
+        _roster_edits.schedule(self.quest_id, interaction.channel, self.info)
 
 
 # ------------------------MODALS--------------------------
@@ -187,7 +259,9 @@ class BaseQuestModal(discord.ui.Modal):
 
         # Send the actual message with the quest info.
         # (Check that the player role exists before we ping it):
-        player_role = discord.utils.get(interaction.guild.roles, name="Player")
+        player_role = roles.get(
+            interaction.guild, db.guild_config.get(interaction.guild.id, "player_role")
+        )
         if edit_quest:
             if player_role:
                 await self.message.edit(content=f"<@&{player_role.id}>", embed=embed)
@@ -214,16 +288,15 @@ class BaseQuestModal(discord.ui.Modal):
                 thread_id,
                 quest_role_id,
                 self.quest_info.pin_message_id,
-                self.quest_info.players,
+                self.quest_info.player_ids,
             )
 
             await db.update_quest(self.message.id, quest)
 
             # Set the quest join button to appear under the joined players
-            # list.
-            quest_id = (await db.get_quest_by_title(interaction.guild_id, quest.quest_title))[0]
+            # list (the quest id is the id of the quest message).
             await thread.get_partial_message(self.quest_info.pin_message_id).edit(
-                view=PersistentQuestJoinView(quest, quest_id)
+                view=PersistentQuestJoinView(quest, self.message.id)
             )
 
         else:
@@ -269,9 +342,8 @@ class BaseQuestModal(discord.ui.Modal):
             await db.create_quest(msg.id, quest)
 
             # Set the quest join button to appear under the joined players
-            # list.
-            quest_id = (await db.get_quest_by_title(interaction.guild_id, quest.quest_title))[0]
-            await pin_message.edit(view=PersistentQuestJoinView(quest, quest_id))
+            # list (the quest id is the id of the quest message).
+            await pin_message.edit(view=PersistentQuestJoinView(quest, msg.id))
 
     async def on_error(self, interaction: discord.Interaction, error: Exception) -> None:
         try:
@@ -411,10 +483,9 @@ class DelQuest(discord.ui.Modal, title="Delete Quest"):
 
         # If not, disable the join quest button.
         else:
-            quest_id = (
-                await db.get_quest_by_title(interaction.guild_id, self.quest_info.quest_title)
-            )[0]
-            disabled_view = PersistentQuestJoinView(self.quest_info, quest_id, disabled=True)
+            # The quest is already gone from the db, but its id is the id of
+            # the quest message.
+            disabled_view = PersistentQuestJoinView(self.quest_info, self.message.id, disabled=True)
             await thread.get_partial_message(self.quest_info.pin_message_id).edit(
                 view=disabled_view
             )
@@ -625,6 +696,81 @@ class QuestHandler(commands.Cog):
 
 
 # ---------------------OTHER FUNCTIONS--------------------
+async def _run_with_rollback(
+    *actions: tuple[Callable[[], Awaitable], Callable[[], Awaitable]],
+) -> list[BaseException]:
+    """Runs a set of independent api calls at the same time. If any of them
+    fail, the ones that went through are undone, so we don't end up half
+    done (like having the quest role but not being in the thread).
+
+    Args:
+        *actions (tuple[Callable, Callable]): (do, undo) pairs of functions returning awaitables.
+
+    Returns:
+        list[BaseException]: The errors from the failed calls, empty if all went well.
+    """
+    results = await asyncio.gather(*(do() for do, _ in actions), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        undo_results = await asyncio.gather(
+            *(
+                undo()
+                for (_, undo), result in zip(actions, results)
+                if not isinstance(result, BaseException)
+            ),
+            return_exceptions=True,
+        )
+
+        # Make sure we know what the errors are.
+        print("-" * 80)
+        print("[ERROR] Api calls failed and were rolled back, here are the tracebacks:")
+        for error in errors + [e for e in undo_results if isinstance(e, BaseException)]:
+            traceback.print_exception(error)
+        print("-" * 80)
+    return errors
+
+
+async def _db_write(write: Awaitable[bool]) -> None:
+    """Awaits a db write that reports whether it worked, raising if it didn't,
+    so it can be one of the actions of _run_with_rollback().
+
+    Args:
+        write (Awaitable[bool]): The db write.
+
+    Raises:
+        RuntimeError: If the write failed.
+    """
+    if not await write:
+        raise RuntimeError("A database write failed")
+
+
+async def _build_roster_embed(guild: discord.Guild, info: QuestInfo) -> discord.Embed:
+    """Returns the "Players:" embed listing everyone in a quest along with
+    how many quests they've played.
+
+    Args:
+        guild (discord.Guild): The guild the quest is in.
+        info (QuestInfo): The quest to list the players for.
+
+    Returns:
+        discord.Embed: The roster embed.
+    """
+    builder = EmbedBuilder(title="Players:", color=discord.Color.from_str(info.embed_colour))
+    # If the counts can't be read, still show who's in the quest.
+    quests_played = await db.get_players(guild.id, info.player_ids) or {}
+    for player_id in info.player_ids:
+        name = guild.get_member(player_id).display_name
+        builder.add_line(f"`{name}`: {quests_played.get(player_id, '?')}")
+
+    # The roster lives in a single pinned message, so only the first page
+    # can be shown, mention how many didn't fit.
+    embed, *rest = builder.build()
+    if rest:
+        hidden = sum(page.description.count("\n") for page in builder.pages[1:])
+        embed.set_footer(text=f"...and {hidden} more")
+    return embed
+
+
 async def _get_all_quests_played(
     channel, quest_info: QuestInfo = None, increment: bool = False
 ) -> discord.Embed:
@@ -639,15 +785,14 @@ async def _get_all_quests_played(
     Returns:
         discord.Embed: An embed with all players in a channel along with how many quests they've played.
     """
-    player_role = discord.utils.get(channel.guild.roles, name="Player")
+    player_role = roles.get(channel.guild, db.guild_config.get(channel.guild.id, "player_role"))
     players = {}
-    namestring = ""
 
     # If we are passed a quest_info object we already have a list of players
     # we can grab, and thus make less api calls.
     if quest_info:
         members_in_channel = []
-        player_list = quest_info._players
+        player_list = quest_info.player_ids
 
         # Check so that we don't have over 20 players in the quest, which would
         # warrant pure fear for other reasons, but eh, it's fiiine.
@@ -675,25 +820,44 @@ async def _get_all_quests_played(
             description="Too many players in channel (more than 20)",
             color=discord.Color.from_str("#ffffff"),
         )
-    for player in members_in_channel:
-        player = channel.guild.get_member(player.id)
-        if player_role not in player.roles:
-            continue
-        if increment:
-            quests_played = await db.get_player(channel.guild.id, player.id) + 1
-            await db.update_player(channel.guild.id, player.id, quests_played)
-        else:
-            quests_played = await db.get_player(channel.guild.id, player.id)
+    # Only count members with the player role.
+    members_in_channel = [channel.guild.get_member(player.id) for player in members_in_channel]
+    members_in_channel = [player for player in members_in_channel if player_role in player.roles]
+
+    # Grab (or increment) the quest count for everyone in one go.
+    player_ids = [player.id for player in members_in_channel]
+    if increment:
+        quests_played = await db.increment_players(channel.guild.id, player_ids)
+    else:
+        quests_played = await db.get_players(channel.guild.id, player_ids)
+    if quests_played is None:
+        return discord.Embed(
+            title="Quests Played:",
+            description="Couldn't get the quest counts from the database, please try again",
+            color=discord.Color.from_str("#ffffff"),
+        )
 
-        players[player] = quests_played
-        namestring += f"{player.display_name}: {quests_played}\n"
     if quest_info is None:
         embed_colour = "#ffffff"
     else:
         embed_colour = quest_info.embed_colour
-    return discord.Embed(
-        title="Quests Played:", description=namestring, color=discord.Color.from_str(embed_colour)
-    )
+    builder = EmbedBuilder(title="Quests Played:", color=discord.Color.from_str(embed_colour))
+    for player in members_in_channel:
+        players[player] = quests_played[player.id]
+        builder.add_line(f"{player.display_name}: {quests_played[player.id]}")
+    # At most 20 players, which always fits in one page.
+    return builder.build()[0]
+
+
+def _add_quest_views(bot: commands.Bot, quests: list[tuple[int, QuestInfo]]) -> None:
+    """Registers the persistent join button views for a list of quests.
+
+    Args:
+        bot (commands.Bot): The bot to add the views to.
+        quests (list[tuple[int, QuestInfo]]): (quest id, quest) pairs to add views for.
+    """
+    for quest_id, quest in quests:
+        bot.add_view(PersistentQuestJoinView(quest, quest_id))
 
 
 # ----------------------MAIN PROGRAM----------------------
@@ -704,15 +868,14 @@ async def _get_all_quests_played(
 async def setup(bot: commands.Bot) -> None:
     print(f"\tcogs.quest_handler begin loading")
 
-    print("\t\tQuests in database:")
-    # Get all quests from the database and add their persistent
-    # views to the bot one by one.
+    # Read all quests into memory once, after this quest lookups won't touch
+    # the database.
+    await db.load_quest_registry()
+
+    # Add the persistent views for all quests to the bot, the ids come along
+    # with the quests so this doesn't need any more queries.
     quests = await db.get_all_quest_list()
-    for quest in quests:
-        quest_id = (await db.get_quest_by_title(quest.guild_id, quest.quest_title))[0]
-        bot.add_view(PersistentQuestJoinView(quest, quest_id))
-        print(f"\t\t\t{quest.quest_title}")
-    if not quests:
-        print(f"\t\t\tNo quests in db!")
+    _add_quest_views(bot, quests)
+    print(f"\t\tLoaded {len(quests)} quests from the database")
 
     await bot.add_cog(QuestHandler(bot))
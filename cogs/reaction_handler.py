@@ -0,0 +1,264 @@
+# -*- coding: UTF-8 -*-
+import unicodedata
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+import db_handler as db
+from cogs.message_router import ContentRoute, MessageRouter
+from embed_builder import EmbedBuilder, send_embeds
+from helpers import ReactionRule, check_regex
+from rate_limiter import RateLimiter
+
+# -----------------------STATIC VARS----------------------
+# Every rule adds to the work done for messages with its tokens, so keep
+# guilds from adding an unreasonable amount.
+MAX_GUILD_RULES = 100
+
+
+# -----------------------MAIN CLASS-----------------------
+class ReactionHandler(commands.Cog):
+    # Reacts to messages based on the rules in the reaction_rules table.
+    # Every rule is a content route in the message router, so the tokens of
+    # all rules are found with a single search per message, and only the
+    # rules whose tokens are all there get to check their guild and regex.
+    def __init__(self, bot: commands.Bot, rules: list[ReactionRule]) -> None:
+        self.bot = bot
+        self.router: MessageRouter | None = None
+        self._initial_rules = rules
+        self.rules: dict[int, ReactionRule] = {}
+        self._routes: dict[int, ContentRoute] = {}
+        # One reaction per channel per cooldown, for every rule with a cooldown.
+        self._cooldowns: dict[int, RateLimiter] = {}
+
+    async def cog_load(self) -> None:
+        self.router = self.bot.get_cog("MessageRouter")
+        for rule in self._initial_rules:
+            # Rules from before regexes were checked, they can still be removed.
+            if rule.pattern:
+                try:
+                    check_regex(rule.pattern)
+                except ValueError as e:
+                    print(f"[WARNING] Skipping reaction rule {rule.id}: {e}")
+                    continue
+            self._add_rule(rule)
+
+    async def cog_unload(self) -> None:
+        for rule_id in list(self.rules):
+            self._remove_rule(rule_id)
+
+    def _add_rule(self, rule: ReactionRule) -> None:
+        self.rules[rule.id] = rule
+        if rule.cooldown > 0:
+            self._cooldowns[rule.id] = RateLimiter(rate=1, per=rule.cooldown)
+
+        async def react(msg: discord.Message) -> None:
+            await self._react(rule, msg)
+
+        self._routes[rule.id] = self.router.add_content_route(rule.tokens, react)
+
+    def _remove_rule(self, rule_id: int) -> None:
+        # Skipped rules were never added.
+        if self.rules.pop(rule_id, None) is None:
+            return
+        self._cooldowns.pop(rule_id, None)
+        self.router.remove_content_route(self._routes.pop(rule_id))
+
+    async def _react(self, rule: ReactionRule, msg: discord.Message) -> None:
+        """Called by the message router for messages with all the tokens of a rule."""
+        guild_id = msg.guild and msg.guild.id
+        if not rule.matches(guild_id, msg.content):
+            return
+        cooldown = self._cooldowns.get(rule.id)
+        if cooldown is None or cooldown.hit((guild_id, msg.channel.id)):
+            await msg.add_reaction(rule.emoji)
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.command(description="Adds a rule for reacting to messages")
+    @app_commands.describe(
+        tokens="Words or emoji that all have to be in a message, separated by spaces",
+        emoji="The emoji to react with",
+        regex="Optionally, a regex the message also has to match",
+        cooldown="The least amount of seconds between reactions in a channel",
+    )
+    async def add_reaction_rule(
+        self,
+        interaction: discord.Interaction,
+        tokens: str,
+        emoji: str,
+        regex: str | None = None,
+        cooldown: float = 40.0,
+    ) -> None:
+        """Discord command (/add_reaction_rule) that adds a reaction rule to the guild.
+
+        Args:
+            interaction (discord.Interaction): Object with info about the command interaction.
+            tokens (str): The tokens of the rule, separated by spaces.
+            emoji (str): The emoji to react with.
+            regex (str | None): A regex messages also have to match. Defaults to None.
+            cooldown (float): Seconds between reactions in a channel. Defaults to 40.
+        """
+        token_list = list(dict.fromkeys(tokens.split()))
+        # Tokens are what keeps rules cheap, so every rule needs at least one.
+        if not token_list:
+            await interaction.response.send_message(
+                "A rule needs at least one token", ephemeral=True
+            )
+            return
+        if regex:
+            try:
+                check_regex(regex)
+            except ValueError as e:
+                await interaction.response.send_message(str(e), ephemeral=True)
+                return
+        emoji = emoji.strip()
+        if not _usable_emoji(self.bot, emoji):
+            await interaction.response.send_message(
+                "That's not an emoji I can react with", ephemeral=True
+            )
+            return
+        guild_rules = sum(rule.guild_id == interaction.guild_id for rule in self.rules.values())
+        if guild_rules >= MAX_GUILD_RULES:
+            await interaction.response.send_message(
+                f"This server already has {MAX_GUILD_RULES} rules, remove some first",
+                ephemeral=True,
+            )
+            return
+
+        rule = await db.create_reaction_rule(
+            interaction.guild_id, token_list, regex or None, emoji, max(cooldown, 0)
+        )
+        if rule is None:
+            await interaction.response.send_message(
+                "Something went wrong saving the rule", ephemeral=True
+            )
+            return
+        self._add_rule(rule)
+        await interaction.response.send_message(
+            f"Added rule {rule.id}: {rule.emoji} for {' '.join(rule.tokens)}", ephemeral=True
+        )
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.command(description="Removes a rule for reacting to messages")
+    @app_commands.describe(rule_id="The id of the rule, see /list_reaction_rules")
+    async def remove_reaction_rule(self, interaction: discord.Interaction, rule_id: int) -> None:
+        """Discord command (/remove_reaction_rule) that removes a reaction rule from the guild.
+        Rules for every guild are turned off for the guild instead.
+
+        Args:
+            interaction (discord.Interaction): Object with info about the command interaction.
+            rule_id (int): The id of the rule to remove.
+        """
+        rule = self.rules.get(rule_id)
+        # Rules for every guild can't be removed from a single one, only turned off.
+        if rule is not None and rule.guild_id == 0:
+            if not await db.set_reaction_rule_disabled(interaction.guild_id, rule_id, True):
+                await interaction.response.send_message(
+                    "Something went wrong turning off the rule", ephemeral=True
+                )
+                return
+            rule.disabled_guilds.add(interaction.guild_id)
+            await interaction.response.send_message(
+                f"Turned off rule {rule_id} for this server, turn it back on with"
+                " /enable_reaction_rule",
+                ephemeral=True,
+            )
+            return
+        if not await db.del_reaction_rule(interaction.guild_id, rule_id):
+            await interaction.response.send_message(
+                "This server doesn't have a rule with that id", ephemeral=True
+            )
+            return
+        self._remove_rule(rule_id)
+        await interaction.response.send_message(f"Removed rule {rule_id}", ephemeral=True)
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.command(description="Turns a rule for every server back on")
+    @app_commands.describe(rule_id="The id of the rule, see /list_reaction_rules")
+    async def enable_reaction_rule(self, interaction: discord.Interaction, rule_id: int) -> None:
+        """Discord command (/enable_reaction_rule) that turns a rule for every guild that
+        was turned off with /remove_reaction_rule back on for the guild.
+
+        Args:
+            interaction (discord.Interaction): Object with info about the command interaction.
+            rule_id (int): The id of the rule to turn back on.
+        """
+        rule = self.rules.get(rule_id)
+        if (
+            rule is None
+            or interaction.guild_id not in rule.disabled_guilds
+            or not await db.set_reaction_rule_disabled(interaction.guild_id, rule_id, False)
+        ):
+            await interaction.response.send_message(
+                "This server hasn't turned off a rule with that id", ephemeral=True
+            )
+            return
+        rule.disabled_guilds.discard(interaction.guild_id)
+        await interaction.response.send_message(f"Turned rule {rule_id} back on", ephemeral=True)
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.command(description="Lists the rules for reacting to messages")
+    async def list_reaction_rules(self, interaction: discord.Interaction) -> None:
+        """Discord command (/list_reaction_rules) that lists the reaction rules of the guild.
+
+        Args:
+            interaction (discord.Interaction): Object with info about the command interaction.
+        """
+        embed = EmbedBuilder(title="Reaction rules", color=0x00FF00)
+        for rule in self.rules.values():
+            if rule.guild_id not in (0, interaction.guild_id):
+                continue
+            details = f"{rule.emoji} for `{' '.join(rule.tokens)}`"
+            if rule.pattern:
+                details += f" matching `{rule.pattern}`"
+            details += f", every {rule.cooldown:g}s per channel"
+            if interaction.guild_id in rule.disabled_guilds:
+                details += " (all servers, turned off here)"
+            elif rule.guild_id == 0:
+                details += " (all servers)"
+            embed.add_line(f"**{rule.id}**: {details}")
+        if not embed.pages[0].description:
+            embed.add_line("No rules yet, add one with /add_reaction_rule")
+        await send_embeds(interaction, embed, ephemeral=True)
+
+
+# ---------------------OTHER FUNCTIONS--------------------
+def _usable_emoji(bot: commands.Bot, emoji: str) -> bool:
+    """Checks that the bot can react with an emoji.
+
+    Args:
+        bot (commands.Bot): The bot.
+        emoji (str): A unicode emoji, or a custom one like <:name:id>.
+
+    Returns:
+        bool: Whether it's a unicode emoji or a custom emoji the bot has access to.
+    """
+    partial = discord.PartialEmoji.from_str(emoji)
+    if partial.id is not None:
+        return bot.get_emoji(partial.id) is not None
+    # Unicode emoji are symbols, along with the joiners, variation selectors,
+    # skin tones and keycaps that combine them (and the digits of keycaps).
+    categories = [unicodedata.category(char) for char in emoji]
+    return (
+        0 < len(emoji) <= 32
+        and ("So" in categories or "Me" in categories)
+        and all(
+            category in ("So", "Sk", "Mn", "Me", "Cf") or char in "0123456789#*"
+            for char, category in zip(emoji, categories)
+        )
+    )
+
+
+# ----------------------MAIN PROGRAM----------------------
+# This setup is required for the cog to setup and run,
+# and is run when the cog is loaded with bot.load_extensions().
+async def setup(bot: commands.Bot) -> None:
+    print("\tcogs.reaction_handler begin loading")
+    rules = await db.get_reaction_rules()
+    print(f"\t\tLoaded {len(rules)} reaction rules")
+    await bot.add_cog(ReactionHandler(bot, rules))
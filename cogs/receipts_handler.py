@@ -1,3 +1,4 @@
+import asyncio
 from concurrent.futures import thread
 from os import environ
 from typing import Self
@@ -9,7 +10,9 @@ from discord.ext import commands
 
 import db_handler as db
 
-BOARD_RECEIPTS_CHANNEL_ID = environ["BOARD_RECEIPTS_CHANNEL"]
+# The receipts channel from before guilds set their own with /config_set,
+# only ever used for the guild it's in, see _migrate_env_channel.
+BOARD_RECEIPTS_CHANNEL_ID = environ.get("BOARD_RECEIPTS_CHANNEL", "").strip()
 
 
 class ReceiptDenyModal(discord.ui.Modal):
@@ -124,7 +127,37 @@ class ReceiptsHandler(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.board_receipts_channel = bot.get_channel(BOARD_RECEIPTS_CHANNEL_ID)
+        self._migrate_task: asyncio.Task | None = None
+
+    async def cog_load(self) -> None:
+        if BOARD_RECEIPTS_CHANNEL_ID:
+            # Runs in the background, as it has to wait for the bot to be ready.
+            self._migrate_task = asyncio.create_task(self._migrate_env_channel())
+
+    async def cog_unload(self) -> None:
+        if self._migrate_task is not None:
+            self._migrate_task.cancel()
+            self._migrate_task = None
+
+    async def _migrate_env_channel(self) -> None:
+        """Saves the receipts channel from the environment as the receipts_channel
+        setting of the guild the channel is in, unless a guild already has a
+        receipts channel. Other guilds never get it, they set their own.
+        """
+        await self.bot.wait_until_ready()
+        if db.guild_config.guilds_with("receipts_channel"):
+            return
+        channel = None
+        if BOARD_RECEIPTS_CHANNEL_ID.isdigit():
+            channel = self.bot.get_channel(int(BOARD_RECEIPTS_CHANNEL_ID))
+        if getattr(channel, "guild", None) is None:
+            print("[WARNING] BOARD_RECEIPTS_CHANNEL isn't a server channel the bot can see")
+            return
+        if await db.set_guild_config(channel.guild.id, "receipts_channel", str(channel.id)):
+            print(
+                f"Saved BOARD_RECEIPTS_CHANNEL as the receipts channel of {channel.guild.name}, "
+                + "it can be removed from the environment"
+            )
 
     @app_commands.guild_only()
     @app_commands.command(description="Upload a receipt")
@@ -139,6 +172,13 @@ class ReceiptsHandler(commands.Cog):
         """
         Command to upload receipts
         """
+        channel_id = db.guild_config.get(interaction.guild_id, "receipts_channel")
+        if channel_id is None:
+            await interaction.response.send_message(
+                "This server doesn't have a receipts channel yet", ephemeral=True
+            )
+            return
+
         embed = discord.Embed()
         embed.title = "Receipt"
         embed.set_author(
@@ -153,7 +193,7 @@ class ReceiptsHandler(commands.Cog):
 
         public_msg: discord.WebhookMessage = await interaction.followup.send(embed=embed, wait=True)
 
-        channel = self.bot.get_channel(int(BOARD_RECEIPTS_CHANNEL_ID))
+        channel = self.bot.get_channel(int(channel_id))
         assert isinstance(channel, (TextChannel, Thread))
 
         board_msg = await channel.send(
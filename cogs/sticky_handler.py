@@ -1,85 +1,320 @@
 # -*- coding: UTF-8 -*-
+import asyncio
+import time
+
+# traceback is for error logging
+import traceback
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
 
 import discord
 from discord import CategoryChannel, DMChannel, ForumChannel, TextChannel, Thread, app_commands
 from discord.ext import commands
 
 import db_handler as db
+from cogs.message_router import MessageRouter
+from embed_builder import DESCRIPTION_LIMIT
+
+# -----------------------STATIC VARS----------------------
+# The text of stickies that don't have one of their own, in guilds that
+# haven't set a sticky template.
+DEFAULT_STICKY_TEMPLATE = (
+    "Här lägger ni in era nya karaktärers introduktion, det medlemmar i gillet skulle veta.\n"
+    "REKOMMENDERAD MALL FÖR HUR MAN SKRIVER IN SIN KARAKTÄR: \n\n"
+    "(namn), (klass/klasser och antalet levelar i klassen/klasserna, inkludera "
+    "subclass/subclasses), (race), (Antal GP), (lista över magic items) \n\n"
+    "(Kort beskrivning av karaktärens background/personlighet, så vi vet vem vi har att göra "
+    "med. Inga detaljer behöver vara med här, särskillt ingenting som ni vill att andra "
+    "spelare inte ska känna till.) \n\n"
+    "(Kort beskrivning av playstyle, till exempel:\n"
+    "Get into opponent's faces and hit them with an axe;\n"
+    "Confuse and disrupt with illusion magic;\n"
+    "Snipe down important targets with a heavy crossbow) \n\n"
+    "Tryck shift+enter om ni vill göra en radbrytning utan att skicka meddelandet!\n\n"
+    "P.S. håll er till ett meddelande, ni kan skicka en textfil med backstory om ni får slut "
+    "på plats, och ni kan skicka character art i #art-gallery"
+)
+
+# How often (in seconds) changed sticky message ids are written to the db.
+STICKY_FLUSH_INTERVAL = 10
+
+# How long (in seconds) a channel has to be quiet before its sticky is reposted.
+STICKY_QUIET_WINDOW = 3
+
+# How many channels the startup sticky check looks at at once.
+RECONCILE_CONCURRENCY = 5
+
+# ---------------------HELPER CLASSES---------------------
+
+
+class StickyReposter:
+    # Schedules sticky reposts. A message starts a quiet window for its
+    # channel, and every message during the window pushes it back, so a
+    # burst of chat moves the sticky once, after it calms down. Reposts in a
+    # channel run one at a time under that channel's lock, so two of them
+    # can never both see the same old sticky.
+    def __init__(
+        self,
+        repost: Callable[[discord.abc.Messageable], Awaitable[None]],
+        quiet_window: float = STICKY_QUIET_WINDOW,
+    ) -> None:
+        self.repost = repost
+        self.quiet_window = quiet_window
+        self._deadlines: dict[int, float] = {}
+        self._timers: dict[int, asyncio.Task] = {}
+        self._locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def lock(self, channel_id: int) -> asyncio.Lock:
+        """Returns the lock reposts in a channel run under, hold it to change
+        the sticky of a channel without racing a repost.
+        """
+        return self._locks[channel_id]
+
+    def schedule(self, channel: discord.abc.Messageable) -> None:
+        """Makes sure the sticky of a channel gets reposted once the channel
+        has been quiet for a while.
+
+        Args:
+            channel (discord.abc.Messageable): The channel that got a new message.
+        """
+        self._deadlines[channel.id] = asyncio.get_running_loop().time() + self.quiet_window
+        if channel.id not in self._timers:
+            self._timers[channel.id] = asyncio.create_task(self._repost_later(channel))
+
+    def cancel_all(self) -> None:
+        """Cancels every repost that hasn't started yet."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._deadlines.clear()
+
+    async def _repost_later(self, channel: discord.abc.Messageable) -> None:
+        loop = asyncio.get_running_loop()
+        # Messages move the deadline while we sleep, so keep sleeping until
+        # it's actually been reached.
+        while (delay := self._deadlines[channel.id] - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        # Clear the timer before we start, so messages that come in while
+        # we're reposting get a repost of their own.
+        del self._timers[channel.id]
+        del self._deadlines[channel.id]
+        async with self._locks[channel.id]:
+            try:
+                await self.repost(channel)
+            except Exception as error:
+                print("-" * 80)
+                print(f"[ERROR] Couldn't repost the sticky in channel {channel.id}:")
+                traceback.print_exception(error)
+                print("-" * 80)
+
 
 # -----------------------MAIN CLASS-----------------------
 
 
 class StickyHandler(commands.Cog):
-    def __init__(self, bot: commands.Bot, sticky_channels: list[int]) -> None:
+    def __init__(
+        self,
+        bot: commands.Bot,
+        stickies: dict[int, str | None],
+        sticky_messages: dict[int, int],
+    ) -> None:
         self.bot: commands.Bot = bot
-        self.sticky_channels: list[int] = sticky_channels
-
-    @commands.Cog.listener()
-    async def on_message(self, msg: discord.Message) -> None:
-        assert self.bot.user
-        # This is only for the character sticky messages.
-        # If the bot sent the message, ignore.
-        if msg.author.id == self.bot.user.id:
-            return
+        # The id of the current sticky message in every sticky channel. This
+        # is the source of truth while the bot runs, changes are written to
+        # the db in batches by _flush_loop, for the channels in _dirty.
+        self.sticky_messages: dict[int, int] = sticky_messages
+        self._dirty: set[int] = set()
+        self._flush_task: asyncio.Task | None = None
+        self.reposter = StickyReposter(self._repost_sticky)
+        self._reconcile_task: asyncio.Task | None = None
+        self.router: MessageRouter | None = None
+        # The text of the sticky in every sticky channel, None for the guild's
+        # sticky template. The keys double as the set of sticky channels.
+        self.sticky_templates: dict[int, str | None] = stickies
+
+    async def cog_load(self) -> None:
+        # Only messages in sticky channels get routed to us.
+        self.router = self.bot.get_cog("MessageRouter")
+        for channel_id in self.sticky_templates:
+            self.router.add_channel_route(channel_id, self.handle_message)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        # Runs in the background, as it has to wait for the bot to be ready.
+        self._reconcile_task = asyncio.create_task(self.reconcile_stickies())
 
-        # If we don't have a sticky in the channel, ignore.
-        if msg.channel.id not in self.sticky_channels:
+    async def cog_unload(self) -> None:
+        # Cogs are unloaded when the bot closes, so this saves the latest
+        # stickies on shutdown.
+        for channel_id in self.sticky_templates:
+            self.router.remove_channel_route(channel_id, self.handle_message)
+        self.reposter.cancel_all()
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+            self._reconcile_task = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush_stickies()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(STICKY_FLUSH_INTERVAL)
+            try:
+                await self.flush_stickies()
+            except Exception as error:
+                print("-" * 80)
+                print("[ERROR] Couldn't save the sticky messages:")
+                traceback.print_exception(error)
+                print("-" * 80)
+
+    async def flush_stickies(self) -> None:
+        """Writes the stickies that changed since the last flush to the db."""
+        if not self._dirty:
             return
+        dirty, self._dirty = self._dirty, set()
+        stickies = [
+            (channel_id, self.sticky_messages[channel_id])
+            for channel_id in dirty
+            if channel_id in self.sticky_messages
+        ]
+        try:
+            written = await db.update_stickies(stickies)
+        except BaseException:
+            # Cancelled mid write, make sure the final flush picks them up.
+            self._dirty |= dirty
+            raise
+        if not written:
+            # Try again next time.
+            self._dirty |= dirty
 
-        # Create the sticky embed (should probably cash this somewhere, but
-        # wth, this works).
-        sticky_embed = discord.Embed(
-            title="Character Template",
-            description="Här lägger ni in era nya karaktärers introduktion, det medlemmar i gillet skulle veta.\nREKOMMENDERAD MALL FÖR HUR MAN SKRIVER IN SIN KARAKTÄR: \n\n(namn), (klass/klasser och antalet levelar i klassen/klasserna, inkludera subclass/subclasses), (race), (Antal GP), (lista över magic items) \n\n(Kort beskrivning av karaktärens background/personlighet, så vi vet vem vi har att göra med. Inga detaljer behöver vara med här, särskillt ingenting som ni vill att andra spelare inte ska känna till.) \n\n(Kort beskrivning av playstyle, till exempel:\nGet into opponent's faces and hit them with an axe;\nConfuse and disrupt with illusion magic;\nSnipe down important targets with a heavy crossbow) \n\nTryck shift+enter om ni vill göra en radbrytning utan att skicka meddelandet!\n\nP.S. håll er till ett meddelande, ni kan skicka en textfil med backstory om ni får slut på plats, och ni kan skicka character art i #art-gallery",
-            color=0x00FF00,
+    async def reconcile_stickies(self) -> None:
+        """Makes sure every sticky is the last message in its channel, as
+        messages may have been sent (or the sticky deleted) while the bot
+        was offline. Channels are checked a few at a time, and stickies are
+        only reposted where they need to be.
+        """
+        await self.bot.wait_until_ready()
+        start = time.perf_counter()
+        limit = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+        failed: list[int] = []
+
+        async def reconcile(channel_id: int) -> bool:
+            async with limit:
+                try:
+                    channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(
+                        channel_id
+                    )
+                    async with self.reposter.lock(channel_id):
+                        # Skip channels that were unsubscribed in the meantime.
+                        if channel_id not in self.sticky_messages:
+                            return False
+                        last_message = [message async for message in channel.history(limit=1)]
+                        if last_message and last_message[0].id == self.sticky_messages[channel_id]:
+                            return False
+                        await self._repost_sticky(channel)
+                        return True
+                except discord.HTTPException as error:
+                    print(f"[ERROR] Couldn't check the sticky in channel {channel_id}: {error}")
+                    failed.append(channel_id)
+                    return False
+                except Exception as error:
+                    # Anything else only skips this channel, not the rest.
+                    print("-" * 80)
+                    print(f"[ERROR] Couldn't check the sticky in channel {channel_id}:")
+                    traceback.print_exception(error)
+                    print("-" * 80)
+                    failed.append(channel_id)
+                    return False
+
+        channel_ids = list(self.sticky_messages)
+        fixed = await asyncio.gather(*(reconcile(channel_id) for channel_id in channel_ids))
+        print(
+            f"Checked {len(fixed)} stickies in {time.perf_counter() - start:.2f}s, "
+            + f"reposted {sum(fixed)}"
+            + (f", couldn't check {len(failed)}: {failed}" if failed else "")
         )
-        _ = sticky_embed.set_footer(text="Stickied by Nat 1 Fred")
 
-        # Send the new sticky and delete the old one.
-        new_sticky = await msg.channel.send(embed=sticky_embed)
-        sticky_id = await db.get_sticky(msg.channel.id)
+    async def handle_message(self, msg: discord.Message) -> None:
+        """Called by the message router for every message in a sticky channel,
+        that wasn't sent by the bot.
+
+        Args:
+            msg (discord.Message): The message.
+        """
+        # Move the sticky down once the channel calms down.
+        self.reposter.schedule(msg.channel)
 
-        assert isinstance(msg.channel, (TextChannel, Thread))
+    async def _repost_sticky(self, channel: discord.abc.Messageable) -> None:
+        """Sends a new sticky in a channel and deletes the old one. Only ever
+        called by the reposter, under the channel's lock.
 
-        await msg.channel.get_partial_message(sticky_id).delete()
-        # Process the data of the sticky (update references and the like), and
-        # write the changes to disk.
-        await db.update_sticky(msg.channel.id, new_sticky.id)
+        Args:
+            channel (discord.abc.Messageable): The channel to repost the sticky in.
+        """
+        # The sticky may have been removed while we waited.
+        if channel.id not in self.sticky_templates:
+            return
+
+        assert isinstance(channel, (TextChannel, Thread))
+        sticky_embed = _sticky_embed(channel.guild.id, self.sticky_templates[channel.id])
+
+        # Send the new sticky and delete the old one.
+        new_sticky = await channel.send(embed=sticky_embed)
+        sticky_id = self.sticky_messages[channel.id]
+        # Update the sticky in memory straight away, it's written to disk
+        # with the next flush.
+        self.sticky_messages[channel.id] = new_sticky.id
+        self._dirty.add(channel.id)
+
+        try:
+            await channel.get_partial_message(sticky_id).delete()
+        except discord.NotFound:
+            # Someone already deleted it, which is all we wanted anyway.
+            pass
 
     @app_commands.guild_only()
     @app_commands.default_permissions(manage_messages=True)
     @app_commands.command(description="Creates the New Character sticky in a channel")
-    async def new_char_sticky(self, interaction: discord.Interaction) -> None:
+    @app_commands.describe(template="Custom text for the sticky, use \\n for new lines")
+    async def new_char_sticky(
+        self, interaction: discord.Interaction, template: str | None = None
+    ) -> None:
         """Discord command (/new_char_sticky) that creates a new-character
         sticky in a specific channel as well as the database.
         This command should be locked behind an admin role on discord.
 
         Args:
             interaction (discord.Interaction): Object with info about the command interaction.
+            template (str | None): The text of the sticky, defaults to the guild's template.
         """
         assert interaction.channel
         assert not (isinstance(interaction.channel, ForumChannel))
         assert not (isinstance(interaction.channel, CategoryChannel))
         assert not (isinstance(interaction.channel, DMChannel))
 
-        sticky_embed = discord.Embed(
-            title="Character Template",
-            description="Här lägger ni in era nya karaktärers introduktion, det medlemmar i gillet skulle veta.\nREKOMMENDERAD MALL FÖR HUR MAN SKRIVER IN SIN KARAKTÄR: \n\n(namn), (klass/klasser och antalet levelar i klassen/klasserna, inkludera subclass/subclasses), (race), (Antal GP), (lista över magic items) \n\n(Kort beskrivning av karaktärens background/personlighet, så vi vet vem vi har att göra med. Inga detaljer behöver vara med här, särskillt ingenting som ni vill att andra spelare inte ska känna till.) \n\n(Kort beskrivning av playstyle, till exempel:\nGet into opponent's faces and hit them with an axe;\nConfuse and disrupt with illusion magic;\nSnipe down important targets with a heavy crossbow) \n\nTryck shift+enter om ni vill göra en radbrytning utan att skicka meddelandet!",
-            color=0x00FF00,
-        )
-        sticky_embed = sticky_embed.set_footer(text="Stickied by Nat 1 Fred")
+        if template is not None:
+            template = template.replace("\\n", "\n")
+            # The template is the description of the sticky embed.
+            if not template.strip() or len(template) > DESCRIPTION_LIMIT:
+                await interaction.response.send_message(
+                    f"Templates need to be 1 to {DESCRIPTION_LIMIT} characters long", ephemeral=True
+                )
+                return
 
         # Check if the sticky already exists in the channel.
-        if interaction.channel.id in self.sticky_channels:
+        if interaction.channel.id in self.sticky_templates:
             # If it exists, just return an error message.
             _ = await interaction.response.send_message(
                 "There is already a sticky in that channel", ephemeral=True
             )
         else:
             # If it doesn't exist, create a new sticky and add it to the db.
+            sticky_embed = _sticky_embed(interaction.guild_id, template)
             new_sticky = await interaction.channel.send(embed=sticky_embed)
-            await db.create_sticky(interaction.channel.id, new_sticky.id)
-            self.sticky_channels.append(interaction.channel.id)
+            await db.create_sticky(interaction.channel.id, new_sticky.id, template)
+            self.sticky_templates[interaction.channel.id] = template
+            self.sticky_messages[interaction.channel.id] = new_sticky.id
+            self.router.add_channel_route(interaction.channel.id, self.handle_message)
             _ = await interaction.response.send_message(
                 f"Sticky created in channel: {interaction.channel.name}", ephemeral=True
             )
@@ -103,14 +338,19 @@ class StickyHandler(commands.Cog):
         assert isinstance(interaction.channel, (TextChannel, Thread))
 
         # If a sticky exists in selected channel.
-        if interaction.channel.id in self.sticky_channels:
-            # If del_sticky flag is set, delete message, else just delete the
-            # database entry.
-            if del_sticky:
-                sticky_id = await db.get_sticky(interaction.channel.id)
-                await interaction.channel.get_partial_message(sticky_id).delete()
-            await db.del_sticky(interaction.channel.id)
-            self.sticky_channels.remove(interaction.channel.id)
+        if interaction.channel.id in self.sticky_templates:
+            # Hold the lock so a repost can't swap the sticky out from under us.
+            async with self.reposter.lock(interaction.channel.id):
+                # If del_sticky flag is set, delete message, else just delete the
+                # database entry.
+                if del_sticky:
+                    sticky_id = self.sticky_messages[interaction.channel.id]
+                    await interaction.channel.get_partial_message(sticky_id).delete()
+                await db.del_sticky(interaction.channel.id)
+                del self.sticky_templates[interaction.channel.id]
+                self.router.remove_channel_route(interaction.channel.id, self.handle_message)
+                del self.sticky_messages[interaction.channel.id]
+                self._dirty.discard(interaction.channel.id)
             _ = await interaction.response.send_message(
                 "Sticky has been deleted" if del_sticky else "Sticky has been unsubscribed",
                 ephemeral=True,
@@ -122,13 +362,49 @@ class StickyHandler(commands.Cog):
             )
 
 
+# ---------------------OTHER FUNCTIONS--------------------
+def _sticky_embed(guild_id: int, template: str | None) -> discord.Embed:
+    """Returns the embed of a sticky, using the guild's sticky template if
+    the sticky doesn't have a text of its own.
+
+    Args:
+        guild_id (int): The id of the guild the sticky is in.
+        template (str | None): The text of the sticky, None for the guild's template.
+
+    Returns:
+        discord.Embed: The sticky embed.
+    """
+    if template is None:
+        template = db.guild_config.get(guild_id, "sticky_template")
+    return _build_sticky_embed(template)
+
+
+@lru_cache(maxsize=32)
+def _build_sticky_embed(template: str | None) -> discord.Embed:
+    """Returns the embed of a sticky. The embeds are cached, so channels
+    sharing a template share the same embed.
+
+    Args:
+        template (str | None): The text of the sticky, None for the default one.
+
+    Returns:
+        discord.Embed: The sticky embed.
+    """
+    sticky_embed = discord.Embed(
+        title="Character Template",
+        description=template or DEFAULT_STICKY_TEMPLATE,
+        color=0x00FF00,
+    )
+    return sticky_embed.set_footer(text="Stickied by Nat 1 Fred")
+
+
 # ----------------------MAIN PROGRAM----------------------
 # This setup is required for the cog to setup and run,
 # and is run when the cog is loaded with bot.load_extensions().
 async def setup(bot: commands.Bot) -> None:
     print("\tcogs.sticky_handler begin loading")
 
-    STICKY_CHANNELS: list[tuple[int, int]] = await db.get_sticky_list()
+    STICKY_CHANNELS: list[tuple[int, int, str | None]] = await db.get_sticky_list()
     print("\t\tLoaded stickies in channels:")
 
     if not STICKY_CHANNELS:
@@ -137,8 +413,7 @@ async def setup(bot: commands.Bot) -> None:
         for pair in STICKY_CHANNELS:
             print(f"\t\t\t{pair[0]}")
 
-    sticky_channels: list[int] = []
-    for channel in STICKY_CHANNELS:
-        sticky_channels.append(channel[0])
+    stickies = {channel_id: template for channel_id, _, template in STICKY_CHANNELS}
+    sticky_messages = {channel_id: message_id for channel_id, message_id, _ in STICKY_CHANNELS}
 
-    await bot.add_cog(StickyHandler(bot, sticky_channels))
+    await bot.add_cog(StickyHandler(bot, stickies, sticky_messages))
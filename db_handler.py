@@ -1,13 +1,242 @@
 import asyncio
+import json
+import math
+import sqlite3
+from collections.abc import Awaitable, Callable
 from sqlite3 import Error
 
 import asqlite
 
-from helpers import QuestInfo
+from helpers import GuildConfig, QuestInfo, QuestRegistry, ReactionRule
 
 global db_file
 db_file = "db/db.sqlite"
 
+# Long lived connections, opened by open_pool() and closed by close_pool().
+# All writes are serialized through the single writer connection.
+_reader_pool: asqlite.Pool | None = None
+_writer: asqlite.Connection | None = None
+_write_lock = asyncio.Lock()
+
+# The range of an INTEGER in SQLite.
+_INT64_MIN = -(2**63)
+_INT64_MAX = 2**63 - 1
+
+# In-memory copy of the quests table, filled by load_quest_registry() and
+# kept up to date by every quest write below. Until it is loaded all quest
+# reads go to disk.
+quest_registry = QuestRegistry()
+
+# In-memory copy of the guild_config table, filled by load_guild_config() and
+# kept up to date by set_guild_config(). Until it is loaded every guild gets
+# the default settings.
+guild_config = GuildConfig()
+
+# Selects every column of a quest, with the players (in the order they
+# joined) gathered from quest_players into a json list in the last column.
+# Append a WHERE clause to filter it.
+_QUEST_SELECT = """
+    SELECT
+        id, guild_id,
+        quest_title, contractor,
+        description, reward,
+        embed_colour, thread_id,
+        quest_role_id, pin_message_id,
+        (
+            SELECT json_group_array(player_id) FROM (
+                SELECT player_id FROM quest_players
+                WHERE quest_id = quests.id
+                ORDER BY rowid
+            )
+        )
+    FROM quests
+"""
+
+
+def _quest_from_row(row: tuple) -> QuestInfo:
+    """Builds a QuestInfo from a row of _QUEST_SELECT, leaving out the id.
+
+    Args:
+        row (tuple): The row, the players come last as a json list.
+
+    Returns:
+        QuestInfo: The quest.
+    """
+    return QuestInfo(*row[1:-1], json.loads(row[-1]))
+
+
+async def _migrate_quest_players(conn: asqlite.Connection) -> None:
+    """Moves the players stored in the quests.players column into the
+    quest_players table. Used by schema upgrade 2.
+
+    Args:
+        conn (asqlite.Connection): The connection the upgrade is running on.
+    """
+    query_return = await (
+        await conn.execute("SELECT id, players FROM quests WHERE players IS NOT NULL")
+    ).fetchall()
+    for quest_id, players in query_return:
+        # The column holds a json list of player ids.
+        for player_id in json.loads(players):
+            await conn.execute(
+                "INSERT OR IGNORE INTO quest_players (quest_id, player_id) VALUES (?, ?)",
+                (quest_id, player_id),
+            )
+    # The column is left in place for older sqlite versions, but emptied so
+    # nothing can read stale data from it.
+    await conn.execute("UPDATE quests SET players = NULL")
+
+
+# Schema upgrades, applied in order on top of the tables from _create_tables.
+# The database keeps track of how many have been applied in its user_version,
+# so only add new entries to the end of this list and never edit old ones.
+# Each step is either an sql string or a function that gets the connection.
+_SCHEMA_UPGRADES: list[list[str | Callable[[asqlite.Connection], Awaitable[None]]]] = [
+    # 1: Indexes for the hot lookups, and a unique key for players.
+    [
+        # Merge any duplicate player rows before adding the unique key,
+        # keeping the highest quest count so nobody loses progress.
+        """
+        DELETE FROM players
+        WHERE rowid NOT IN (
+            SELECT rowid FROM (
+                SELECT rowid, MAX(quests_completed) FROM players
+                GROUP BY guild_id, player_id
+            )
+        );
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS players_guild_player
+        ON players (guild_id, player_id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS quests_guild_title
+        ON quests (guild_id, quest_title);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS quests_thread
+        ON quests (thread_id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS receipts_public
+        ON receipts (public_message_id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS receipts_board
+        ON receipts (board_message_id);
+        """,
+    ],
+    # 2: Quest members get their own table instead of a list in quests.players.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS quest_players (
+            "quest_id" INTEGER NOT NULL REFERENCES quests (id) ON DELETE CASCADE,
+            "player_id" INTEGER NOT NULL,
+            UNIQUE (quest_id, player_id)
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS quest_players_player
+        ON quest_players (player_id);
+        """,
+        _migrate_quest_players,
+    ],
+    # 3: Append only log of every roll, for /roll_stats.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS rolls (
+            "id" INTEGER PRIMARY KEY,
+            "guild_id" INTEGER NOT NULL,
+            "user_id" INTEGER NOT NULL,
+            "rolled_at" INTEGER NOT NULL,
+            "expression" TEXT NOT NULL,
+            "total" INTEGER NOT NULL,
+            "dice" BLOB NOT NULL,
+            "d20s" INTEGER NOT NULL,
+            "nat20s" INTEGER NOT NULL,
+            "nat1s" INTEGER NOT NULL,
+            "luck" REAL
+        );
+        """,
+        # Per user stats, grouped by expression.
+        """
+        CREATE INDEX IF NOT EXISTS rolls_guild_user_expression
+        ON rolls (guild_id, user_id, expression);
+        """,
+        # Covers the luck ranking of everyone in a guild without touching the table.
+        """
+        CREATE INDEX IF NOT EXISTS rolls_guild_user_luck
+        ON rolls (guild_id, user_id, luck);
+        """,
+    ],
+    # 4: Stickies can have their own text, NULL uses the default template.
+    [
+        """
+        ALTER TABLE stickies ADD COLUMN "template" TEXT;
+        """,
+    ],
+    # 5: Reaction rules, replacing the hardcoded whale and milk reaction.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS reaction_rules (
+            "id" INTEGER PRIMARY KEY,
+            "guild_id" INTEGER NOT NULL,
+            "tokens" TEXT NOT NULL,
+            "regex" TEXT,
+            "emoji" TEXT NOT NULL,
+            "cooldown" REAL NOT NULL
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS reaction_rules_guild
+        ON reaction_rules (guild_id);
+        """,
+        # The whale rule used to apply everywhere, so it's added for every guild (0).
+        """
+        INSERT INTO
+            reaction_rules (guild_id, tokens, regex, emoji, cooldown)
+        VALUES
+            (0, '["🐋", "🥛"]', NULL, '👀', 40);
+        """,
+        # Guilds that turned off a rule for every guild.
+        """
+        CREATE TABLE IF NOT EXISTS disabled_reaction_rules (
+            "rule_id" INTEGER NOT NULL REFERENCES reaction_rules (id) ON DELETE CASCADE,
+            "guild_id" INTEGER NOT NULL,
+            PRIMARY KEY (rule_id, guild_id)
+        ) WITHOUT ROWID;
+        """,
+    ],
+    # 6: Per guild settings, only the ones a guild has changed from the default.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS guild_config (
+            "guild_id" INTEGER NOT NULL,
+            "key" TEXT NOT NULL,
+            "value" TEXT NOT NULL,
+            PRIMARY KEY (guild_id, key)
+        ) WITHOUT ROWID;
+        """,
+    ],
+]
+
+
+def _init_connection(conn: sqlite3.Connection) -> None:
+    """Sets the pragmas we want on every connection we open.
+    asqlite already turns on WAL journaling, but we set it here as well so
+    we don't depend on that.
+
+    Args:
+        conn (sqlite3.Connection): The freshly opened connection.
+    """
+    conn.execute("PRAGMA journal_mode = WAL")
+    # NORMAL is safe with WAL, we can at most lose the last commit on a power cut.
+    conn.execute("PRAGMA synchronous = NORMAL")
+    # Negative values are in KiB, so this is a 16MB page cache.
+    conn.execute("PRAGMA cache_size = -16000")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
 
 async def _create_tables() -> None:
     """Initialization function to create the database if it doesn't exist yet."""
@@ -53,23 +282,101 @@ async def _create_tables() -> None:
     """
     await _execute_query(create_receipts_table)
 
-    print("all done, closing out!")
 
+async def _upgrade_schema() -> None:
+    """Applies any schema upgrades the database hasn't seen yet.
+    Each upgrade runs in its own transaction, so a failing upgrade leaves the
+    database as it was before it.
+    """
+    async with _write_lock:
+        version = (await (await _writer.execute("PRAGMA user_version")).fetchone())[0]
+        for new_version, statements in enumerate(_SCHEMA_UPGRADES[version:], version + 1):
+            print(f"Upgrading database schema to version {new_version}")
+            async with _writer.transaction():
+                for statement in statements:
+                    if isinstance(statement, str):
+                        await _writer.execute(statement)
+                    else:
+                        await statement(_writer)
+                # Pragmas can't take parameters, but this is always an int.
+                await _writer.execute(f"PRAGMA user_version = {new_version}")
+
+
+async def open_pool(reader_count: int = 4) -> None:
+    """Opens the long lived connections used by every query in this module.
+    Reads are spread over a small pool of connections, while all writes go
+    through a single connection so they never fight over the database lock.
+    Also creates any missing tables and brings the schema up to date.
+    Should be called once when the bot starts up.
 
-async def _execute_query(query: str, vars: tuple = ()) -> None:
+    Args:
+        reader_count (int, optional): The amount of read connections to keep open. Defaults to 4.
+    """
+    global _reader_pool, _writer
+    if _reader_pool is not None:
+        return
+    _writer = await asqlite.connect(db_file, init=_init_connection)
+    await _create_tables()
+    await _upgrade_schema()
+    _reader_pool = await asqlite.create_pool(db_file, size=reader_count, init=_init_connection)
+
+
+async def close_pool() -> None:
+    """Closes all connections opened by open_pool, waiting for any running
+    queries to finish first. Should be called when the bot shuts down.
+    """
+    global _reader_pool, _writer
+    if _reader_pool is not None:
+        await _reader_pool.close()
+        _reader_pool = None
+    if _writer is not None:
+        # Grab the lock so we don't close the writer mid query.
+        async with _write_lock:
+            await _writer.close()
+        _writer = None
+
+
+async def _execute_query(query: str, vars: tuple = ()) -> bool:
     """Execute the given query in the globally defined database.
 
     Args:
         query (str): The query string.
         vars (tuple): The vars to replace the spots in the queary string.
+
+    Returns:
+        bool: Whether or not the query went through.
     """
-    async with asqlite.connect(db_file) as conn:
-        async with conn.cursor() as cursor:
+    async with _write_lock:
+        async with _writer.cursor() as cursor:
             try:
                 await cursor.execute(query, vars)
-                await conn.commit()
+                await _writer.commit()
+                return True
             except Error as e:
                 print(f"the error {e} occured")
+                return False
+
+
+async def _execute_write_read_query(query: str, vars: tuple = ()) -> list[tuple]:
+    """Same as execute_query except it returns values,
+    and is used for writes with a RETURNING clause.
+
+    Args:
+        query (str): The query string.
+        vars (tuple): The vars to replace the spots in the queary string.
+
+    Returns:
+        list: a list containing all the rows returned by the query.
+    """
+    async with _write_lock:
+        async with _writer.cursor() as cursor:
+            try:
+                await cursor.execute(query, vars)
+                result = await cursor.fetchall()
+                await _writer.commit()
+                return result
+            except Error as e:
+                print(f"The error '{e}' occurred")
 
 
 async def _execute_multiple_read_query(query: list, vars: tuple = ()) -> list[tuple]:
@@ -83,7 +390,7 @@ async def _execute_multiple_read_query(query: list, vars: tuple = ()) -> list[tu
     Returns:
         list: a list containing all the data found from the query.
     """
-    async with asqlite.connect(db_file) as conn:
+    async with _reader_pool.acquire() as conn:
         async with conn.cursor() as cursor:
             result = None
             try:
@@ -104,7 +411,7 @@ async def _execute_read_query(query: list, vars: tuple = ()) -> tuple:
     Returns:
         tuple: A Touple containing the data at the found row.
     """
-    async with asqlite.connect(db_file) as conn:
+    async with _reader_pool.acquire() as conn:
         async with conn.cursor() as cursor:
             result = None
             try:
@@ -124,8 +431,12 @@ async def get_quest(quest_id: int) -> QuestInfo:
     Returns:
         QuestInfo: An object containing the data from the db.
     """
-    quest_query = """
-    SELECT * FROM quests
+    if quest_registry.loaded:
+        return quest_registry.get(quest_id)
+    quest_registry.misses += 1
+
+    quest_query = f"""
+    {_QUEST_SELECT}
     WHERE id = ?;"""
 
     # This returns a list and we take the first object as there should only
@@ -135,8 +446,7 @@ async def get_quest(quest_id: int) -> QuestInfo:
     # The first value returned is the id of the quest, which we don't want to
     # parse.
     if query_return:
-        quest = QuestInfo(*query_return[1:])
-        return quest
+        return _quest_from_row(query_return)
     return None
 
 
@@ -151,8 +461,12 @@ async def get_quest_by_title(guild_id: int, quest_title: str) -> tuple[int, Ques
     Returns:
         tuple[int, QuestInfo]: An object containing the data from the db.
     """
-    quest_query = """
-    SELECT * FROM quests
+    if quest_registry.loaded:
+        return quest_registry.get_by_title(guild_id, quest_title)
+    quest_registry.misses += 1
+
+    quest_query = f"""
+    {_QUEST_SELECT}
     WHERE
         quest_title = ?
     AND
@@ -169,8 +483,7 @@ async def get_quest_by_title(guild_id: int, quest_title: str) -> tuple[int, Ques
         ),
     )
     if query_return:
-        quest = QuestInfo(*query_return[1:])
-        return (query_return[0], quest)
+        return (query_return[0], _quest_from_row(query_return))
     return None
 
 
@@ -184,8 +497,12 @@ async def get_quest_by_thread_id(thread_id: int) -> tuple[int, QuestInfo]:
     Returns:
         tuple[int, QuestInfo]: An object containing the data from the db.
     """
-    quest_query = """
-    SELECT * FROM quests
+    if quest_registry.loaded:
+        return quest_registry.get_by_thread_id(thread_id)
+    quest_registry.misses += 1
+
+    quest_query = f"""
+    {_QUEST_SELECT}
     WHERE thread_id = ?;"""
 
     # This returns a list and we take the first object as there should only
@@ -196,51 +513,56 @@ async def get_quest_by_thread_id(thread_id: int) -> tuple[int, QuestInfo]:
     # parse.
 
     if query_return:
-        quest = QuestInfo(*query_return[1:])
-        return (query_return[0], quest)
+        return (query_return[0], _quest_from_row(query_return))
     return None
 
 
-async def get_quest_list(guild_id: int) -> list[QuestInfo]:
-    """Returns a list of all quests in the database
-
-    Args:
-        guild_id (int): The id of the discord guild to grab the quests for.
+async def get_all_quest_list() -> list[tuple[int, QuestInfo]]:
+    """Returns a list of all quests in the database along with their ids
 
     Returns:
-        list[QuestInfo]: The list of objects
+        list[tuple[int, QuestInfo]]: The list of (quest id, quest) pairs
     """
+    if quest_registry.loaded:
+        return quest_registry.get_all()
+    quest_registry.misses += 1
 
-    quest_query = """
-    SELECT * FROM quests
-    WHERE guild_id = ?;
+    quest_query = f"""
+    {_QUEST_SELECT};
     """
 
-    query_return = await _execute_multiple_read_query(quest_query, (guild_id,))
+    query_return = await _execute_multiple_read_query(quest_query)
     quests = []
     if query_return:
         for quest in query_return:
-            quests.append(QuestInfo(*quest[1:]))
+            quests.append((quest[0], _quest_from_row(quest)))
     return quests
 
 
-async def get_all_quest_list() -> list[QuestInfo]:
-    """Returns a list of all quests in the database
+async def load_quest_registry(attempts: int = 3, retry_delay: float = 1.0) -> None:
+    """Reads every quest from the database into the quest registry with a
+    single query, after which all quest reads are served from memory.
 
-    Returns:
-        list[QuestInfo]: The list of objects
-    """
+    Args:
+        attempts (int, optional): How many times to try reading the quests. Defaults to 3.
+        retry_delay (float, optional): Seconds to wait between attempts. Defaults to 1.0.
 
-    quest_query = """
-    SELECT * FROM quests;
+    Raises:
+        Error: If the quests couldn't be read, the registry is left unloaded
+            so quest reads keep going to the db.
     """
-
-    query_return = await _execute_multiple_read_query(quest_query)
-    quests = []
-    if query_return:
-        for quest in query_return:
-            quests.append(QuestInfo(*quest[1:]))
-    return quests
+    quest_registry.loaded = False
+    quest_query = f"""
+    {_QUEST_SELECT};
+    """
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(retry_delay)
+        query_return = await _execute_multiple_read_query(quest_query)
+        if query_return is not None:
+            quest_registry.load([(quest[0], _quest_from_row(quest)) for quest in query_return])
+            return
+    raise Error(f"Couldn't read the quests for the quest registry in {attempts} attempts")
 
 
 async def create_quest(id: int, quest_info: QuestInfo) -> None:
@@ -275,11 +597,14 @@ async def create_quest(id: int, quest_info: QuestInfo) -> None:
         quest_info.pin_message_id,
     )
 
-    await _execute_query(quest_add, vars)
+    if await _execute_query(quest_add, vars):
+        quest_registry.add(id, quest_info)
 
 
 async def update_quest(id: int, quest_info: QuestInfo) -> None:
     """Updates an already existing quest by id.
+    The players in the quest are left alone, use add_quest_player and
+    remove_quest_player for those.
 
     Args:
         id (int): The id of the quest to update.
@@ -295,8 +620,7 @@ async def update_quest(id: int, quest_info: QuestInfo) -> None:
         embed_colour = ?,
         thread_id = ?,
         quest_role_id = ?,
-        pin_message_id = ?,
-        players = ?
+        pin_message_id = ?
     WHERE
         id = ?
     AND
@@ -311,103 +635,109 @@ async def update_quest(id: int, quest_info: QuestInfo) -> None:
         quest_info.thread_id,
         quest_info.quest_role_id,
         quest_info.pin_message_id,
-        quest_info.players,
         id,
         quest_info.guild_id,
     )
 
-    await _execute_query(quest_update, vars)
+    if await _execute_query(quest_update, vars):
+        quest_registry.update(id, quest_info)
 
 
-async def del_quest_by_title(guild_id: int, quest_title: str) -> None:
-    """Remove a quest from the db given a quest title.
+async def add_quest_player(quest_id: int, player_id: int) -> bool:
+    """Adds a single player to a quest, does nothing if they're already in it.
 
     Args:
-        guild_id (int): The id of the discord guild to look for the quest in.
-        quest_title (str): The title of the quest to remove.
+        quest_id (int): The id of the quest to add the player to.
+        player_id (int): The id of the player to add.
+
+    Returns:
+        bool: Whether the write went through, the registry is only updated if it did.
     """
-    quest_del = """
-    DELETE FROM quests
-    WHERE
-        quest_title = ?
-    AND
-        guild_id = ?
+    player_add = """
+    INSERT INTO
+        quest_players (quest_id, player_id)
+    VALUES
+        (?, ?)
+    ON CONFLICT DO NOTHING;
     """
-    await _execute_query(
-        quest_del,
-        (
-            quest_title,
-            guild_id,
-        ),
-    )
+    if not await _execute_query(player_add, (quest_id, player_id)):
+        return False
+    quest_registry.add_player(quest_id, player_id)
+    return True
 
 
-async def del_quest(id: int) -> None:
-    """Remove a quest from the db given an id.
+async def remove_quest_player(quest_id: int, player_id: int) -> bool:
+    """Removes a single player from a quest.
 
     Args:
-        id (int): The id of the quest to remove.
+        quest_id (int): The id of the quest to remove the player from.
+        player_id (int): The id of the player to remove.
+
+    Returns:
+        bool: Whether the write went through, the registry is only updated if it did.
     """
-    quest_del = "DELETE FROM quests WHERE id = ?"
-    await _execute_query(quest_del, (id,))
+    player_del = "DELETE FROM quest_players WHERE quest_id = ? AND player_id = ?"
+    if not await _execute_query(player_del, (quest_id, player_id)):
+        return False
+    quest_registry.remove_player(quest_id, player_id)
+    return True
 
 
-async def get_sticky(channel_id: int) -> int:
-    """Returns a sticky given the id of the channel it's in.
+async def del_quest(id: int) -> None:
+    """Remove a quest from the db given an id.
 
     Args:
-        channel_id (int): The id of the channel the sticky is in.
-
-    Returns:
-        int: The id if the sticky message itself.
+        id (int): The id of the quest to remove.
     """
-    sticky_query = """
-    SELECT * FROM stickies
-    WHERE channel_id = ?"""
-    # This returns a list and we take the first object as there should only
-    # ever be one due to unique constraints in the db.
-    return (await _execute_read_query(sticky_query, (channel_id,)))[1]
+    quest_del = "DELETE FROM quests WHERE id = ?"
+    if await _execute_query(quest_del, (id,)):
+        quest_registry.remove(id)
 
 
-async def get_sticky_list() -> list[tuple[int, int]]:
+async def get_sticky_list() -> list[tuple[int, int, str | None]]:
     """Returns a list of all stickies in the database.
 
     Returns:
-        list[tuple]: A list of tuples on the form (channel_id, message_id)
+        list[tuple]: A list of tuples on the form (channel_id, message_id, template),
+            template being None for stickies using the default one.
     """
     sticky_query = """
-    SELECT * FROM stickies"""
+    SELECT channel_id, message_id, template FROM stickies"""
     return await _execute_multiple_read_query(sticky_query)
 
 
-async def create_sticky(channel_id: int, message_id: int) -> None:
+async def create_sticky(channel_id: int, message_id: int, template: str | None = None) -> None:
     """Adds a new sticky to the database.
 
     Args:
         channel_id (int): The discord Channel id of the message.
         message_id (int): The id of the message itself.
+        template (str | None): The text of the sticky, None to use the default one.
     """
     sticky_add = """
     INSERT INTO
-        stickies (channel_id, message_id)
+        stickies (channel_id, message_id, template)
     VALUES
-        (?, ?);
+        (?, ?, ?);
     """
     await _execute_query(
         sticky_add,
         (
             channel_id,
             message_id,
+            template,
         ),
     )
 
 
-async def update_sticky(channel_id: int, message_id: int) -> None:
-    """Updates the sticky in a certain channel to another message.
+async def update_stickies(stickies: list[tuple[int, int]]) -> bool:
+    """Updates the stickies in many channels to other messages, in a single transaction.
 
     Args:
-        channel_id (int): The id of the discord channel the sticky is in.
-        message_id (int): The id of the new sticky.
+        stickies (list[tuple[int, int]]): (channel_id, message_id) of every sticky to update.
+
+    Returns:
+        bool: Whether or not the stickies were written.
     """
     sticky_update = """
     UPDATE stickies
@@ -416,13 +746,17 @@ async def update_sticky(channel_id: int, message_id: int) -> None:
     WHERE
         channel_id = ?
     """
-    await _execute_query(
-        sticky_update,
-        (
-            message_id,
-            channel_id,
-        ),
-    )
+    async with _write_lock:
+        try:
+            async with _writer.transaction():
+                await _writer.executemany(
+                    sticky_update,
+                    [(message_id, channel_id) for channel_id, message_id in stickies],
+                )
+            return True
+        except Error as e:
+            print(f"The error '{e}' occurred")
+            return False
 
 
 async def del_sticky(channel_id: int):
@@ -478,6 +812,95 @@ async def get_player(guild_id: int, player_id: int) -> int:
     return query_return[0]
 
 
+async def get_players(guild_id: int, player_ids: list[int]) -> dict[int, int] | None:
+    """Same as get_player, but for a whole list of players at once.
+    All counts are read with a single query, and any players that aren't in
+    the db yet are added with 0 quests in a single insert.
+
+    Args:
+        guild_id (int): The id of the discord guild to look for the players in.
+        player_ids (list[int]): The ids of the players to check.
+
+    Returns:
+        dict[int, int] | None: The amount of quests run, keyed by player id,
+            or None if they couldn't be read.
+    """
+    if not player_ids:
+        return {}
+
+    placeholders = ", ".join("?" * len(player_ids))
+    players_query = f"""
+    SELECT player_id, quests_completed FROM players
+    WHERE
+        guild_id = ?
+    AND
+        player_id IN ({placeholders});
+    """
+    query_return = await _execute_multiple_read_query(players_query, (guild_id, *player_ids))
+    if query_return is None:
+        return None
+    players = {player_id: quests_completed for player_id, quests_completed in query_return}
+
+    missing = [player_id for player_id in dict.fromkeys(player_ids) if player_id not in players]
+    if missing:
+        # Some players don't exist in the db, let's add them all in one go.
+        players_add = f"""
+        INSERT INTO
+            players (
+                guild_id,
+                player_id,
+                quests_completed
+            )
+        VALUES
+            {", ".join(["(?, ?, 0)"] * len(missing))}
+        ON CONFLICT DO NOTHING;
+        """
+        vars = tuple(value for player_id in missing for value in (guild_id, player_id))
+        await _execute_query(players_add, vars)
+        for player_id in missing:
+            players[player_id] = 0
+    return players
+
+
+async def increment_players(guild_id: int, player_ids: list[int]) -> dict[int, int] | None:
+    """Adds one to the amount of quests run for all given players, adding any
+    that aren't in the db yet. This is done in a single statement, so two
+    increments running at the same time can't overwrite each other.
+
+    Args:
+        guild_id (int): The id of the discord guild to look for the players in.
+        player_ids (list[int]): The ids of the players to increment.
+
+    Returns:
+        dict[int, int] | None: The new amount of quests run, keyed by player id,
+            or None if nothing was written.
+    """
+    # Duplicates would make the upsert hit the same row twice.
+    player_ids = list(dict.fromkeys(player_ids))
+    if not player_ids:
+        return {}
+
+    players_increment = f"""
+    INSERT INTO
+        players (
+            guild_id,
+            player_id,
+            quests_completed
+        )
+    VALUES
+        {", ".join(["(?, ?, 1)"] * len(player_ids))}
+    ON CONFLICT (guild_id, player_id) DO UPDATE
+    SET
+        quests_completed = COALESCE(quests_completed, 0) + 1
+    RETURNING player_id, quests_completed;
+    """
+    vars = tuple(value for player_id in player_ids for value in (guild_id, player_id))
+    query_return = await _execute_write_read_query(players_increment, vars)
+    if query_return is None:
+        return None
+    return {player_id: quests_completed for player_id, quests_completed in query_return}
+
+
 async def update_player(guild_id: int, player_id: int, quests_completed: int) -> None:
     """Sets an entry in the db to a specific value.
 
@@ -549,6 +972,266 @@ async def del_receipt_board(board_message_id: int) -> None:
     await _execute_query(receipt_del, (board_message_id,))
 
 
+async def add_rolls(rolls: list[tuple]) -> bool:
+    """Appends a batch of rolls to the roll log, in a single transaction.
+
+    Args:
+        rolls (list[tuple]): The rolls, as (guild_id, user_id, rolled_at, expression, total,
+            dice, d20s, nat20s, nat1s, luck) tuples.
+
+    Returns:
+        bool: Whether or not the rolls were written.
+    """
+    rolls_add = """
+    INSERT INTO
+        rolls (
+            guild_id,
+            user_id,
+            rolled_at,
+            expression,
+            total,
+            dice,
+            d20s,
+            nat20s,
+            nat1s,
+            luck
+        )
+    VALUES
+        (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """
+    # SQLite integers are 64 bit, and a single roll with a bigger total (like
+    # a long chain of *) would fail the whole batch, so those are stored as
+    # the closest REAL instead.
+    rolls = [
+        roll if _INT64_MIN <= roll[4] <= _INT64_MAX else (*roll[:4], _to_real(roll[4]), *roll[5:])
+        for roll in rolls
+    ]
+    async with _write_lock:
+        try:
+            async with _writer.transaction():
+                await _writer.executemany(rolls_add, rolls)
+            return True
+        except Error as e:
+            print(f"The error '{e}' occurred")
+            return False
+
+
+def _to_real(value: int) -> float:
+    """Converts an int to a float, ints too big for a float become infinity."""
+    try:
+        return float(value)
+    except OverflowError:
+        return math.inf if value > 0 else -math.inf
+
+
+async def get_roll_stats(
+    guild_id: int, user_id: int
+) -> tuple[tuple, list[tuple], float | None] | None:
+    """Returns the roll statistics of a user in a guild.
+
+    Args:
+        guild_id (int): The id of the discord guild to look in.
+        user_id (int): The id of the user to get the stats of.
+
+    Returns:
+        tuple[tuple, list[tuple], float | None] | None: The totals as (rolls, average luck,
+            d20s, nat20s, nat1s), the most rolled expressions as (expression, rolls, average,
+            lowest, highest), and the fraction of users in the guild that are less lucky,
+            None if the user has no luck recorded. None if the stats couldn't be read.
+    """
+    totals_get = """
+    SELECT
+        COUNT(*), AVG(luck), SUM(d20s), SUM(nat20s), SUM(nat1s)
+    FROM rolls
+    WHERE
+        guild_id = ?
+    AND
+        user_id = ?;
+    """
+    expressions_get = """
+    SELECT
+        expression, COUNT(*), AVG(total), MIN(total), MAX(total)
+    FROM rolls
+    WHERE
+        guild_id = ?
+    AND
+        user_id = ?
+    GROUP BY expression
+    ORDER BY COUNT(*) DESC
+    LIMIT 5;
+    """
+    luck_rank_get = """
+    SELECT rank FROM (
+        SELECT
+            user_id, PERCENT_RANK() OVER (ORDER BY AVG(luck)) AS rank
+        FROM rolls
+        WHERE
+            guild_id = ?
+        AND
+            luck IS NOT NULL
+        GROUP BY user_id
+    )
+    WHERE user_id = ?;
+    """
+    totals, expressions, luck_rank = await asyncio.gather(
+        _execute_read_query(totals_get, (guild_id, user_id)),
+        _execute_multiple_read_query(expressions_get, (guild_id, user_id)),
+        _execute_read_query(luck_rank_get, (guild_id, user_id)),
+    )
+    if totals is None or expressions is None:
+        return None
+    return tuple(totals), expressions, luck_rank[0] if luck_rank else None
+
+
+async def get_reaction_rules() -> list[ReactionRule]:
+    """Returns every reaction rule in the database.
+
+    Returns:
+        list[ReactionRule]: The rules, in the order they were made.
+    """
+    rules_get = """
+    SELECT
+        id, guild_id, tokens, regex, emoji, cooldown,
+        (
+            SELECT json_group_array(guild_id) FROM disabled_reaction_rules
+            WHERE rule_id = reaction_rules.id
+        )
+    FROM reaction_rules
+    ORDER BY id"""
+    query_return = await _execute_multiple_read_query(rules_get)
+    return [
+        ReactionRule(
+            id, guild_id, json.loads(tokens), regex, emoji, cooldown, json.loads(disabled_guilds)
+        )
+        for id, guild_id, tokens, regex, emoji, cooldown, disabled_guilds in query_return or []
+    ]
+
+
+async def create_reaction_rule(
+    guild_id: int, tokens: list[str], regex: str | None, emoji: str, cooldown: float
+) -> ReactionRule | None:
+    """Adds a reaction rule to the database.
+
+    Args:
+        guild_id (int): The id of the guild the rule is for, 0 for every guild.
+        tokens (list[str]): The tokens that all have to be in a message.
+        regex (str | None): A regex the message also has to match, if any.
+        emoji (str): The emoji to react with.
+        cooldown (float): The least amount of seconds between reactions in a channel.
+
+    Returns:
+        ReactionRule | None: The new rule, or None if it couldn't be added.
+    """
+    rule_add = """
+    INSERT INTO
+        reaction_rules (guild_id, tokens, regex, emoji, cooldown)
+    VALUES
+        (?, ?, ?, ?, ?)
+    RETURNING id;
+    """
+    query_return = await _execute_write_read_query(
+        rule_add, (guild_id, json.dumps(tokens), regex, emoji, cooldown)
+    )
+    if not query_return:
+        return None
+    return ReactionRule(query_return[0][0], guild_id, tokens, regex, emoji, cooldown)
+
+
+async def del_reaction_rule(guild_id: int, rule_id: int) -> bool:
+    """Removes a reaction rule from the db, only if it belongs to the guild.
+
+    Args:
+        guild_id (int): The id of the guild the rule belongs to.
+        rule_id (int): The id of the rule to remove.
+
+    Returns:
+        bool: Whether a rule was removed.
+    """
+    rule_del = "DELETE FROM reaction_rules WHERE id = ? AND guild_id = ? RETURNING id"
+    return bool(await _execute_write_read_query(rule_del, (rule_id, guild_id)))
+
+
+async def set_reaction_rule_disabled(guild_id: int, rule_id: int, disabled: bool) -> bool:
+    """Turns a reaction rule for every guild off or back on for a single guild.
+
+    Args:
+        guild_id (int): The id of the guild.
+        rule_id (int): The id of the rule, which has to be for every guild.
+        disabled (bool): Whether to turn the rule off.
+
+    Returns:
+        bool: Whether it worked, False if there's no such rule for every guild.
+    """
+    if disabled:
+        rule_set = """
+        INSERT INTO
+            disabled_reaction_rules (rule_id, guild_id)
+        SELECT id, ? FROM reaction_rules
+        WHERE
+            id = ?
+        AND
+            guild_id = 0
+        ON CONFLICT DO UPDATE SET guild_id = excluded.guild_id
+        RETURNING rule_id;
+        """
+    else:
+        rule_set = """
+        DELETE FROM disabled_reaction_rules
+        WHERE
+            guild_id = ?
+        AND
+            rule_id = ?
+        RETURNING rule_id;
+        """
+    return bool(await _execute_write_read_query(rule_set, (guild_id, rule_id)))
+
+
+async def load_guild_config() -> None:
+    """Reads every guild setting from the database into guild_config with a
+    single query, after which all setting lookups are served from memory.
+    """
+    config_get = "SELECT guild_id, key, value FROM guild_config"
+    guild_config.load(await _execute_multiple_read_query(config_get) or [])
+
+
+async def set_guild_config(guild_id: int, key: str, value: str | None) -> bool:
+    """Changes a setting of a guild, in the db and in guild_config.
+
+    Args:
+        guild_id (int): The id of the guild.
+        key (str): The setting, one of the keys of GUILD_CONFIG_DEFAULTS.
+        value (str | None): The new value, None to go back to the default.
+
+    Returns:
+        bool: Whether the setting was saved.
+    """
+    if value is None:
+        config_set = "DELETE FROM guild_config WHERE guild_id = ? AND key = ?"
+        vars = (guild_id, key)
+    else:
+        config_set = """
+        INSERT INTO
+            guild_config (guild_id, key, value)
+        VALUES
+            (?, ?, ?)
+        ON CONFLICT (guild_id, key) DO UPDATE SET value = excluded.value;
+        """
+        vars = (guild_id, key, value)
+
+    if not await _execute_query(config_set, vars):
+        return False
+    guild_config.set(guild_id, key, value)
+    return True
+
+
+async def _setup_db() -> None:
+    """Opens the connections, which creates and upgrades the tables,
+    and closes everything again."""
+    await open_pool()
+    await close_pool()
+    print("all done, closing out!")
+
+
 if __name__ == "__main__":
     print("Creating tables if they don't exist")
-    asyncio.run(_create_tables())
+    asyncio.run(_setup_db())
@@ -0,0 +1,1029 @@
+import random
+import re
+import struct
+from collections import defaultdict
+from functools import lru_cache
+from itertools import accumulate
+from math import comb
+from operator import add, sub
+
+# -----------------------STATIC VARS----------------------
+MAX_INPUT_LENGTH = 256
+MAX_DICE = 10000000
+MAX_SIDES = 1000000
+# Terms with more dice than this are rolled in bulk, and only kept as a
+# count of each face instead of a list of every die.
+SUMMARY_THRESHOLD = 100
+# Rolling a term costs roughly its amount of dice, or the smaller of the
+# amount of dice and the amount of sides once it's rolled in bulk. We cap
+# that summed over the whole roll (see _roll_work) to keep rolls fast.
+MAX_ROLL_WORK = 100000
+# An exploding die can't explode more than this many times, so a lucky
+# streak can't keep us rolling forever.
+MAX_EXPLOSIONS = 100
+# Working out odds is refused up front for anything _odds_work expects to
+# take more than this many steps, summed over the whole expression. A step
+# is about one element of a list operation, roughly a tenth of a microsecond,
+# so this keeps it to a few tenths of a second.
+MAX_ODDS_WORK = 2000000
+# Steps per pair of outcomes when multiplying, that loop runs in Python.
+_MULTIPLY_STEPS = 8
+# Exploding dice can in theory go on forever, when working out their odds we
+# stop once another explosion is less likely than this.
+EXPLOSION_CUTOFF = 1e-15
+
+# Rolls in a single batch, one embed can't hold more fields than this.
+MAX_BATCH_ROLLS = 25
+
+# Matches one entry of a batch roll, like "6x 1d20+5 adv".
+_BATCH_ENTRY = re.compile(r"^\s*(?:(\d+)\s*x\s*)?(.*?)(?:\s+(adv|dis))?\s*$", re.IGNORECASE)
+
+# Matches a single token, skipping any whitespace in front of it.
+_TOKEN = re.compile(r"\s*(?:(\d+)|(kh|kl|[dk!r%+\-*()]))")
+
+# The generator used when a roll isn't given one.
+_rng = random.Random()
+
+# Packed roll results, see pack_dice(). Every term starts with a header of
+# (sides, amount of dice, whether it's summarized). Normal terms follow it
+# with every die, summarized ones with (total, 1s, highest faces).
+_TERM_HEADER = struct.Struct("<IIB")
+_TERM_SUMMARY = struct.Struct("<QII")
+_DROPPED = 1 << 31
+
+
+# -----------------------ERRORS---------------------------
+class DiceError(ValueError):
+    # Raised for any roll we can't or won't do, the message is meant to be
+    # shown directly to the user.
+    pass
+
+
+# ---------------------HOLDER CLASSES---------------------
+class DieResults:
+    # The outcome of a single dice term (like 4d6kh3) in a roll. Small terms
+    # keep every die in result (with kept marking dice not dropped by kh/kl),
+    # large ones only keep a histogram of how many kept dice landed on each
+    # face, and leave result and kept empty.
+    def __init__(
+        self,
+        notation: str,
+        sides: int,
+        result: list[int],
+        kept: list[bool],
+        histogram: dict[int, int] | None = None,
+    ) -> None:
+        self.notation = notation
+        self.sides = sides
+        self.result = result
+        self.kept = kept
+        self.histogram = histogram
+
+    @property
+    def summarized(self) -> bool:
+        return self.histogram is not None
+
+    @property
+    def total(self) -> int:
+        if self.histogram is not None:
+            return sum(face * count for face, count in self.histogram.items())
+        return sum(value for value, kept in zip(self.result, self.kept) if kept)
+
+    @property
+    def count(self) -> int:
+        """The amount of kept dice."""
+        if self.histogram is not None:
+            return sum(self.histogram.values())
+        return sum(self.kept)
+
+    @property
+    def minimum(self) -> int:
+        """The lowest kept die."""
+        if self.histogram is not None:
+            return min(self.histogram)
+        return min(value for value, kept in zip(self.result, self.kept) if kept)
+
+    @property
+    def maximum(self) -> int:
+        """The highest kept die."""
+        if self.histogram is not None:
+            return max(self.histogram)
+        return max(value for value, kept in zip(self.result, self.kept) if kept)
+
+
+class Distribution:
+    # The exact probability of every possible outcome of a roll, probs[i]
+    # being the chance of rolling low + i.
+    __slots__ = ("low", "probs")
+
+    def __init__(self, low: int, probs: list[float]) -> None:
+        self.low = low
+        self.probs = probs
+
+    @property
+    def high(self) -> int:
+        return self.low + len(self.probs) - 1
+
+    @property
+    def mean(self) -> float:
+        return sum((self.low + i) * p for i, p in enumerate(self.probs))
+
+    def percentile(self, fraction: float) -> int:
+        """Returns the lowest outcome that at least the given fraction of rolls
+        will be at or below.
+
+        Args:
+            fraction (float): The fraction, between 0 and 1.
+
+        Returns:
+            int: The outcome.
+        """
+        cumulative = 0.0
+        for i, p in enumerate(self.probs):
+            cumulative += p
+            # Allow for a little rounding error in the sum.
+            if cumulative >= fraction - 1e-12:
+                return self.low + i
+        return self.high
+
+    def at_least(self, target: int) -> float:
+        """Returns the chance of rolling target or higher."""
+        return min(1.0, sum(self.probs[max(0, target - self.low) :]))
+
+    def rank(self, outcome: int) -> float:
+        """Returns how lucky a result is, as the chance of rolling below it
+        plus half the chance of rolling exactly it. An average roll gets
+        about 0.5, no matter how the outcomes are spread.
+
+        Args:
+            outcome (int): The rolled total.
+
+        Returns:
+            float: The rank, between 0 and 1.
+        """
+        index = min(max(outcome - self.low, 0), len(self.probs))
+        below = sum(self.probs[:index])
+        exact = self.probs[index] if index < len(self.probs) else 0.0
+        return min(1.0, below + exact / 2)
+
+
+class RollResult:
+    # The outcome of a full roll, the total along with every dice term that
+    # was rolled to get there.
+    def __init__(self, total: int, dice: list[DieResults], modifiers: list[int]) -> None:
+        self.total = total
+        self.dice = dice
+        self.modifiers = modifiers
+
+
+# ------------------------AST NODES-----------------------
+class Number:
+    __slots__ = ("value",)
+
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+    def evaluate(self, rng: random.Random, dice: list[DieResults]) -> int:
+        return self.value
+
+    def distribution(self) -> Distribution:
+        return Distribution(self.value, [1.0])
+
+    def __str__(self) -> str:
+        return str(self.value)
+
+
+class Dice:
+    __slots__ = ("amount", "sides", "keep_highest", "keep_lowest", "explode", "reroll")
+
+    def __init__(
+        self,
+        amount: int,
+        sides: int,
+        keep_highest: int | None = None,
+        keep_lowest: int | None = None,
+        explode: bool = False,
+        reroll: int | None = None,
+    ) -> None:
+        self.amount = amount
+        self.sides = sides
+        self.keep_highest = keep_highest
+        self.keep_lowest = keep_lowest
+        self.explode = explode
+        self.reroll = reroll
+
+    def evaluate(self, rng: random.Random, dice: list[DieResults]) -> int:
+        if self.amount > SUMMARY_THRESHOLD:
+            rolled = DieResults(str(self), self.sides, [], [], self._roll_bulk(rng))
+            dice.append(rolled)
+            return rolled.total
+
+        result = []
+        for _ in range(self.amount):
+            value = rng.randint(1, self.sides)
+            # Rerolls happen once, and we keep the new value no matter what.
+            if self.reroll is not None and value <= self.reroll:
+                value = rng.randint(1, self.sides)
+            result.append(value)
+
+            # Exploding dice add another die every time they roll max.
+            if self.explode:
+                explosions = 0
+                while value == self.sides and explosions < MAX_EXPLOSIONS:
+                    value = rng.randint(1, self.sides)
+                    result.append(value)
+                    explosions += 1
+
+        kept = [True] * len(result)
+        if self.keep_highest is not None or self.keep_lowest is not None:
+            # Sort indexes by value so we know which dice to drop, ties are
+            # dropped left to right.
+            order = sorted(range(len(result)), key=result.__getitem__)
+            if self.keep_highest is not None:
+                dropped = order[: len(result) - self.keep_highest]
+            else:
+                dropped = order[self.keep_lowest :]
+            for index in dropped:
+                kept[index] = False
+
+        rolled = DieResults(str(self), self.sides, result, kept)
+        dice.append(rolled)
+        return rolled.total
+
+    def distribution(self) -> Distribution:
+        return _dice_distribution(
+            self.amount, self.sides, self.keep_highest, self.keep_lowest, self.explode, self.reroll
+        )
+
+    def _roll_bulk(self, rng: random.Random) -> dict[int, int]:
+        """Rolls the dice as a histogram instead of one by one, applying the
+        same rerolls, explosions and keeps as the normal path.
+
+        Returns:
+            dict[int, int]: How many kept dice landed on each face.
+        """
+        counts = _roll_counts(rng, self.amount, self.sides)
+
+        if self.reroll is not None:
+            low = [face for face in counts if face <= self.reroll]
+            rerolls = sum(counts.pop(face) for face in low)
+            _merge_counts(counts, _roll_counts(rng, rerolls, self.sides))
+
+        if self.explode:
+            explosions = 0
+            new_max = counts.get(self.sides, 0)
+            while new_max and explosions < MAX_EXPLOSIONS:
+                extra = _roll_counts(rng, new_max, self.sides)
+                _merge_counts(counts, extra)
+                new_max = extra.get(self.sides, 0)
+                explosions += 1
+
+        if self.keep_highest is not None or self.keep_lowest is not None:
+            if self.keep_highest is not None:
+                keep = self.keep_highest
+                faces = sorted(counts, reverse=True)
+            else:
+                keep = self.keep_lowest
+                faces = sorted(counts)
+            kept = {}
+            for face in faces:
+                if keep == 0:
+                    break
+                kept[face] = min(counts[face], keep)
+                keep -= kept[face]
+            counts = kept
+        return counts
+
+    def __str__(self) -> str:
+        notation = f"{self.amount}d{self.sides}"
+        if self.reroll is not None:
+            notation += f"r{self.reroll}"
+        if self.explode:
+            notation += "!"
+        if self.keep_highest is not None:
+            notation += f"kh{self.keep_highest}"
+        if self.keep_lowest is not None:
+            notation += f"kl{self.keep_lowest}"
+        return notation
+
+
+class Negate:
+    __slots__ = ("operand",)
+
+    def __init__(self, operand) -> None:
+        self.operand = operand
+
+    def evaluate(self, rng: random.Random, dice: list[DieResults]) -> int:
+        return -self.operand.evaluate(rng, dice)
+
+    def distribution(self) -> Distribution:
+        operand = self.operand.distribution()
+        return Distribution(-operand.high, operand.probs[::-1])
+
+    def __str__(self) -> str:
+        return f"-{self.operand}"
+
+
+class BinaryOp:
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op: str, left, right) -> None:
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def evaluate(self, rng: random.Random, dice: list[DieResults]) -> int:
+        left = self.left.evaluate(rng, dice)
+        right = self.right.evaluate(rng, dice)
+        if self.op == "+":
+            return left + right
+        if self.op == "-":
+            return left - right
+        return left * right
+
+    def distribution(self) -> Distribution:
+        left = self.left.distribution()
+        right = self.right.distribution()
+        if self.op == "+":
+            return Distribution(left.low + right.low, _convolve(left.probs, right.probs))
+        if self.op == "-":
+            return Distribution(left.low - right.high, _convolve(left.probs, right.probs[::-1]))
+        return _multiply(left, right)
+
+    def __str__(self) -> str:
+        return f"({self.left}{self.op}{self.right})"
+
+
+# -------------------------PARSER-------------------------
+class _Parser:
+    # A small recursive descent parser for the grammar:
+    #   expr   := term (("+" | "-") term)*
+    #   term   := unary ("*" unary)*
+    #   unary  := ("-" | "+") unary | atom
+    #   atom   := dice | NUMBER | "(" expr ")"
+    #   dice   := NUMBER? "d" (NUMBER | "%") modifier*
+    #   modifier := "kh" NUMBER? | "kl" NUMBER? | "k" NUMBER | "!" | "r" NUMBER
+    def __init__(self, expression: str) -> None:
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def peek(self) -> str | None:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def next(self) -> str | None:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def number(self) -> int:
+        token = self.next()
+        if token is None or not token.isdigit():
+            raise DiceError("Sorry, I couldn't understand your roll, please try again")
+        return int(token)
+
+    def optional_number(self, default: int) -> int:
+        token = self.peek()
+        if token is not None and token.isdigit():
+            return self.number()
+        return default
+
+    def parse(self):
+        node = self.expr()
+        if self.peek() is not None:
+            raise DiceError("Sorry, I couldn't understand your roll, please try again")
+        return node
+
+    def expr(self):
+        node = self.term()
+        while self.peek() in ("+", "-"):
+            node = BinaryOp(self.next(), node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek() == "*":
+            self.next()
+            node = BinaryOp("*", node, self.unary())
+        return node
+
+    def unary(self):
+        token = self.peek()
+        if token == "-":
+            self.next()
+            return Negate(self.unary())
+        if token == "+":
+            self.next()
+            return self.unary()
+        return self.atom()
+
+    def atom(self):
+        token = self.peek()
+        if token == "(":
+            self.next()
+            node = self.expr()
+            if self.next() != ")":
+                raise DiceError("Sorry, I couldn't understand your roll, please try again")
+            return node
+        if token == "d":
+            return self.dice(1)
+        amount = self.number()
+        if self.peek() == "d":
+            return self.dice(amount)
+        return Number(amount)
+
+    def dice(self, amount: int) -> Dice:
+        self.next()  # The "d".
+        if self.peek() == "%":
+            self.next()
+            sides = 100
+        else:
+            sides = self.number()
+
+        if sides == 0:
+            raise DiceError("I can't roll a die with zero sides...")
+        if amount == 0:
+            raise DiceError("I can't roll zero dice")
+        if amount > MAX_DICE:
+            raise DiceError(f"You can only roll up to {MAX_DICE:,} die of each type")
+        if sides > MAX_SIDES:
+            raise DiceError(
+                "You can only roll dice with up to a million sides, you seriously don't need more than that"
+            )
+
+        die = Dice(amount, sides)
+        while self.peek() in ("kh", "kl", "k", "!", "r"):
+            modifier = self.next()
+            if modifier in ("kh", "kl", "k"):
+                if die.keep_highest is not None or die.keep_lowest is not None:
+                    raise DiceError("You can only keep dice once per roll")
+                if modifier == "k":
+                    keep = self.number()
+                else:
+                    keep = self.optional_number(1)
+                if keep == 0 or keep > amount:
+                    raise DiceError(
+                        f"You can only keep between 1 and {amount} dice in {amount}d{sides}"
+                    )
+                if modifier == "kl":
+                    die.keep_lowest = keep
+                else:
+                    die.keep_highest = keep
+            elif modifier == "!":
+                if sides == 1:
+                    raise DiceError("A one sided die would explode forever, please don't")
+                die.explode = True
+            else:
+                reroll = self.number()
+                if reroll >= sides:
+                    raise DiceError(f"Rerolling {reroll} or lower on a d{sides} would never stop")
+                die.reroll = reroll
+        return die
+
+
+def _roll_counts(rng: random.Random, amount: int, sides: int) -> dict[int, int]:
+    """Rolls a bunch of identical dice and counts how many landed on each face.
+    With fewer dice than sides we just roll them, otherwise we draw the count
+    for one face at a time from a binomial distribution, which gives exactly
+    the same distribution in time that only depends on the number of sides.
+
+    Args:
+        rng (random.Random): The random generator to roll with.
+        amount (int): The amount of dice to roll.
+        sides (int): The amount of sides on each die.
+
+    Returns:
+        dict[int, int]: How many dice landed on each face, faces that didn't come up are left out.
+    """
+    counts: dict[int, int] = {}
+    if amount < sides:
+        for value in rng.choices(range(1, sides + 1), k=amount):
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    remaining = amount
+    for face in range(1, sides):
+        if remaining == 0:
+            break
+        # Each remaining die is equally likely to be any of the faces left.
+        count = rng.binomialvariate(remaining, 1 / (sides - face + 1))
+        if count:
+            counts[face] = count
+            remaining -= count
+    if remaining:
+        counts[sides] = remaining
+    return counts
+
+
+def _merge_counts(counts: dict[int, int], extra: dict[int, int]) -> None:
+    """Adds the counts in extra to counts."""
+    for face, count in extra.items():
+        counts[face] = counts.get(face, 0) + count
+
+
+def _too_complicated() -> DiceError:
+    return DiceError("Sorry, that roll is too complicated for me to work out the odds of")
+
+
+def _convolve(a: list[float], b: list[float]) -> list[float]:
+    """Returns the distribution of the sum of two independent distributions.
+
+    Args:
+        a (list[float]): The probabilities of the first distribution.
+        b (list[float]): The probabilities of the second distribution.
+
+    Returns:
+        list[float]: The probabilities of the sum, starting at the sum of both lowest values.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    result = [0.0] * (len(a) + len(b) - 1)
+    # Loop over the shorter one, and add a scaled copy of the longer one for
+    # each of its values (the map calls keep the inner loop in C).
+    for i, p in enumerate(b):
+        if p:
+            result[i : i + len(a)] = map(add, result[i : i + len(a)], map(p.__mul__, a))
+    return result
+
+
+def _multiply(left: Distribution, right: Distribution) -> Distribution:
+    """Returns the distribution of the product of two independent distributions."""
+    products: dict[int, float] = defaultdict(float)
+    for i, p in enumerate(left.probs):
+        for j, q in enumerate(right.probs):
+            products[(left.low + i) * (right.low + j)] += p * q
+    low = min(products)
+    probs = [0.0] * (max(products) - low + 1)
+    for value, p in products.items():
+        probs[value - low] = p
+    return Distribution(low, probs)
+
+
+def _die_pmf(sides: int, explode: bool, reroll: int | None) -> list[float]:
+    """Returns the chance of each value of a single die, with rerolls and
+    explosions applied. Index 0 is a roll of 1.
+    """
+    pmf = [1 / sides] * sides
+    if reroll is not None:
+        # Rolls at or below the reroll value get replaced by a fresh roll.
+        pmf = [(value > reroll) / sides + reroll / sides**2 for value in range(1, sides + 1)]
+
+    if explode:
+        # Build the value of an exploding die from the last explosion we care
+        # about backwards, each level being a plain roll that adds the next
+        # level on a max.
+        fresh = [1 / sides] * sides
+        for _ in range(_explosion_depth(sides)):
+            fresh = [1 / sides] * (sides - 1) + [0.0] + [p / sides for p in fresh]
+        # The first roll can be rerolled, the explosions can't.
+        pmf = pmf[:-1] + [0.0] + [pmf[-1] * p for p in fresh]
+    return pmf
+
+
+def _explosion_depth(sides: int) -> int:
+    """Returns how many explosions of a die _die_pmf follows."""
+    depth = 1
+    while (1 / sides) ** depth > EXPLOSION_CUTOFF and depth < MAX_EXPLOSIONS:
+        depth += 1
+    return depth
+
+
+def _power(pmf: list[float], amount: int) -> list[float]:
+    """Returns the distribution of the sum of amount dice with the given pmf,
+    by repeated squaring.
+    """
+    result = [1.0]
+    while amount:
+        if amount & 1:
+            result = _convolve(result, pmf)
+        amount >>= 1
+        if amount:
+            pmf = _convolve(pmf, pmf)
+    return result
+
+
+def _uniform_sum(amount: int, sides: int) -> list[float]:
+    """Returns the distribution of the sum of amount plain dice. Adding a die
+    is a sliding window sum over the previous probabilities, so each die
+    only costs a single pass over them.
+    """
+    probs = [1.0]
+    scale = 1 / sides
+    for _ in range(amount):
+        prefix = [0.0, *accumulate(probs)]
+        # The chance of each new sum is the chance that the sum before this
+        # die was within sides of it, which is a difference of the running
+        # sum (the window is cut short at both ends).
+        upper = prefix[1:] + [prefix[-1]] * (sides - 1)
+        lower = [0.0] * (sides - 1) + prefix[:-1]
+        probs = list(map(scale.__mul__, map(sub, upper, lower)))
+    # Differences of the running sum can come out a hair below zero.
+    return [p if p > 0 else 0.0 for p in probs]
+
+
+def _keep_distribution(
+    pmf: list[float], amount: int, keep: int, highest: bool
+) -> dict[int, float]:
+    """Returns the distribution of the sum of the keep highest (or lowest) of
+    amount dice. Goes through the faces from best to worst, tracking how
+    many dice landed on the faces so far and the sum of the kept ones. Once
+    enough dice are kept the rest only have to land on the worse faces.
+    """
+    faces = [(value, p) for value, p in enumerate(pmf, 1) if p]
+    if highest:
+        faces.reverse()
+
+    result: dict[int, float] = defaultdict(float)
+    states: dict[tuple[int, int], float] = {(0, 0): 1.0}
+    remaining = 1.0
+    for value, p in faces:
+        remaining = max(0.0, remaining - p)
+        new_states: dict[tuple[int, int], float] = defaultdict(float)
+        for (used, total), weight in states.items():
+            left = amount - used
+            for count in range(left + 1):
+                chance = weight * comb(left, count) * p**count
+                if not chance:
+                    continue
+                kept_total = total + value * min(count, keep - used)
+                if used + count >= keep:
+                    result[kept_total] += chance * remaining ** (left - count)
+                else:
+                    new_states[(used + count, kept_total)] += chance
+        states = new_states
+    return result
+
+
+@lru_cache(maxsize=256)
+def _dice_distribution(
+    amount: int,
+    sides: int,
+    keep_highest: int | None,
+    keep_lowest: int | None,
+    explode: bool,
+    reroll: int | None,
+) -> Distribution:
+    """Returns the distribution of a single dice term, cached since the same
+    terms come up all the time.
+    """
+    if keep_highest is None and keep_lowest is None:
+        if not explode and reroll is None:
+            return Distribution(amount, _uniform_sum(amount, sides))
+        return Distribution(amount, _power(_die_pmf(sides, explode, reroll), amount))
+
+    # With exploding dice the amount of dice to keep from isn't fixed.
+    if explode:
+        raise DiceError("Sorry, I can't work out the odds of keeping exploding dice")
+    pmf = _die_pmf(sides, explode, reroll)
+    if keep_highest is not None:
+        sums = _keep_distribution(pmf, amount, keep_highest, True)
+    else:
+        sums = _keep_distribution(pmf, amount, keep_lowest, False)
+    low = min(sums)
+    probs = [0.0] * (max(sums) - low + 1)
+    for total, p in sums.items():
+        probs[total - low] = p
+    return Distribution(low, probs)
+
+
+def _tokenize(expression: str) -> list[str]:
+    """Splits a dice expression into tokens.
+
+    Args:
+        expression (str): The expression to split, should already be lower case.
+
+    Returns:
+        list[str]: The tokens.
+    """
+    tokens = []
+    pos = 0
+    end = len(expression.rstrip())
+    while pos < end:
+        match = _TOKEN.match(expression, pos)
+        if match is None:
+            raise DiceError("Sorry, I couldn't understand your roll, please try again")
+        tokens.append(match.group(1) or match.group(2))
+        pos = match.end()
+    return tokens
+
+
+@lru_cache(maxsize=1024)
+def parse(expression: str, advantage: str | None = None):
+    """Parses a dice expression (like 4d6kh3+2) into a tree that can be rolled
+    with roll(). The trees are cached, so parsing the same expression again
+    is free.
+
+    Args:
+        expression (str): The dice expression.
+        advantage (str, optional): "adv" or "dis" to roll every plain d20 in the
+            expression with advantage or disadvantage. Defaults to None.
+
+    Raises:
+        DiceError: If the expression is invalid or too large.
+
+    Returns:
+        The root node of the parsed expression.
+    """
+    if advantage is not None:
+        tree = parse(expression)
+        advantage_tree = _apply_advantage(tree, advantage == "adv")
+        if str(advantage_tree) == str(tree):
+            raise DiceError("Advantage and disadvantage only work on rolls with a plain 1d20")
+        return advantage_tree
+    if len(expression) > MAX_INPUT_LENGTH:
+        raise DiceError(f"Input can only be up to {MAX_INPUT_LENGTH} characters")
+    tree = _Parser(expression.lower()).parse()
+    if _roll_work(tree) > MAX_ROLL_WORK:
+        raise DiceError("That's a lot of dice with a lot of sides, please try a smaller roll")
+    return tree
+
+
+def parse_batch(text: str) -> list[tuple[int, str, str | None]]:
+    """Splits a batch roll (like "6x 1d20+5 adv, 2x 2d6+3") into its entries.
+
+    Args:
+        text (str): The batch, entries separated by commas or semicolons.
+
+    Raises:
+        DiceError: If the batch is invalid, has too many rolls or would take too long to roll.
+
+    Returns:
+        list[tuple[int, str, str | None]]: (times to roll, expression, "adv"/"dis"/None) for
+            each entry, the expressions are checked but not rolled.
+    """
+    if len(text) > MAX_INPUT_LENGTH:
+        raise DiceError(f"Input can only be up to {MAX_INPUT_LENGTH} characters")
+    entries = []
+    work = 0
+    for entry in re.split(r"[,;]", text):
+        match = _BATCH_ENTRY.match(entry)
+        times = int(match.group(1) or 1)
+        expression = match.group(2)
+        advantage = match.group(3).lower() if match.group(3) else None
+        if times == 0:
+            raise DiceError("I can't roll something zero times")
+        # Check the expression now so errors show up before anything is rolled.
+        work += times * _roll_work(parse(expression, advantage))
+        entries.append((times, expression, advantage))
+
+    if sum(times for times, _, _ in entries) > MAX_BATCH_ROLLS:
+        raise DiceError(f"You can only roll up to {MAX_BATCH_ROLLS} things in one batch")
+    # The whole batch gets the same budget as a single roll.
+    if work > MAX_ROLL_WORK:
+        raise DiceError("That's a lot of dice with a lot of sides, please try a smaller batch")
+    return entries
+
+
+def roll(
+    expression: str,
+    rng: random.Random | None = None,
+    seed: int | None = None,
+    advantage: str | None = None,
+) -> RollResult:
+    """Parses and rolls a dice expression.
+
+    Args:
+        expression (str): The dice expression.
+        rng (random.Random, optional): The random generator to roll with.
+            Defaults to a shared unseeded one.
+        seed (int, optional): If given (and rng isn't), roll with a new generator seeded with
+            this, so the same seed always gives the same roll. Defaults to None.
+        advantage (str, optional): "adv" or "dis" to roll every plain d20 in the
+            expression with advantage or disadvantage. Defaults to None.
+
+    Raises:
+        DiceError: If the expression is invalid or too large.
+
+    Returns:
+        RollResult: The total, along with all dice rolled.
+    """
+    if rng is None:
+        rng = _rng if seed is None else random.Random(seed)
+    tree = parse(expression, advantage)
+    dice: list[DieResults] = []
+    total = tree.evaluate(rng, dice)
+    return RollResult(total, dice, _flat_modifiers(tree))
+
+
+def odds(expression: str, max_work: int = MAX_ODDS_WORK) -> Distribution:
+    """Works out the exact chance of every outcome of a dice expression.
+    Results are cached by the parsed expression, as are the distributions of
+    the individual dice terms, so common rolls like 1d20 or 4d6kh3 are only
+    worked out once however they're typed.
+
+    Args:
+        expression (str): The dice expression.
+        max_work (int, optional): Refuse expressions that would take more steps
+            than this, see _odds_work. Defaults to MAX_ODDS_WORK.
+
+    Raises:
+        DiceError: If the expression is invalid, or too complicated to work out.
+
+    Returns:
+        Distribution: The chance of every possible outcome.
+    """
+    result = _odds(str(parse(expression)), max_work)
+    if isinstance(result, str):
+        raise DiceError(result)
+    return result
+
+
+@lru_cache(maxsize=256)
+def _odds(expression: str, max_work: int) -> Distribution | str:
+    """Does the work of odds() for a parsed expression. Expressions that can't
+    be worked out are cached too, as the message to raise.
+    """
+    tree = parse(expression)
+    try:
+        if _odds_work(tree)[0] > max_work:
+            raise _too_complicated()
+        return tree.distribution()
+    except DiceError as e:
+        return str(e)
+
+
+def pack_dice(dice: list[DieResults]) -> bytes:
+    """Packs the dice of a roll into bytes for storage, 4 bytes per die for
+    normal terms (with dropped dice flagged by the top bit). Summarized terms
+    can have a million faces, so only their total and how many dice landed on
+    1 and on the highest face are kept.
+
+    Args:
+        dice (list[DieResults]): The dice terms of a roll.
+
+    Returns:
+        bytes: The packed dice, unpack them with unpack_dice().
+    """
+    packed = bytearray()
+    for rolled in dice:
+        if rolled.histogram is not None:
+            packed += _TERM_HEADER.pack(rolled.sides, rolled.count, 1)
+            highest = rolled.histogram.get(rolled.sides, 0) if rolled.sides > 1 else 0
+            packed += _TERM_SUMMARY.pack(rolled.total, rolled.histogram.get(1, 0), highest)
+        else:
+            packed += _TERM_HEADER.pack(rolled.sides, len(rolled.result), 0)
+            flat = [
+                value if kept else value | _DROPPED
+                for value, kept in zip(rolled.result, rolled.kept)
+            ]
+            packed += struct.pack(f"<{len(flat)}I", *flat)
+    return bytes(packed)
+
+
+def unpack_dice(packed: bytes) -> list[DieResults]:
+    """Reverses pack_dice(). The original notation isn't stored, so the terms
+    are named after the amount of dice and sides. Summarized terms get back
+    the same amount of dice, total, 1s and highest faces, with the rest of
+    the dice spread as evenly as possible over the faces in between.
+
+    Args:
+        packed (bytes): The packed dice.
+
+    Returns:
+        list[DieResults]: The dice terms of the roll.
+    """
+    dice = []
+    pos = 0
+    while pos < len(packed):
+        sides, amount, summarized = _TERM_HEADER.unpack_from(packed, pos)
+        pos += _TERM_HEADER.size
+        if summarized:
+            total, ones, highest = _TERM_SUMMARY.unpack_from(packed, pos)
+            pos += _TERM_SUMMARY.size
+            histogram = {1: ones}
+            histogram[sides] = histogram.get(sides, 0) + highest
+            rest = amount - ones - highest
+            if rest:
+                face, above = divmod(total - ones - highest * sides, rest)
+                histogram[face] = histogram.get(face, 0) + rest - above
+                histogram[face + 1] = histogram.get(face + 1, 0) + above
+            histogram = {face: count for face, count in sorted(histogram.items()) if count}
+            dice.append(DieResults(f"{amount}d{sides}", sides, [], [], histogram))
+        else:
+            flat = struct.unpack_from(f"<{amount}I", packed, pos)
+            pos += amount * 4
+            result = [value & ~_DROPPED for value in flat]
+            kept = [not value & _DROPPED for value in flat]
+            dice.append(DieResults(f"{amount}d{sides}", sides, result, kept))
+    return dice
+
+
+def _roll_work(node) -> int:
+    """Returns roughly how much work rolling an expression tree takes, summed
+    over all of its dice terms, in the same units as MAX_ROLL_WORK.
+    """
+    if isinstance(node, Dice):
+        if node.amount > SUMMARY_THRESHOLD:
+            work = min(node.amount, node.sides)
+        else:
+            work = node.amount
+        # Rerolls and explosions each take up to another roll of the term.
+        return work * (1 + (node.reroll is not None) + node.explode)
+    if isinstance(node, Negate):
+        return _roll_work(node.operand)
+    if isinstance(node, BinaryOp):
+        return _roll_work(node.left) + _roll_work(node.right)
+    return 0
+
+
+def _odds_work(node) -> tuple[int, int, int]:
+    """Estimates the steps it takes to work out the odds of an expression tree
+    without working anything out, so too complicated expressions are refused
+    before they cost anything.
+
+    Returns:
+        tuple[int, int, int]: The steps, followed by the lowest and highest outcome.
+    """
+    if isinstance(node, Dice):
+        return _dice_work(node)
+    if isinstance(node, Negate):
+        work, low, high = _odds_work(node.operand)
+        return work + high - low + 1, -high, -low
+    if isinstance(node, BinaryOp):
+        left_work, left_low, left_high = _odds_work(node.left)
+        right_work, right_low, right_high = _odds_work(node.right)
+        work = left_work + right_work
+        pairs = (left_high - left_low + 1) * (right_high - right_low + 1)
+        if node.op == "+":
+            return work + pairs, left_low + right_low, left_high + right_high
+        if node.op == "-":
+            return work + pairs, left_low - right_high, left_high - right_low
+        corners = [
+            a * b for a in (left_low, left_high) for b in (right_low, right_high)
+        ]
+        low, high = min(corners), max(corners)
+        return work + pairs * _MULTIPLY_STEPS + high - low + 1, low, high
+    return 0, node.value, node.value
+
+
+def _dice_work(node: Dice) -> tuple[int, int, int]:
+    """_odds_work for a single dice term, following _dice_distribution."""
+    amount, sides = node.amount, node.sides
+    keep = node.keep_highest or node.keep_lowest
+    if keep is not None:
+        # Faces, times states (dice used and kept sums), times dice per face.
+        return sides * sides * amount * amount * keep, keep, keep * sides
+    if not node.explode and node.reroll is None:
+        # A pass over the sums so far for every die.
+        return amount * (amount * sides + sides), amount, amount * sides
+
+    work = sides
+    length = sides
+    if node.explode:
+        # Every level of explosions is one die longer than the one before.
+        depth = _explosion_depth(sides)
+        work += sides * (depth + 1) * (depth + 2) // 2
+        length = sides * (depth + 2)
+    # Follow the convolutions of _power.
+    result_length = 1
+    while amount:
+        if amount & 1:
+            work += result_length * length
+            result_length += length - 1
+        amount >>= 1
+        if amount:
+            work += length * length
+            length += length - 1
+    return work, node.amount, node.amount + result_length - 1
+
+
+def _apply_advantage(node, highest: bool):
+    """Returns a copy of an expression tree where every plain 1d20 is replaced
+    by 2d20kh1 (or 2d20kl1 if highest is False).
+    """
+    if isinstance(node, Dice):
+        plain = (
+            node.keep_highest is None
+            and node.keep_lowest is None
+            and not node.explode
+            and node.reroll is None
+        )
+        if node.amount == 1 and node.sides == 20 and plain:
+            if highest:
+                return Dice(2, 20, keep_highest=1)
+            return Dice(2, 20, keep_lowest=1)
+        return node
+    if isinstance(node, Negate):
+        return Negate(_apply_advantage(node.operand, highest))
+    if isinstance(node, BinaryOp):
+        return BinaryOp(
+            node.op, _apply_advantage(node.left, highest), _apply_advantage(node.right, highest)
+        )
+    return node
+
+
+def _flat_modifiers(node) -> list[int]:
+    """Returns the plain numbers added or subtracted at the top level of an
+    expression, which is what we show as modifiers.
+    """
+    if isinstance(node, Number):
+        return [node.value]
+    if isinstance(node, Negate) and isinstance(node.operand, Number):
+        return [-node.operand.value]
+    if isinstance(node, BinaryOp) and node.op in ("+", "-"):
+        right = _flat_modifiers(node.right)
+        if node.op == "-":
+            right = [-value for value in right]
+        return _flat_modifiers(node.left) + right
+    return []
@@ -0,0 +1,188 @@
+import io
+
+import discord
+
+# -----------------------STATIC VARS----------------------
+# Discord's limits for embeds, see
+# https://discord.com/developers/docs/resources/message#embed-object-embed-limits
+TITLE_LIMIT = 256
+DESCRIPTION_LIMIT = 4096
+FIELD_COUNT_LIMIT = 25
+FIELD_NAME_LIMIT = 256
+FIELD_VALUE_LIMIT = 1024
+FOOTER_LIMIT = 2048
+AUTHOR_NAME_LIMIT = 256
+TOTAL_LIMIT = 6000
+
+# Results needing more messages than this are sent as a text file instead.
+MAX_PAGES = 5
+
+
+# ---------------------HOLDER CLASSES---------------------
+class _Page:
+    # The contents of a single embed.
+    def __init__(self, title: str, base_length: int) -> None:
+        self.title = title
+        self.description = ""
+        self.fields: list[tuple[str, str, bool]] = []
+        self.length = base_length + len(title)
+
+
+# -----------------------MAIN CLASS-----------------------
+class EmbedBuilder:
+    # Builds embeds while keeping track of all of Discord's size limits as
+    # things are added. Anything that doesn't fit goes on another page
+    # (another embed), so the result can always be sent.
+    def __init__(
+        self,
+        title: str,
+        color: int | discord.Color,
+        author: discord.User | discord.Member | None = None,
+        footer: str | None = None,
+    ) -> None:
+        self.title = _truncate(title, TITLE_LIMIT)
+        self.color = color
+        self.author = author
+        self.author_name = _truncate(author.display_name, AUTHOR_NAME_LIMIT) if author else ""
+        self.footer = _truncate(footer, FOOTER_LIMIT) if footer else None
+        # The author and footer are repeated on every page.
+        self._base_length = len(self.author_name) + len(self.footer or "")
+        self.pages: list[_Page] = [_Page(self.title, self._base_length)]
+
+    @property
+    def length(self) -> int:
+        """The amount of characters Discord counts for the current page."""
+        return self.pages[-1].length
+
+    def _new_page(self) -> _Page:
+        title = _truncate(self.title, TITLE_LIMIT - len(" (continued)")) + " (continued)"
+        self.pages.append(_Page(title, self._base_length))
+        return self.pages[-1]
+
+    def add_line(self, line: str) -> None:
+        """Adds a line of text to the description.
+
+        Args:
+            line (str): The line to add, without a trailing newline.
+        """
+        line += "\n"
+        while line:
+            page = self.pages[-1]
+            room = min(DESCRIPTION_LIMIT - len(page.description), TOTAL_LIMIT - page.length)
+            if page.fields or (len(line) > room and page.description):
+                # Doesn't fit after what's already there, start over on a new page.
+                page = self._new_page()
+                room = min(DESCRIPTION_LIMIT, TOTAL_LIMIT - page.length)
+            # Lines too long for even an empty page continue on the next one.
+            chunk, line = line[:room], line[room:]
+            page.description += chunk
+            page.length += len(chunk)
+
+    def add_field(self, name: str, value: str, inline: bool = False) -> None:
+        """Adds a field, values that are too long are split over several fields.
+
+        Args:
+            name (str): The name of the field.
+            value (str): The value of the field.
+            inline (bool, optional): Whether the field is inline. Defaults to False.
+        """
+        name = _truncate(str(name), FIELD_NAME_LIMIT) or "​"
+        for index, chunk in enumerate(_split(str(value), FIELD_VALUE_LIMIT)):
+            if index > 0:
+                name = _truncate(name, FIELD_NAME_LIMIT - len(" (cont.)")) + " (cont.)"
+            page = self.pages[-1]
+            length = len(name) + len(chunk)
+            if len(page.fields) >= FIELD_COUNT_LIMIT or page.length + length > TOTAL_LIMIT:
+                page = self._new_page()
+            page.fields.append((name, chunk, inline))
+            page.length += length
+
+    def build(self) -> list[discord.Embed]:
+        """Returns the embeds, one per page."""
+        embeds = []
+        for page in self.pages:
+            embed = discord.Embed(
+                title=page.title, description=page.description or None, color=self.color
+            )
+            if self.author:
+                embed.set_author(name=self.author_name, icon_url=self.author.display_avatar)
+            for name, value, inline in page.fields:
+                embed.add_field(name=name, value=value, inline=inline)
+            if self.footer:
+                embed.set_footer(text=self.footer)
+            embeds.append(embed)
+        return embeds
+
+    def text(self) -> str:
+        """Returns everything in the builder as plain text, for sending as a file."""
+        lines = [self.title]
+        if self.author_name:
+            lines.append(f"by {self.author_name}")
+        for page in self.pages:
+            if page.description:
+                lines.append(page.description.rstrip("\n"))
+            for name, value, _ in page.fields:
+                lines.append(f"{name}: {value}")
+        if self.footer:
+            lines.append(self.footer)
+        return "\n".join(lines) + "\n"
+
+
+# ---------------------OTHER FUNCTIONS--------------------
+async def send_embeds(
+    interaction: discord.Interaction, builder: EmbedBuilder, ephemeral: bool = False
+) -> None:
+    """Sends the embeds from a builder as a response to an interaction, the
+    first page as the response and the rest as follow ups. If there are more
+    than MAX_PAGES pages, only the first is sent, along with everything as
+    a text file.
+
+    Args:
+        interaction (discord.Interaction): The interaction to respond to.
+        builder (EmbedBuilder): The builder with the embeds to send.
+        ephemeral (bool, optional): Whether only the user should see it. Defaults to False.
+    """
+    embeds = builder.build()
+
+    async def send(**kwargs) -> None:
+        if interaction.response.is_done():
+            await interaction.followup.send(ephemeral=ephemeral, **kwargs)
+        else:
+            await interaction.response.send_message(ephemeral=ephemeral, **kwargs)
+
+    if len(embeds) > MAX_PAGES:
+        file = discord.File(io.BytesIO(builder.text().encode()), filename="results.txt")
+        await send(
+            content="That's a lot, so here's the first part and the rest as a file",
+            embed=embeds[0],
+            file=file,
+        )
+        return
+
+    for embed in embeds:
+        await send(embed=embed)
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Cuts text down to at most limit characters, marking it with … if it was cut."""
+    if len(text) <= limit:
+        return text
+    return text[: limit - 1] + "…"
+
+
+def _split(text: str, limit: int) -> list[str]:
+    """Splits text into chunks of at most limit characters, preferring to split
+    after a newline or comma so we don't cut numbers in half.
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = max(text.rfind("\n", 0, limit), text.rfind(", ", 0, limit - 1) + 1)
+        if cut <= 0:
+            cut = limit
+        # Runs of whitespace can leave nothing before the cut.
+        if text[:cut].strip():
+            chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text or not chunks:
+        chunks.append(text or "​")
+    return chunks
@@ -1,9 +1,30 @@
-import json
+import re
+from collections.abc import Iterable
 
+# The parser behind the re module is private, so check_regex() falls back to
+# a stricter check if a Python version moves it.
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parser
+except ImportError:
+    sre_constants = sre_parser = None
 
 class QuestInfo:
     # This is just a blank class so I can pass Quest data as a single
-    # object.
+    # object. Slots keep it small since we keep every quest in memory.
+    __slots__ = (
+        "guild_id",
+        "quest_title",
+        "contractor",
+        "description",
+        "reward",
+        "embed_colour",
+        "thread_id",
+        "quest_role_id",
+        "pin_message_id",
+        "_players",
+    )
+
     def __init__(
         self,
         guild_id: int,
@@ -15,7 +36,7 @@ class QuestInfo:
         thread_id: int,
         quest_role_id: int,
         pin_message_id: int,
-        players: str = None,
+        player_ids: Iterable[int] = (),
     ) -> None:
         self.guild_id = guild_id
         self.quest_title = quest_title
@@ -26,24 +47,22 @@ class QuestInfo:
         self.thread_id = thread_id
         self.quest_role_id = quest_role_id
         self.pin_message_id = pin_message_id
-        if players is not None:
-            self._players = json.loads(players)
-        else:
-            self._players = []
+        # A dict is used as an ordered set, keeping join order without
+        # allowing duplicates.
+        self._players: dict[int, None] = dict.fromkeys(player_ids)
 
-    # Todo; This property tag might be superfluous, or this entire system could be reworked to all be properties of the same class
-    #       take a look at this later.
     @property
-    def players(self) -> str:
-        return json.dumps(self._players)
+    def player_ids(self) -> list[int]:
+        """The ids of all players in the quest, in the order they joined."""
+        return list(self._players)
 
     def add_player(self, member: int) -> None:
-        """Adds a player to the list.
+        """Adds a player to the list, does nothing if they're already in it.
 
         Args:
             member (int): player ID
         """
-        self._players.append(member)
+        self._players[member] = None
 
     def remove_player(self, member: int) -> None:
         """Removes a player from the list
@@ -52,8 +71,399 @@ class QuestInfo:
             member (int): player ID
         """
         try:
-            self._players.remove(member)
-        except ValueError:
+            del self._players[member]
+        except KeyError:
             print(
                 f"can't remove player with id {member} from quest {self.quest_title} as they don't exist in the list"
             )
+
+
+class QuestRegistry:
+    # In-memory copy of the quests table, so we don't have to hit the db
+    # every time we want to look up a quest. The db_handler keeps this in
+    # sync with every write it does to the quests table.
+    def __init__(self) -> None:
+        self._quests: dict[int, QuestInfo] = {}
+        self._by_thread: dict[int, int] = {}
+        self._by_title: dict[tuple[int, str], int] = {}
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, quests: list[tuple[int, QuestInfo]]) -> None:
+        """Replaces everything in the registry with the given quests.
+
+        Args:
+            quests (list[tuple[int, QuestInfo]]): (quest id, quest) pairs to add.
+        """
+        self._quests.clear()
+        self._by_thread.clear()
+        self._by_title.clear()
+        for quest_id, quest in quests:
+            self.add(quest_id, quest)
+        self.loaded = True
+
+    def add(self, quest_id: int, quest: QuestInfo) -> None:
+        """Adds a quest, or replaces it if a quest with the id already exists.
+
+        Args:
+            quest_id (int): The id of the quest (the id of the quest message).
+            quest (QuestInfo): The quest itself.
+        """
+        self.remove(quest_id)
+        self._quests[quest_id] = quest
+        self._by_thread[quest.thread_id] = quest_id
+        self._by_title[(quest.guild_id, quest.quest_title)] = quest_id
+
+    def update(self, quest_id: int, quest: QuestInfo) -> None:
+        """Replaces an existing quest, mirroring the UPDATE in the db which
+        only hits the row if both the id and guild match.
+
+        Args:
+            quest_id (int): The id of the quest to update.
+            quest (QuestInfo): The new quest info.
+        """
+        old_quest = self._quests.get(quest_id)
+        if old_quest is not None and old_quest.guild_id == quest.guild_id:
+            self.add(quest_id, quest)
+
+    def add_player(self, quest_id: int, player_id: int) -> None:
+        """Adds a player to a quest, does nothing if either doesn't exist.
+
+        Args:
+            quest_id (int): The id of the quest to add the player to.
+            player_id (int): The id of the player to add.
+        """
+        quest = self._quests.get(quest_id)
+        if quest is not None:
+            quest.add_player(player_id)
+
+    def remove_player(self, quest_id: int, player_id: int) -> None:
+        """Removes a player from a quest, does nothing if either doesn't exist.
+
+        Args:
+            quest_id (int): The id of the quest to remove the player from.
+            player_id (int): The id of the player to remove.
+        """
+        quest = self._quests.get(quest_id)
+        # The quest view usually removed them from the quest already.
+        if quest is not None and player_id in quest.player_ids:
+            quest.remove_player(player_id)
+
+    def remove(self, quest_id: int) -> None:
+        """Removes a quest, does nothing if it doesn't exist.
+
+        Args:
+            quest_id (int): The id of the quest to remove.
+        """
+        quest = self._quests.pop(quest_id, None)
+        if quest is None:
+            return
+        if self._by_thread.get(quest.thread_id) == quest_id:
+            del self._by_thread[quest.thread_id]
+        if self._by_title.get((quest.guild_id, quest.quest_title)) == quest_id:
+            del self._by_title[(quest.guild_id, quest.quest_title)]
+
+    def get(self, quest_id: int) -> QuestInfo | None:
+        """Returns the quest with the given id, or None if it doesn't exist."""
+        self.hits += 1
+        return self._quests.get(quest_id)
+
+    def get_by_thread_id(self, thread_id: int) -> tuple[int, QuestInfo] | None:
+        """Returns (quest id, quest) for the quest with the given thread, or None."""
+        self.hits += 1
+        quest_id = self._by_thread.get(thread_id)
+        if quest_id is None:
+            return None
+        return (quest_id, self._quests[quest_id])
+
+    def get_by_title(self, guild_id: int, quest_title: str) -> tuple[int, QuestInfo] | None:
+        """Returns (quest id, quest) for the quest with the given title, or None."""
+        self.hits += 1
+        quest_id = self._by_title.get((guild_id, quest_title))
+        if quest_id is None:
+            return None
+        return (quest_id, self._quests[quest_id])
+
+    def get_all(self) -> list[tuple[int, QuestInfo]]:
+        """Returns (quest id, quest) for all quests in the registry."""
+        self.hits += 1
+        return list(self._quests.items())
+
+
+# The settings every guild can change, and their values until it does.
+GUILD_CONFIG_DEFAULTS: dict[str, str | None] = {
+    # The names of the roles the bot looks for.
+    "archive_role": "Archive",
+    "player_role": "Player",
+    "dm_role": "Dm",
+    # The id of the channel receipts are posted to for checking.
+    "receipts_channel": None,
+    # The text of stickies without one of their own, None for the built in one.
+    "sticky_template": None,
+}
+
+
+class GuildConfig:
+    # In-memory copy of the guild_config table, read on every lookup of a
+    # guild setting instead of the db. Only settings a guild has changed
+    # are stored, everything else comes from GUILD_CONFIG_DEFAULTS. The
+    # db_handler keeps this in sync with every write it does to the table.
+    def __init__(self) -> None:
+        self._guilds: dict[int, dict[str, str]] = {}
+
+    def load(self, settings: list[tuple[int, str, str]]) -> None:
+        """Replaces every setting with the given ones.
+
+        Args:
+            settings (list[tuple[int, str, str]]): (guild id, key, value) rows.
+        """
+        self._guilds.clear()
+        for guild_id, key, value in settings:
+            self.set(guild_id, key, value)
+
+    def get(self, guild_id: int | None, key: str) -> str | None:
+        """Returns a setting of a guild, or its default if the guild hasn't changed it.
+
+        Args:
+            guild_id (int | None): The id of the guild.
+            key (str): The setting, one of the keys of GUILD_CONFIG_DEFAULTS.
+
+        Returns:
+            str | None: The value of the setting.
+        """
+        settings = self._guilds.get(guild_id)
+        if settings is not None and key in settings:
+            return settings[key]
+        return GUILD_CONFIG_DEFAULTS[key]
+
+    def set(self, guild_id: int, key: str, value: str | None) -> None:
+        """Changes a setting of a guild, None resets it to the default."""
+        if value is not None:
+            self._guilds.setdefault(guild_id, {})[key] = value
+            return
+        settings = self._guilds.get(guild_id, {})
+        settings.pop(key, None)
+        if not settings:
+            self._guilds.pop(guild_id, None)
+
+    def guilds_with(self, key: str) -> list[int]:
+        """Returns the ids of the guilds that have changed a setting."""
+        return [guild_id for guild_id, settings in self._guilds.items() if key in settings]
+
+
+# Reaction rule regexes run on every message with the rule's tokens, so only
+# short patterns that can't backtrack much are allowed, see check_regex().
+MAX_REGEX_LENGTH = 100
+MAX_REGEX_BACKTRACKING = 5000
+# The longest message Discord allows (with Nitro).
+MAX_MESSAGE_LENGTH = 4000
+
+# Finds repeats and groups for the fallback check in check_regex(), skipping
+# over escapes and character sets.
+_REGEX_SYNTAX = re.compile(r"\\.|\[\^?\]?(?:\\.|[^\]])*\]|([*+?{])|(\()", re.DOTALL)
+
+if sre_constants is not None:
+    _REPEATS = (
+        sre_constants.MAX_REPEAT,
+        sre_constants.MIN_REPEAT,
+        sre_constants.POSSESSIVE_REPEAT,
+    )
+
+
+class ReactionRule:
+    # A rule for reacting to messages: when a message in the guild contains
+    # every token (and matches the regex, if there is one), react with the
+    # emoji, at most once per cooldown seconds per channel. Rules with a
+    # guild id of 0 apply to every guild, except the ones in disabled_guilds.
+    __slots__ = (
+        "id",
+        "guild_id",
+        "tokens",
+        "pattern",
+        "regex",
+        "emoji",
+        "cooldown",
+        "disabled_guilds",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        guild_id: int,
+        tokens: list[str],
+        pattern: str | None,
+        emoji: str,
+        cooldown: float,
+        disabled_guilds: Iterable[int] = (),
+    ) -> None:
+        self.id = id
+        self.guild_id = guild_id
+        self.tokens = tuple(tokens)
+        self.pattern = pattern
+        self.regex = re.compile(pattern) if pattern else None
+        self.emoji = emoji
+        self.cooldown = cooldown
+        self.disabled_guilds = set(disabled_guilds)
+
+    def matches(self, guild_id: int | None, text: str) -> bool:
+        """Checks the parts of the rule the tokens don't cover, the guild and the regex."""
+        if self.guild_id and self.guild_id != guild_id:
+            return False
+        if guild_id in self.disabled_guilds:
+            return False
+        return self.regex is None or self.regex.search(text) is not None
+
+
+def check_regex(pattern: str) -> None:
+    """Checks that a regex is safe to run on every message. The re module
+    backtracks, so a pattern like (a+)+ or .*.* can take seconds (or far
+    longer) on a long message. Patterns can't use backreferences or repeat
+    repeats and alternatives, and the ways the rest of it can try to match
+    from a single position in a message are capped by MAX_REGEX_BACKTRACKING,
+    which allows a single unlimited repeat like * or +.
+
+    Args:
+        pattern (str): The regex.
+
+    Raises:
+        ValueError: If the regex is invalid or not safe, with a message for the user.
+    """
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise ValueError(f"Regexes can only be up to {MAX_REGEX_LENGTH} characters long")
+    try:
+        re.compile(pattern)
+        if sre_parser is None:
+            _check_simple_regex(pattern)
+            return
+        parsed = sre_parser.parse(pattern)
+    except re.error as e:
+        raise ValueError(f"That regex doesn't work: {e}") from None
+    if _backtracking(parsed, False) > MAX_REGEX_BACKTRACKING:
+        raise ValueError(
+            "That regex could take too long on long messages, try it with fewer repeats like * or +"
+        )
+
+
+def _check_simple_regex(pattern: str) -> None:
+    """The check_regex() fallback for when the re parser isn't available. It
+    can't tell what a repeat applies to, so it only allows patterns without
+    groups (so without backreferences too) and with at most one repeat.
+
+    Args:
+        pattern (str): The regex, which compiles.
+
+    Raises:
+        ValueError: If the regex isn't that simple, with a message for the user.
+    """
+    repeats = 0
+    for match in _REGEX_SYNTAX.finditer(pattern):
+        repeat, group = match.groups()
+        if group:
+            raise ValueError("Regexes can't use groups, sorry")
+        repeats += bool(repeat)
+    if repeats > 1:
+        raise ValueError(
+            "That regex could take too long on long messages, try it with one repeat like * or +"
+        )
+
+
+def _backtracking(items: Iterable[tuple], repeated: bool) -> int:
+    """Returns how many ways a parsed regex can try to match from a single
+    position in a message, at worst.
+
+    Args:
+        items (Iterable[tuple]): The parsed regex, from sre_parser.parse().
+        repeated (bool): Whether the items are inside a repeat.
+
+    Raises:
+        ValueError: If the regex uses something that's never safe, with a message for the user.
+    """
+    ways = 1
+    for op, av in items:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            raise ValueError("Regexes can't use backreferences")
+        if op in _REPEATS:
+            if repeated:
+                raise ValueError("Regexes can't repeat something that's already repeated")
+            _, most, item = av
+            ways *= (min(most, MAX_MESSAGE_LENGTH) + 1) * _backtracking(item, True)
+        elif op is sre_constants.BRANCH:
+            if repeated:
+                raise ValueError("Regexes can't repeat a choice between alternatives")
+            ways *= sum(_backtracking(branch, repeated) for branch in av[1])
+        elif op is sre_constants.SUBPATTERN:
+            ways *= _backtracking(av[3], repeated)
+        elif op is sre_constants.ATOMIC_GROUP:
+            ways *= _backtracking(av, repeated)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            ways *= _backtracking(av[1], repeated)
+    return ways
+
+
+_NO_TRIGGERS: frozenset[str] = frozenset()
+
+
+def _trie_pattern(strings: Iterable[str]) -> str:
+    """Builds a regex matching any of the strings, factored into a prefix tree.
+
+    The re module tries the branches of an alternation one by one, so a flat
+    "a|b|c|..." costs time for every string at every position of the text.
+    Nested by shared prefixes, each position only follows the branch of its
+    next character, and a string that's a prefix of another is optional, so
+    the longest one is still preferred.
+    """
+    trie: dict = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        return f"(?:{'|'.join(branches)}){'?' if '' in node else ''}"
+
+    return build(trie)
+
+
+class TriggerMatcher:
+    # Finds which of a set of substrings (triggers) appear in a text. With a
+    # handful of triggers checking each with `in` is fastest, past that a
+    # single regex search is used no matter how many triggers there are. The
+    # regex is a prefix tree of the triggers, so its cost doesn't grow with
+    # how many there are, and it looks at every position for the longest
+    # trigger starting there. Any shorter triggers inside a found one are
+    # added from a precomputed table, so overlapping triggers are never
+    # missed. Rebuild it when the triggers change.
+    SMALL = 16
+
+    def __init__(self, triggers: Iterable[str]) -> None:
+        self.triggers = frozenset(trigger for trigger in triggers if trigger)
+        self._any = self._all = None
+        if len(self.triggers) <= self.SMALL:
+            return
+        pattern = _trie_pattern(self.triggers)
+        self._any = re.compile(pattern)
+        self._all = re.compile(f"(?=({pattern}))")
+        self._contained = {
+            trigger: frozenset(other for other in self.triggers if other in trigger)
+            for trigger in self.triggers
+        }
+
+    def find(self, text: str) -> frozenset[str]:
+        """Returns every trigger that appears in the text."""
+        if self._any is None:
+            found = [trigger for trigger in self.triggers if trigger in text]
+            return frozenset(found) if found else _NO_TRIGGERS
+        # Nearly every text has no triggers at all, so check that first.
+        if self._any.search(text) is None:
+            return _NO_TRIGGERS
+        found = set()
+        for trigger in dict.fromkeys(self._all.findall(text)):
+            found |= self._contained[trigger]
+        return frozenset(found)
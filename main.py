@@ -7,6 +7,9 @@ import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
+import db_handler as db
+from role_cache import roles
+
 _ = load_dotenv()
 token = environ["TEST_TOKEN"]
 
@@ -35,18 +38,40 @@ class FredBot(commands.Bot):
         print(f"Logged in as {self.user} (ID: {self.user.id})")
         print("------")
 
+    # Roles are looked up by name through the role cache, so forget a guild's
+    # roles whenever they change.
+    async def on_guild_role_create(self, role: discord.Role) -> None:
+        roles.invalidate(role.guild.id)
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        roles.invalidate(after.guild.id)
+
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        roles.invalidate(role.guild.id)
+
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        roles.invalidate(guild.id)
+
     @override
     async def setup_hook(self) -> None:
         # Do any data processing to get data into memory here:
 
+        # Open the database connections, these live as long as the bot does.
+        await db.open_pool()
+        # Every guild's settings, read by the cogs from memory from here on.
+        await db.load_guild_config()
+
         # Load cogs:
         print("loading cogs:")
         extensions = [
+            # The message router goes first, other cogs register routes with it.
+            "cogs.message_router",
             "cogs.dice_roller",
             "cogs.quest_handler",
             "cogs.sticky_handler",
             "cogs.archive_handler",
-            "cogs.whale_handler",
+            "cogs.reaction_handler",
+            "cogs.config_handler",
             # "cogs.receipts_handler",
         ]
 
@@ -63,6 +88,12 @@ class FredBot(commands.Bot):
         # self.tree.copy_global_to(guild=TEST_GUILD)
         # await self.tree.sync(guild=TEST_GUILD)
 
+    @override
+    async def close(self) -> None:
+        await super().close()
+        # Close the database last so cogs can still write while shutting down.
+        await db.close_pool()
+
 
 # ------------------------MAIN CODE-----------------------
 bot = FredBot(command_prefix="!")
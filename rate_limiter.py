@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+
+# -----------------------MAIN CLASS-----------------------
+class RateLimiter:
+    # A token bucket per key (like a guild id, or a (guild, channel, user)
+    # tuple). Every bucket holds up to burst tokens and refills at rate
+    # tokens per per seconds, and every allowed action takes a token.
+    #
+    # Buckets are kept in least recently used order. A bucket that has been
+    # idle long enough to refill completely is the same as a new one, so
+    # those are dropped as we go, which keeps memory bounded by how many
+    # keys are active rather than how many have ever been seen. max_keys is
+    # a hard cap on top of that, past it the least recently used buckets go
+    # first (which can only ever let an action through early, never block one).
+    def __init__(
+        self,
+        rate: float,
+        per: float,
+        burst: int = 1,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.burst = burst
+        self.refill = rate / per
+        self.max_keys = max_keys
+        self.clock = clock
+        # How long an unused bucket takes to fill back up.
+        self.idle_ttl = burst / self.refill
+        # key -> (tokens, when they were counted)
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+        # When the least recently used bucket will have fully refilled.
+        self._next_eviction = float("inf")
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _tokens(self, key: Hashable, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, stamp = bucket
+        return min(self.burst, tokens + (now - stamp) * self.refill)
+
+    def hit(self, key: Hashable) -> bool:
+        """Takes a token from the bucket of a key if there is one.
+
+        Args:
+            key (Hashable): What to rate limit, like a guild id.
+
+        Returns:
+            bool: True if the action is allowed, False if it's rate limited.
+        """
+        now = self.clock()
+        buckets = self._buckets
+        # Popping and adding the bucket back moves it to the end, keeping the
+        # buckets in least recently used order.
+        bucket = buckets.pop(key, None)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        buckets[key] = (tokens, now)
+        if len(buckets) == 1:
+            # This is the least recently used bucket now.
+            self._next_eviction = now + self.idle_ttl
+        elif now >= self._next_eviction or len(buckets) > self.max_keys:
+            self._evict(now)
+        return allowed
+
+    def retry_after(self, key: Hashable) -> float:
+        """Returns how many seconds until the key has a token again, 0 if it has one now."""
+        tokens = self._tokens(key, self.clock())
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.refill
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        # The front is the least recently used bucket, so stop at the first
+        # one that's still refilling, and come back when that one's done.
+        while buckets:
+            key, (_, stamp) = next(iter(buckets.items()))
+            if now - stamp < self.idle_ttl and len(buckets) <= self.max_keys:
+                self._next_eviction = stamp + self.idle_ttl
+                return
+            del buckets[key]
+        self._next_eviction = float("inf")
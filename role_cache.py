@@ -0,0 +1,48 @@
+import discord
+import discord.utils
+
+
+# -----------------------MAIN CLASS-----------------------
+class RoleCache:
+    # Remembers which role a name resolves to in each guild, so finding the
+    # "Player" role is a couple of dict lookups instead of a scan over every
+    # role in the guild (and servers get a new role for every quest). Names
+    # that don't resolve to a role are remembered too. The bot calls
+    # invalidate() whenever a role in the guild is created, changed or
+    # deleted, and a remembered role that has disappeared anyway (like after
+    # a missed event) is looked up again.
+    def __init__(self) -> None:
+        # guild id -> role name -> role id, or None if there's no such role.
+        self._ids: dict[int, dict[str, int | None]] = {}
+
+    def get(self, guild: discord.Guild, name: str) -> discord.Role | None:
+        """Returns the role with a name in a guild, like discord.utils.get(guild.roles, name=name).
+
+        Args:
+            guild (discord.Guild): The guild to look in.
+            name (str): The name of the role.
+
+        Returns:
+            discord.Role | None: The role, or None if the guild doesn't have one with that name.
+        """
+        names = self._ids.get(guild.id)
+        if names is None:
+            names = self._ids[guild.id] = {}
+        elif name in names:
+            role_id = names[name]
+            if role_id is None:
+                return None
+            role = guild.get_role(role_id)
+            if role is not None:
+                return role
+        role = discord.utils.get(guild.roles, name=name)
+        names[name] = role and role.id
+        return role
+
+    def invalidate(self, guild_id: int) -> None:
+        """Forgets every role of a guild, call this whenever its roles change."""
+        self._ids.pop(guild_id, None)
+
+
+# Shared by every cog, kept up to date by the role events in main.py.
+roles = RoleCache()
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+import db_handler as db
+from helpers import GuildConfig, QuestRegistry
+
+
+class Fake:
+    # Stands in for discord objects, with whatever attributes a test needs.
+    def __init__(self, **attributes) -> None:
+        self.__dict__.update(attributes)
+
+
+@pytest.fixture
+async def database(tmp_path, monkeypatch):
+    """Opens db_handler on a fresh database file, and closes it again after the test."""
+    monkeypatch.setattr(db, "db_file", str(tmp_path / "db.sqlite"))
+    # Start every test with empty in-memory copies, so reads go to disk.
+    monkeypatch.setattr(db, "quest_registry", QuestRegistry())
+    monkeypatch.setattr(db, "guild_config", GuildConfig())
+    # Locks belong to the event loop they were first used on, and every test
+    # gets its own loop.
+    monkeypatch.setattr(db, "_write_lock", asyncio.Lock())
+    await db.open_pool()
+    yield db
+    await db.close_pool()
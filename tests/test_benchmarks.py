@@ -0,0 +1,173 @@
+import random
+import re
+import sqlite3
+import time
+
+import pytest
+
+import dice
+from cogs.dice_roller import _roll_log_rows
+from cogs.quest_handler import _add_quest_views
+from conftest import Fake
+from helpers import MAX_MESSAGE_LENGTH, check_regex
+
+# These time themselves, and only run with -m slow. Use -s to see the timings.
+pytestmark = pytest.mark.slow
+
+TYPICAL_ROLLS = ["1d20+5", "4d6kh3", "2d20kl1+3", "8d6!+2d4r1", "(1d8+2)*2"]
+# As many of the most involved terms as fit in the input limit.
+LONGEST_ROLL = "+".join(["(2d6kh1!r1*3)"] * 18)[: dice.MAX_INPUT_LENGTH].rpartition("+")[0]
+
+
+def _per_second(function, *args, duration: float = 0.5) -> float:
+    """Calls function over and over for about duration seconds, and returns
+    how many calls it managed per second.
+    """
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < duration:
+        function(*args)
+        calls += 1
+    return calls / elapsed
+
+
+def _uncached_odds(expression: str) -> float:
+    """Returns how many seconds working out the odds of an expression takes,
+    without any of it cached.
+    """
+    dice._odds.cache_clear()
+    dice._dice_distribution.cache_clear()
+    start = time.perf_counter()
+    dice.odds(expression)
+    return time.perf_counter() - start
+
+
+def _parse_and_roll(expression: str) -> None:
+    dice.parse.cache_clear()
+    dice.roll(expression, rng=random.Random(1))
+
+
+async def test_startup_with_10k_quests(database):
+    # Spread over 20 guilds, with 5 players each.
+    quests = [
+        (
+            quest_id,
+            quest_id % 20,
+            f"Quest {quest_id}",
+            "Contractor",
+            "Description",
+            "Reward",
+            "0x2B2D31",
+            quest_id + 100000,
+            quest_id + 200000,
+            quest_id + 300000,
+        )
+        for quest_id in range(1, 10001)
+    ]
+    with sqlite3.connect(database.db_file) as conn:
+        conn.executemany(
+            """
+            INSERT INTO quests (
+                id, guild_id, quest_title, contractor, description, reward,
+                embed_colour, thread_id, quest_role_id, pin_message_id
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+            quests,
+        )
+        conn.executemany(
+            "INSERT INTO quest_players (quest_id, player_id) VALUES (?, ?);",
+            [(quest[0], player_id) for quest in quests for player_id in range(5)],
+        )
+    views = []
+    bot = Fake(add_view=views.append)
+
+    # The same steps as quest_handler.setup().
+    start = time.perf_counter()
+    await database.load_quest_registry()
+    _add_quest_views(bot, await database.get_all_quest_list())
+    elapsed = time.perf_counter() - start
+
+    print(f"\nStarting with 10k quests took {elapsed:.3f}s")
+    assert len(views) == 10000
+    assert database.quest_registry.misses == 0
+    assert elapsed < 5
+
+
+def test_roll_at_the_work_cap():
+    expression = "+".join(["90000d90000"] + ["100d100"] * 20)
+    assert dice._roll_work(dice.parse(expression)) > dice.MAX_ROLL_WORK * 0.9
+    start = time.perf_counter()
+    dice.roll(expression, rng=random.Random(1))
+    elapsed = time.perf_counter() - start
+
+    print(f"\nRolling {expression} took {elapsed:.3f}s")
+    assert elapsed < 1
+
+
+@pytest.mark.parametrize("expression", TYPICAL_ROLLS + [LONGEST_ROLL])
+def test_roll_throughput(expression):
+    cached = _per_second(dice.roll, expression)
+    uncached = _per_second(_parse_and_roll, expression)
+
+    print(f"\n{expression}: {cached:,.0f} rolls/s, {uncached:,.0f} parsed and rolled/s")
+    if expression in TYPICAL_ROLLS:
+        assert uncached > 5000
+    else:
+        assert uncached > 200
+
+
+# The common ones, then expressions close to MAX_ODDS_WORK.
+@pytest.mark.parametrize(
+    "expression",
+    ["1d20+5", "4d6kh3", "2d20kl1+5", "3d8r2*2-1d4"]
+    + ["100d100", "125d125", "1d470*1d470", "15d6!"],
+)
+def test_odds_time(expression):
+    elapsed = _uncached_odds(expression)
+    steps = dice._odds_work(dice.parse(expression))[0]
+
+    print(f"\nOdds of {expression} took {elapsed:.3f}s, {steps:,} steps")
+    assert elapsed < 1
+
+
+@pytest.mark.parametrize(
+    "expression", ["1d2449*1d2449", "(1d2449*1d2449)+(1d2449*1d2449)", "1000d6", "100d20!"]
+)
+def test_refusing_odds_time(expression):
+    dice._odds.cache_clear()
+    start = time.perf_counter()
+    with pytest.raises(dice.DiceError):
+        dice.odds(expression)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nRefusing the odds of {expression} took {elapsed * 1000:.3f}ms")
+    assert elapsed < 0.1
+
+
+def test_roll_log_time():
+    # A normal roll, and two that are too expensive to work out the luck of.
+    pending = [
+        (1, 100, 0, expression, None, dice.roll(expression, rng=random.Random(1)))
+        for expression in ("1d20+5", "1d2449*1d2449", "300d100")
+    ]
+    dice._odds.cache_clear()
+    dice._dice_distribution.cache_clear()
+    start = time.perf_counter()
+    _roll_log_rows(pending)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nLogging the rolls took {elapsed * 1000:.3f}ms")
+    assert elapsed < 0.5
+
+
+# The allowed regexes that backtrack the most.
+@pytest.mark.parametrize("pattern", [r".*b", r"a{0,50}a{0,50}b", r"(?:x|a*)b"])
+def test_regex_time_on_the_longest_message(pattern):
+    check_regex(pattern)
+    start = time.perf_counter()
+    re.search(pattern, "a" * MAX_MESSAGE_LENGTH)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nSearching with {pattern} took {elapsed * 1000:.3f}ms")
+    assert elapsed < 0.5
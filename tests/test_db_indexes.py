@@ -0,0 +1,122 @@
+import asyncio
+import inspect
+import re
+
+import pytest
+
+import db_handler as db
+from helpers import QuestInfo
+
+# Reads of a whole table on purpose, they're each done once at startup to
+# fill an in-memory copy (or a cog's state) and are never on a hot path.
+FULL_READS = {
+    "get_all_quest_list",
+    "get_sticky_list",
+    "get_receipt_list",
+    "get_reaction_rules",
+    "load_guild_config",
+}
+
+# Functions that don't run queries of their own.
+NOT_QUERIES = {"open_pool", "close_pool", "load_quest_registry"}
+
+
+def _quest(guild_id: int = 1, title: str = "Quest") -> QuestInfo:
+    return QuestInfo(guild_id, title, "Contractor", "Description", "Reward", "#ffffff", 20, 30, 40)
+
+
+# Every query function of db_handler, with arguments that make it run all
+# of its statements (players that don't exist yet get inserted and so on).
+CALLS = {
+    "create_quest": lambda: db.create_quest(10, _quest()),
+    "get_quest": lambda: db.get_quest(10),
+    "get_quest_by_title": lambda: db.get_quest_by_title(1, "Quest"),
+    "get_quest_by_thread_id": lambda: db.get_quest_by_thread_id(20),
+    "get_all_quest_list": lambda: db.get_all_quest_list(),
+    "update_quest": lambda: db.update_quest(10, _quest()),
+    "add_quest_player": lambda: db.add_quest_player(10, 100),
+    "remove_quest_player": lambda: db.remove_quest_player(10, 100),
+    "del_quest": lambda: db.del_quest(10),
+    "create_sticky": lambda: db.create_sticky(50, 51, "Template"),
+    "get_sticky_list": lambda: db.get_sticky_list(),
+    "update_stickies": lambda: db.update_stickies([(50, 53)]),
+    "del_sticky": lambda: db.del_sticky(50),
+    "get_player": lambda: db.get_player(1, 100),
+    "get_players": lambda: db.get_players(1, [100, 101]),
+    "increment_players": lambda: db.increment_players(1, [100, 102]),
+    "update_player": lambda: db.update_player(1, 100, 5),
+    "create_receipt": lambda: db.create_receipt(60, 61),
+    "get_receipt_list": lambda: db.get_receipt_list(),
+    "del_receipt_public": lambda: db.del_receipt_public(60),
+    "del_receipt_board": lambda: db.del_receipt_board(61),
+    "add_rolls": lambda: db.add_rolls([(1, 100, 0, "1d20", 20, b"", 1, 1, 0, 0.5)]),
+    "get_roll_stats": lambda: db.get_roll_stats(1, 100),
+    "create_reaction_rule": lambda: db.create_reaction_rule(1, ["a"], None, "👀", 0),
+    "get_reaction_rules": lambda: db.get_reaction_rules(),
+    "del_reaction_rule": lambda: db.del_reaction_rule(1, 2),
+    "set_reaction_rule_disabled": lambda: asyncio.gather(
+        db.set_reaction_rule_disabled(1, 1, True), db.set_reaction_rule_disabled(1, 1, False)
+    ),
+    "set_guild_config": lambda: db.set_guild_config(1, "player_role", "Spelare"),
+    "load_guild_config": lambda: db.load_guild_config(),
+}
+
+
+def test_every_query_function_is_checked():
+    public = {
+        name
+        for name, function in inspect.getmembers(db, inspect.iscoroutinefunction)
+        if not name.startswith("_") and function.__module__ == db.__name__
+    }
+    assert public - NOT_QUERIES == set(CALLS)
+
+
+@pytest.fixture
+async def traced_database(tmp_path, monkeypatch):
+    """Like the database fixture, but records every statement db_handler runs."""
+    statements: list[str] = []
+    init_connection = db._init_connection
+
+    def init_traced(conn):
+        init_connection(conn)
+        conn.set_trace_callback(statements.append)
+
+    monkeypatch.setattr(db, "_init_connection", init_traced)
+    monkeypatch.setattr(db, "db_file", str(tmp_path / "db.sqlite"))
+    monkeypatch.setattr(db, "_write_lock", asyncio.Lock())
+    await db.open_pool()
+    yield statements
+    await db.close_pool()
+
+
+async def test_queries_use_indexes(traced_database):
+    statements = traced_database
+    tables = {
+        name
+        for (name,) in await db._execute_multiple_read_query(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )
+    }
+
+    full_scans = []
+    for name, call in CALLS.items():
+        statements.clear()
+        await call()
+        queries = [
+            statement
+            for statement in statements
+            if re.match(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", statement, re.I)
+        ]
+        assert queries, f"{name} didn't run any queries"
+        if name in FULL_READS:
+            continue
+        for query in queries:
+            plan = await db._execute_multiple_read_query(f"EXPLAIN QUERY PLAN {query}")
+            for *_, detail in plan:
+                # "SCAN table" without an index is a full table scan, scans
+                # of subqueries and "USING INDEX" scans are fine.
+                match = re.fullmatch(r"SCAN (?:TABLE )?(\w+)", detail)
+                if match and match[1] in tables:
+                    full_scans.append(f"{name}: {detail}\n{query}")
+
+    assert not full_scans, "\n\n".join(full_scans)
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+import dice
+
+
+def test_big_terms_share_one_budget():
+    # Each term is fine on its own, but not all of them in one roll.
+    dice.parse("100000d99999")
+    with pytest.raises(dice.DiceError):
+        dice.parse("+".join(["100000d99999"] * 18))
+    with pytest.raises(dice.DiceError):
+        dice.parse("60000d99999+60000d99999")
+
+
+def test_rolls_within_the_budget_are_allowed():
+    # The benchmarks time this one, it's about as much work as a roll can be.
+    expression = "+".join(["90000d90000"] + ["100d100"] * 20)
+    assert dice._roll_work(dice.parse(expression)) == 90000 + 100 * 20
+    assert dice.roll(expression, rng=random.Random(1)).dice[0].summarized
+
+
+def test_roll_work_counts_rerolls_and_explosions():
+    assert dice._roll_work(dice.parse("10d6")) == 10
+    assert dice._roll_work(dice.parse("1000d6")) == 6
+    assert dice._roll_work(dice.parse("10d6r1!-2*3d4")) == 33
+
+
+def test_batches_share_one_budget():
+    assert dice.parse_batch("25x 1d20+5 adv") == [(25, "1d20+5", "adv")]
+    with pytest.raises(dice.DiceError):
+        dice.parse_batch("25x 100000d99999")
+    with pytest.raises(dice.DiceError):
+        dice.parse_batch("100000d99999, 100000d99998, 100000d99997, 100000d99996")
+
+
+@pytest.mark.parametrize(
+    "expression", ["1d2449*1d2449", "(1d2449*1d2449)+(1d2449*1d2449)", "1000d6", "100d20!"]
+)
+def test_complicated_odds_are_refused_up_front(expression, monkeypatch):
+    assert dice._odds_work(dice.parse(expression))[0] > dice.MAX_ODDS_WORK
+
+    def distribution(self):
+        raise AssertionError("The odds were worked out")
+
+    # Nothing is worked out before refusing.
+    for node in (dice.Dice, dice.Negate, dice.BinaryOp):
+        monkeypatch.setattr(node, "distribution", distribution)
+    with pytest.raises(dice.DiceError):
+        dice.odds(expression)
+
+
+def test_odds_within_the_budget():
+    for expression in ("4d6kh3", "2d20kl1+5", "10d6!", "3d8r2*2-1d4"):
+        distribution = dice.odds(expression)
+        assert sum(distribution.probs) == pytest.approx(1)
+        assert dice._odds_work(dice.parse(expression))[1:] == (distribution.low, distribution.high)
+
+
+def test_odds_are_cached_by_the_parsed_expression():
+    assert dice.odds("1d20 + 2") is dice.odds("1D20+2")
+
+
+@pytest.mark.parametrize(
+    "expression", ["4d6kh3+2d8", "100000d1000000", "5000d20", "200d1", "300d2"]
+)
+def test_packed_dice_keep_the_totals(expression):
+    rolled = dice.roll(expression, rng=random.Random(1)).dice
+    packed = dice.pack_dice(rolled)
+    unpacked = dice.unpack_dice(packed)
+
+    # Summarized terms take the same space however many faces they have.
+    assert len(packed) == sum(
+        dice._TERM_HEADER.size
+        + (dice._TERM_SUMMARY.size if term.summarized else 4 * len(term.result))
+        for term in rolled
+    )
+    for original, restored in zip(rolled, unpacked, strict=True):
+        assert restored.sides == original.sides
+        assert restored.count == original.count
+        assert restored.total == original.total
+        if original.summarized:
+            assert restored.histogram.get(1) == original.histogram.get(1)
+            assert restored.histogram.get(original.sides) == original.histogram.get(original.sides)
+            assert min(restored.histogram) >= 1 and max(restored.histogram) <= original.sides
+        else:
+            assert (restored.result, restored.kept) == (original.result, original.kept)
@@ -0,0 +1,169 @@
+import random
+from types import SimpleNamespace
+
+from hypothesis import assume, given
+from hypothesis import strategies as st
+
+import dice
+from cogs.dice_roller import (
+    LUCK_ODDS_WORK,
+    DiceRoller,
+    _build_batch_embed,
+    _build_roll_embed,
+    _roll_batch,
+    _roll_log_rows,
+)
+from conftest import Fake
+from embed_builder import (
+    FIELD_COUNT_LIMIT,
+    FIELD_NAME_LIMIT,
+    FIELD_VALUE_LIMIT,
+    TITLE_LIMIT,
+    TOTAL_LIMIT,
+)
+
+USER = SimpleNamespace(display_name="Player", display_avatar="https://a.b/c.png")
+
+
+@st.composite
+def dice_terms(draw) -> str:
+    """Dice terms like 4d6kh3, and summarized ones with up to MAX_DICE dice."""
+    if draw(st.booleans()):
+        # Summarized, the budget allows as many dice as we like with few sides.
+        amount = draw(st.integers(dice.SUMMARY_THRESHOLD + 1, dice.MAX_DICE))
+        sides = draw(st.integers(1, 1000))
+        return f"{amount}d{sides}"
+    amount = draw(st.integers(1, dice.SUMMARY_THRESHOLD))
+    sides = draw(st.integers(1, 20) | st.sampled_from([100, dice.MAX_SIDES]))
+    term = f"{amount}d{sides}"
+    keep = draw(st.sampled_from(["", "kh", "kl"]))
+    if keep:
+        term += f"{keep}{draw(st.integers(1, amount))}"
+    if sides > 1 and draw(st.booleans()):
+        term += "!"
+    if sides > 1 and draw(st.booleans()):
+        term += f"r{draw(st.integers(1, sides - 1))}"
+    return term
+
+
+# Numbers, dice terms, and the term with the longest list of dice.
+terms = st.one_of(
+    st.integers(0, dice.MAX_SIDES).map(str),
+    dice_terms(),
+    st.just(f"{dice.SUMMARY_THRESHOLD}d{dice.MAX_SIDES}"),
+)
+# Long sums for results that need several pages, and long products for huge totals.
+chains = st.tuples(st.sampled_from(["+", "*"]), st.lists(terms, min_size=2, max_size=40)).map(
+    lambda chain: chain[0].join(chain[1])
+)
+# Whole expressions, made out of the above.
+expressions = st.recursive(
+    terms | chains,
+    lambda children: st.one_of(
+        st.tuples(children, st.sampled_from(["+", "-", "*"]), children).map("".join),
+        children.map(lambda expression: f"({expression})"),
+        children.map(lambda expression: f"-{expression}"),
+    ),
+    max_leaves=12,
+)
+
+
+def _check_limits(builder) -> list[tuple[str, str]]:
+    """Checks every page of a builder against Discord's limits, and returns
+    all of the fields as (name, value).
+    """
+    fields = []
+    for embed in builder.build():
+        assert len(embed) <= TOTAL_LIMIT
+        assert len(embed.title) <= TITLE_LIMIT
+        assert len(embed.fields) <= FIELD_COUNT_LIMIT
+        for field in embed.fields:
+            assert 0 < len(field.name) <= FIELD_NAME_LIMIT
+            assert 0 < len(field.value) <= FIELD_VALUE_LIMIT
+            fields.append((field.name, field.value))
+    return fields
+
+
+def _roll(expression: str, rng: random.Random, advantage: str | None = None) -> dice.RollResult:
+    try:
+        return dice.roll(expression, rng=rng, advantage=advantage)
+    except dice.DiceError:
+        # Too long, or too much work for a single roll.
+        assume(False)
+
+
+def test_luck_is_skipped_for_expensive_expressions():
+    expressions = ("1d20+5", "1d2449*1d2449", "300d100")
+    pending = [
+        (1, 100, 0, expression, None, dice.roll(expression, rng=random.Random(1)))
+        for expression in expressions
+    ]
+    rows = _roll_log_rows(pending)
+
+    work = [dice._odds_work(dice.parse(expression))[0] for expression in expressions]
+    assert work[0] <= LUCK_ODDS_WORK < min(work[1:])
+    luck = [row[-1] for row in rows]
+    assert luck[0] is not None
+    assert luck[1:] == [None, None]
+
+
+async def test_roll_stats_answer_when_the_read_fails(database, monkeypatch):
+    sent = []
+
+    async def defer() -> None:
+        pass
+
+    async def send(content) -> None:
+        sent.append(content)
+
+    async def failed_read(query, vars=()) -> None:
+        return None
+
+    monkeypatch.setattr(database, "_execute_read_query", failed_read)
+    interaction = Fake(
+        user=Fake(id=100, display_name="Player"),
+        guild_id=1,
+        response=Fake(defer=defer),
+        followup=Fake(send=send),
+    )
+    await DiceRoller.roll_stats.callback(DiceRoller(None), interaction)
+    assert sent == ["Something went wrong, please try again."]
+
+
+@given(expressions, st.randoms(use_true_random=False))
+def test_roll_embeds_fit_and_keep_the_totals(expression, rng):
+    result = _roll(expression, rng)
+    fields = _check_limits(_build_roll_embed(USER, expression, result))
+
+    assert fields[-1] == ("Total", str(result.total))
+    text = "\n".join(value for _, value in fields)
+    for rolled in result.dice:
+        if rolled.summarized:
+            assert f"sum {rolled.total:,}" in text
+
+
+@given(
+    st.lists(
+        st.tuples(st.integers(1, 5), expressions, st.sampled_from(["", " adv", " dis"])),
+        min_size=1,
+        max_size=5,
+    ),
+    st.integers(0, 2**32),
+)
+def test_batch_embeds_fit_and_keep_the_totals(entries, seed):
+    # Advantage needs a plain 1d20 to work on.
+    text = ", ".join(
+        f"{times}x 1d20+{expression}{advantage}" if advantage else f"{times}x {expression}"
+        for times, expression, advantage in entries
+    )
+    try:
+        batch = dice.parse_batch(text)
+    except dice.DiceError:
+        assume(False)
+    dice._rng.seed(seed)
+    results = _roll_batch(batch)
+    fields = _check_limits(_build_batch_embed(USER, text, results))
+
+    # Every roll starts a field of its own with its total.
+    totals = [value.partition(" - ")[0] for name, value in fields if not name.endswith("(cont.)")]
+    assert totals == [f"**{result.total}**" for _, _, result in results]
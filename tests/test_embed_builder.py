@@ -0,0 +1,87 @@
+import re
+from types import SimpleNamespace
+
+from hypothesis import given
+from hypothesis import strategies as st
+
+from embed_builder import (
+    DESCRIPTION_LIMIT,
+    FIELD_COUNT_LIMIT,
+    FIELD_NAME_LIMIT,
+    FIELD_VALUE_LIMIT,
+    TITLE_LIMIT,
+    TOTAL_LIMIT,
+    EmbedBuilder,
+    _split,
+)
+
+# Text with plenty of the characters the builder splits on, and long runs of them.
+texts = st.lists(
+    st.sampled_from(["a", "1", " ", ",", "\n", ", ", " " * 100, "\n" * 100, "a" * 100]),
+    max_size=100,
+).map("".join) | st.text(max_size=300)
+
+# A line of text, or a field as (name, value, inline).
+items = st.one_of(
+    st.tuples(texts),
+    st.tuples(st.text(max_size=300), texts, st.booleans()),
+)
+
+
+def _without_whitespace(text: str) -> str:
+    return re.sub(r"\s", "", text)
+
+
+def _builder(title: str, author: str | None, footer: str | None, added: list[tuple]):
+    member = author and SimpleNamespace(display_name=author, display_avatar="https://a.b/c.png")
+    builder = EmbedBuilder(title=title, color=0, author=member, footer=footer)
+    for item in added:
+        if len(item) == 1:
+            builder.add_line(*item)
+        else:
+            builder.add_field(*item)
+    return builder
+
+
+@given(
+    st.text(max_size=400),
+    st.none() | st.text(min_size=1, max_size=400),
+    st.none() | st.text(min_size=1, max_size=2500),
+    st.lists(items, max_size=30),
+)
+def test_pages_stay_within_the_limits(title, author, footer, added):
+    builder = _builder(title, author, footer, added)
+    embeds = builder.build()
+
+    for index, embed in enumerate(embeds):
+        assert len(embed) <= TOTAL_LIMIT
+        assert len(embed) == builder.pages[index].length
+        assert len(embed.title) <= TITLE_LIMIT
+        assert len(embed.description or "") <= DESCRIPTION_LIMIT
+        assert len(embed.fields) <= FIELD_COUNT_LIMIT
+        for field in embed.fields:
+            assert 0 < len(field.name) <= FIELD_NAME_LIMIT
+            assert 0 < len(field.value) <= FIELD_VALUE_LIMIT
+        if index > 0:
+            assert embed.title.endswith(" (continued)")
+
+
+@given(st.lists(texts, max_size=20))
+def test_lines_are_kept_in_order(lines):
+    builder = _builder("Title", None, None, [(line,) for line in lines])
+
+    assert "".join(page.description for page in builder.pages) == "".join(
+        line + "\n" for line in lines
+    )
+    # Pages are only started when the one before is full.
+    for page in builder.pages[:-1]:
+        assert page.description
+
+
+@given(texts, st.integers(min_value=2, max_value=FIELD_VALUE_LIMIT))
+def test_split_keeps_everything_but_whitespace(text, limit):
+    chunks = _split(text, limit)
+
+    assert all(0 < len(chunk) <= limit for chunk in chunks)
+    if _without_whitespace(text):
+        assert "".join(map(_without_whitespace, chunks)) == _without_whitespace(text)
@@ -0,0 +1,75 @@
+import asyncio
+import sqlite3
+
+import db_handler as db
+from helpers import GuildConfig, QuestInfo, QuestRegistry
+
+
+async def test_concurrent_increments_dont_lose_updates(database):
+    players = list(range(100, 120))
+    # Overlapping groups, like several DMs running /update_quest_count at once.
+    await asyncio.gather(
+        *(database.increment_players(1, players[i % 5 :]) for i in range(50))
+    )
+
+    counts = await database.get_players(1, players)
+    expected = {player: sum(1 for i in range(50) if player in players[i % 5 :]) for player in players}
+    assert counts == expected
+
+
+async def test_concurrent_increments_return_their_own_counts(database):
+    results = await asyncio.gather(*(database.increment_players(1, [100]) for _ in range(30)))
+    # Every increment sees a different count, so none of them overwrote another.
+    assert sorted(result[100] for result in results) == list(range(1, 31))
+
+
+async def test_concurrent_joins_and_increments(database):
+    await database.create_quest(
+        10, QuestInfo(1, "Quest", "Contractor", "Description", "Reward", "#ffffff", 20, 30, 40)
+    )
+    players = list(range(100, 140))
+    # Players joining the quest while the quest counts are being updated.
+    await asyncio.gather(
+        *(database.add_quest_player(10, player) for player in players),
+        *(database.increment_players(1, players) for _ in range(10)),
+    )
+
+    quest = await database.get_quest(10)
+    assert sorted(quest.player_ids) == players
+    assert await database.get_players(1, players) == dict.fromkeys(players, 10)
+
+
+async def test_failed_reads_and_writes_return_none(database):
+    await database._execute_query("DROP TABLE players")
+
+    assert await database.increment_players(1, [100]) is None
+    assert await database.get_players(1, [100]) is None
+
+
+async def test_old_player_lists_are_moved_to_quest_players(tmp_path, monkeypatch):
+    # A database from before the schema upgrades, with players as a json list.
+    db_file = str(tmp_path / "db.sqlite")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute(
+            """
+            CREATE TABLE quests (
+                id INTEGER PRIMARY KEY, guild_id, quest_title, contractor, description,
+                reward, embed_colour, thread_id, quest_role_id, pin_message_id, players
+            );
+            """
+        )
+        conn.execute(
+            "INSERT INTO quests VALUES (10, 1, 'Quest', '', '', '', '#ffffff', 20, 30, 40, ?)",
+            ("[101, 100, 101]",),
+        )
+    monkeypatch.setattr(db, "db_file", db_file)
+    monkeypatch.setattr(db, "quest_registry", QuestRegistry())
+    monkeypatch.setattr(db, "guild_config", GuildConfig())
+    monkeypatch.setattr(db, "_write_lock", asyncio.Lock())
+    await db.open_pool()
+    try:
+        quest = await db.get_quest(10)
+    finally:
+        await db.close_pool()
+
+    assert quest.player_ids == [101, 100]
@@ -0,0 +1,130 @@
+import asyncio
+
+from cogs.quest_handler import (
+    PersistentQuestJoinView,
+    RosterEditCoalescer,
+    _get_all_quests_played,
+)
+from conftest import Fake
+from helpers import QuestInfo
+
+
+def _fake_thread(player_ids: list[int]) -> Fake:
+    player_role = Fake(id=1, name="Player")
+    members = {
+        player_id: Fake(id=player_id, roles=[player_role], display_name=f"Player {player_id}")
+        for player_id in player_ids
+    }
+    guild = Fake(
+        id=1, roles=[player_role], get_role=lambda role_id: player_role, get_member=members.get
+    )
+    return Fake(guild=guild)
+
+
+def _quest(player_ids: list[int]) -> QuestInfo:
+    quest = QuestInfo(1, "Quest", "Contractor", "Description", "Reward", "#ffffff", 20, 30, 40)
+    for player_id in player_ids:
+        quest.add_player(player_id)
+    return quest
+
+
+async def test_quests_played_increments(database):
+    embed = await _get_all_quests_played(_fake_thread([100, 101]), _quest([100, 101]), True)
+
+    assert embed.description.splitlines() == ["Player 100: 1", "Player 101: 1"]
+
+
+async def test_quests_played_when_the_db_fails(database):
+    await database._execute_query("DROP TABLE players")
+
+    embed = await _get_all_quests_played(_fake_thread([100, 101]), _quest([100, 101]), True)
+
+    assert "try again" in embed.description
+
+
+class FakeRosterChannel:
+    # A quest thread that records every edit of its messages.
+    def __init__(self, guild: Fake) -> None:
+        self.guild = guild
+        self.edits: list = []
+
+    def get_partial_message(self, message_id: int) -> Fake:
+        async def edit(embed) -> None:
+            self.edits.append((message_id, embed))
+
+        return Fake(edit=edit)
+
+
+async def test_roster_burst_is_a_single_edit(database):
+    player_ids = list(range(100, 115))
+    channel = FakeRosterChannel(_fake_thread(player_ids).guild)
+    coalescer = RosterEditCoalescer(delay=0.05)
+    quest = _quest([])
+
+    # 15 players joining right after each other.
+    for player_id in player_ids:
+        quest.add_player(player_id)
+        coalescer.schedule(10, channel, quest)
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0.1)
+
+    assert len(channel.edits) == 1
+    message_id, embed = channel.edits[0]
+    assert message_id == quest.pin_message_id
+    # The one edit has everyone who joined.
+    assert len(embed.description.splitlines()) == 15
+
+    # Changes after the edit get an edit of their own.
+    quest.remove_player(100)
+    coalescer.schedule(10, channel, quest)
+    await asyncio.sleep(0.1)
+    assert len(channel.edits) == 2
+    assert len(channel.edits[1][1].description.splitlines()) == 14
+
+
+def _fake_join_interaction(quest: QuestInfo, sent: list) -> Fake:
+    quest_role = Fake(id=quest.quest_role_id, name="Quest")
+    user = Fake(id=100, roles=[])
+
+    async def add_roles(role) -> None:
+        user.roles.append(role)
+
+    async def remove_roles(role) -> None:
+        user.roles.remove(role)
+
+    async def thread_user(member) -> None:
+        pass
+
+    async def defer() -> None:
+        pass
+
+    async def send(content, ephemeral=False) -> None:
+        sent.append(content)
+
+    user.add_roles = add_roles
+    user.remove_roles = remove_roles
+    thread = Fake(add_user=thread_user, remove_user=thread_user)
+    guild = Fake(
+        id=quest.guild_id,
+        roles=[quest_role],
+        get_role=lambda role_id: quest_role,
+        get_thread=lambda thread_id: thread,
+    )
+    return Fake(guild=guild, user=user, response=Fake(defer=defer), followup=Fake(send=send))
+
+
+async def test_failed_join_changes_nothing(database):
+    await database.load_quest_registry()
+    await database.create_quest(10, _quest([]))
+    quest = await database.get_quest(10)
+    view = PersistentQuestJoinView(quest, 10)
+    await database._execute_query("DROP TABLE quest_players")
+
+    sent = []
+    interaction = _fake_join_interaction(quest, sent)
+    await PersistentQuestJoinView.quest_join(view, interaction, None)
+
+    assert sent == ["Something went wrong joining the quest, please try again."]
+    # The quest role was given and taken away again.
+    assert interaction.user.roles == []
+    assert quest.player_ids == []
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from helpers import QuestInfo, QuestRegistry
+
+
+def _quest(player_ids: list[int] = ()) -> QuestInfo:
+    quest = QuestInfo(1, "Quest", "Contractor", "Description", "Reward", "#ffffff", 20, 30, 40)
+    for player_id in player_ids:
+        quest.add_player(player_id)
+    return quest
+
+
+def test_registry_players(capsys):
+    registry = QuestRegistry()
+    registry.add(10, _quest([100]))
+
+    registry.add_player(10, 101)
+    registry.add_player(10, 101)
+    registry.remove_player(10, 100)
+    # Removing someone who isn't in the quest (or a quest that doesn't exist) does nothing.
+    registry.remove_player(10, 100)
+    registry.add_player(11, 100)
+
+    assert registry.get(10).player_ids == [101]
+    assert capsys.readouterr().out == ""
+
+
+async def test_load_quest_registry(database):
+    await database.create_quest(10, _quest())
+    await database.add_quest_player(10, 100)
+
+    await database.load_quest_registry()
+
+    assert database.quest_registry.loaded
+    assert database.quest_registry.get(10).player_ids == [100]
+
+
+async def test_failed_load_leaves_the_registry_unloaded(database):
+    await database.create_quest(10, _quest())
+    await database.load_quest_registry()
+    await database._execute_query("DROP TABLE quest_players")
+
+    with pytest.raises(sqlite3.Error):
+        await database.load_quest_registry(retry_delay=0)
+
+    assert not database.quest_registry.loaded
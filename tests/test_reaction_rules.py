@@ -0,0 +1,83 @@
+from re import _parser as sre_parser
+
+import pytest
+
+import helpers
+from cogs.reaction_handler import _usable_emoji
+from helpers import MAX_MESSAGE_LENGTH, MAX_REGEX_BACKTRACKING, _backtracking, check_regex
+
+
+@pytest.mark.parametrize(
+    "pattern", [r"\bhej\b", r"colou?r", r"(?i)fred|nat ?1", r"\d{1,3} gp", r"^hello.*"]
+)
+def test_safe_regexes_are_allowed(pattern):
+    check_regex(pattern)
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [r"(a+)+b", r"(a|aa)*b", r".*.*b", r"\w+\s\w+", r"(\w)\1", "a?" * 13 + "b", "a" * 101, "("],
+)
+def test_unsafe_regexes_are_refused(pattern):
+    with pytest.raises(ValueError):
+        check_regex(pattern)
+
+
+@pytest.mark.parametrize(
+    "pattern", [r"\bhej\b", r"colou?r", r"fred|nat 1", r"\d+ gp", r"^hello.*", r"[(*+]\*\(x"]
+)
+def test_simple_regexes_are_allowed_without_the_re_parser(pattern, monkeypatch):
+    monkeypatch.setattr(helpers, "sre_parser", None)
+    check_regex(pattern)
+
+
+@pytest.mark.parametrize(
+    "pattern", [r"(?i)fred", r"(a+)b", r".*.*b", r"\w+\s\w+", r"a?b?", "("]
+)
+def test_other_regexes_are_refused_without_the_re_parser(pattern, monkeypatch):
+    monkeypatch.setattr(helpers, "sre_parser", None)
+    with pytest.raises(ValueError):
+        check_regex(pattern)
+
+
+@pytest.mark.parametrize("pattern", [r".*b", r"a{0,50}a{0,50}b", r"(?:x|a*)b"])
+def test_the_most_backtracking_allowed(pattern):
+    # The benchmarks time these on the longest message.
+    check_regex(pattern)
+    ways = _backtracking(sre_parser.parse(pattern), False)
+    assert MAX_MESSAGE_LENGTH / 2 < ways <= MAX_REGEX_BACKTRACKING
+
+
+class FakeBot:
+    def get_emoji(self, emoji_id: int) -> object | None:
+        return object() if emoji_id == 1234567890123 else None
+
+
+@pytest.mark.parametrize("emoji", ["👀", "👍🏽", "🇸🇪", "1️⃣", "👨‍👩‍👧", "❤️", "<:fred:1234567890123>"])
+def test_usable_emoji(emoji):
+    assert _usable_emoji(FakeBot(), emoji)
+
+
+@pytest.mark.parametrize("emoji", ["", "eyes", ":eyes:", "1", "a👀", "<:fred:1234567890124>"])
+def test_unusable_emoji(emoji):
+    assert not _usable_emoji(FakeBot(), emoji)
+
+
+async def test_rules_for_every_guild_can_be_turned_off_per_guild(database):
+    whale = "🐋 and 🥛"
+    assert not await database.set_reaction_rule_disabled(1, 1, False)
+    assert await database.set_reaction_rule_disabled(1, 1, True)
+    # Turning it off twice is fine too.
+    assert await database.set_reaction_rule_disabled(1, 1, True)
+    rule = await database.create_reaction_rule(1, ["a"], None, "👀", 0)
+    # Only rules for every guild can be turned off.
+    assert not await database.set_reaction_rule_disabled(1, rule.id, True)
+
+    (whale_rule, _) = await database.get_reaction_rules()
+    assert whale_rule.disabled_guilds == {1}
+    assert not whale_rule.matches(1, whale)
+    assert whale_rule.matches(2, whale)
+
+    assert await database.set_reaction_rule_disabled(1, 1, False)
+    (whale_rule, _) = await database.get_reaction_rules()
+    assert whale_rule.matches(1, whale)
@@ -0,0 +1,41 @@
+import cogs.receipts_handler as receipts_handler
+from cogs.receipts_handler import ReceiptsHandler
+from conftest import Fake
+
+
+def _fake_bot() -> Fake:
+    guild = Fake(id=1, name="Guild")
+    channels = {1234: Fake(id=1234, guild=guild), 5678: Fake(id=5678)}
+
+    async def wait_until_ready() -> None:
+        pass
+
+    return Fake(wait_until_ready=wait_until_ready, get_channel=channels.get)
+
+
+async def test_env_channel_is_only_saved_for_its_own_guild(database, monkeypatch):
+    monkeypatch.setattr(receipts_handler, "BOARD_RECEIPTS_CHANNEL_ID", "1234")
+    await ReceiptsHandler(_fake_bot())._migrate_env_channel()
+
+    assert database.guild_config.get(1, "receipts_channel") == "1234"
+    assert database.guild_config.get(2, "receipts_channel") is None
+
+
+async def test_env_channel_doesnt_replace_a_set_channel(database, monkeypatch):
+    monkeypatch.setattr(receipts_handler, "BOARD_RECEIPTS_CHANNEL_ID", "1234")
+    await database.set_guild_config(2, "receipts_channel", "42")
+    await ReceiptsHandler(_fake_bot())._migrate_env_channel()
+
+    assert database.guild_config.guilds_with("receipts_channel") == [2]
+
+
+async def test_unusable_env_channels_are_ignored(database, monkeypatch):
+    for value in ("", "5678", "9999", "#receipts"):
+        monkeypatch.setattr(receipts_handler, "BOARD_RECEIPTS_CHANNEL_ID", value)
+        cog = ReceiptsHandler(_fake_bot())
+        await cog.cog_load()
+        if cog._migrate_task is not None:
+            await cog._migrate_task
+        await cog.cog_unload()
+
+    assert database.guild_config.guilds_with("receipts_channel") == []
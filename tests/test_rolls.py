@@ -0,0 +1,14 @@
+def _roll(total: int) -> tuple:
+    return (1, 100, 0, "1d20", total, b"", 0, 0, 0, 0.5)
+
+
+async def test_totals_too_big_for_sqlite_dont_lose_the_batch(database):
+    rolls = [_roll(5), _roll(10**20), _roll(-(10**400)), _roll(2**63 - 1)]
+    assert await database.add_rolls(rolls)
+
+    totals, expressions, _ = await database.get_roll_stats(1, 100)
+    assert totals[0] == 4
+    (expression, count, _, low, high) = expressions[0]
+    assert (expression, count) == ("1d20", 4)
+    assert low == float("-inf")
+    assert high == 1e20
@@ -0,0 +1,116 @@
+import asyncio
+
+import discord
+
+from cogs.sticky_handler import StickyHandler
+from conftest import Fake
+from embed_builder import DESCRIPTION_LIMIT
+
+
+def _fake_interaction() -> Fake:
+    sent = []
+
+    async def send_message(content, ephemeral=False) -> None:
+        sent.append(content)
+
+    async def send(embed) -> None:
+        raise AssertionError("The sticky shouldn't be sent")
+
+    return Fake(
+        channel=Fake(id=50, name="Channel", send=send),
+        guild_id=1,
+        response=Fake(send_message=send_message),
+        sent=sent,
+    )
+
+
+async def test_sticky_templates_have_to_fit_an_embed(database):
+    cog = StickyHandler(None, {}, {})
+    for template in ("a" * DESCRIPTION_LIMIT + "\\n", " \\n ", ""):
+        interaction = _fake_interaction()
+        await StickyHandler.new_char_sticky.callback(cog, interaction, template)
+        assert interaction.sent == [f"Templates need to be 1 to {DESCRIPTION_LIMIT} characters long"]
+    assert cog.sticky_templates == {}
+
+
+class FakeStickyChannel(discord.TextChannel):
+    # A text channel that records the stickies sent and deleted in it, where
+    # every api call takes a moment like the real ones.
+    def __init__(self, channel_id: int) -> None:
+        self.id = channel_id
+        self.guild = Fake(id=1)
+        self.sent: list[int] = []
+        self.deleted: list[int] = []
+
+    async def send(self, embed) -> Fake:
+        await asyncio.sleep(0.01)
+        self.sent.append(1000 + len(self.sent))
+        return Fake(id=self.sent[-1])
+
+    def get_partial_message(self, message_id: int) -> Fake:
+        async def delete() -> None:
+            await asyncio.sleep(0.01)
+            self.deleted.append(message_id)
+
+        return Fake(delete=delete)
+
+
+async def test_message_burst_is_a_single_repost():
+    channel = FakeStickyChannel(50)
+    cog = StickyHandler(None, {50: "Template"}, {50: 1})
+    cog.reposter.quiet_window = 0.05
+
+    async def message(delay: float) -> None:
+        await asyncio.sleep(delay)
+        await cog.handle_message(Fake(channel=channel))
+
+    # Spread over a bit less than the quiet window, so every message pushes it back.
+    await asyncio.gather(*(message(i * 0.0004) for i in range(100)))
+    await asyncio.sleep(0.2)
+    assert channel.sent == [1000]
+    assert channel.deleted == [1]
+    assert cog.sticky_messages[50] == 1000
+    assert cog._dirty == {50}
+
+    # Messages after the repost get one of their own, which replaces the new sticky.
+    await asyncio.gather(*(message(0) for _ in range(100)))
+    await asyncio.sleep(0.2)
+    assert channel.sent == [1000, 1001]
+    assert channel.deleted == [1, 1000]
+    assert cog.sticky_messages[50] == 1001
+
+
+def _fake_channel(channel_id: int, last_message_id: int | None = None, error=None) -> Fake:
+    async def history(limit):
+        if error is not None:
+            raise error
+        yield Fake(id=last_message_id)
+
+    return Fake(id=channel_id, history=history)
+
+
+async def test_reconcile_carries_on_past_failing_channels(capsys):
+    channels = {
+        1: _fake_channel(1, last_message_id=10),
+        2: _fake_channel(2, error=RuntimeError("Broken channel")),
+        3: _fake_channel(3, last_message_id=99),
+        4: _fake_channel(4, error=discord.HTTPException(Fake(status=500, reason="Error"), "")),
+    }
+
+    async def wait_until_ready() -> None:
+        pass
+
+    bot = Fake(wait_until_ready=wait_until_ready, get_channel=channels.get)
+    cog = StickyHandler(bot, dict.fromkeys(channels), {1: 10, 2: 20, 3: 30, 4: 40})
+    reposted = []
+
+    async def repost(channel) -> None:
+        reposted.append(channel.id)
+
+    cog._repost_sticky = repost
+    await cog.reconcile_stickies()
+
+    assert reposted == [3]
+    summary = capsys.readouterr().out.splitlines()[-1]
+    assert summary.startswith("Checked 4 stickies")
+    assert summary.endswith("reposted 1, couldn't check 2: [2, 4]")